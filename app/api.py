@@ -0,0 +1,189 @@
+import gzip
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request, session
+
+import db_utils as db
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+def _database():
+    return current_app.config['DATABASE']
+
+
+def error(message, status):
+    return jsonify({'status': 'error', 'error': message}), status
+
+
+def api_login_required(f):
+    """Like login_required, but answers 401 instead of redirecting"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return error('Authentication required', 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _limit(default):
+    limit = request.args.get('limit', default, type=int)
+    return min(max(limit, 1), current_app.config['API_MAX_LIMIT'])
+
+
+def _ids_arg():
+    """Parse ?ids=1,2,3; raises ValueError on junk or too many ids"""
+    raw = request.args.get('ids', '')
+    try:
+        ids = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers") from None
+    if not ids:
+        raise ValueError("ids is required")
+    if len(ids) > current_app.config['API_BATCH_MAX_IDS']:
+        raise ValueError(f"At most {current_app.config['API_BATCH_MAX_IDS']} ids per request")
+    return ids
+
+
+def select_fields(items):
+    """Apply ?fields=a,b,c to a dict or a list of dicts"""
+    fields = request.args.get('fields')
+    if not fields:
+        return items
+    wanted = {field.strip() for field in fields.split(',')}
+    if isinstance(items, dict):
+        return {key: value for key, value in items.items() if key in wanted}
+    return [{key: value for key, value in item.items() if key in wanted} for item in items]
+
+
+def _with_pending(posts):
+    queue = current_app.extensions.get('write_behind')
+    if queue:
+        queue.overlay_posts(posts, session.get('user_id'))
+    return posts
+
+
+# ==================== POSTS ====================
+
+@api.route('/feed')
+def feed():
+    """Home timeline (or ?feed=all) with the same cursors as the HTML feed"""
+    user_id = session.get('user_id')
+    feed_type = 'home' if user_id and request.args.get('feed') != 'all' else 'all'
+    get_page = db.get_timeline_page if feed_type == 'home' else db.get_feed_page
+    try:
+        page = get_page(
+            _database(), user_id,
+            limit=_limit(current_app.config['POSTS_PER_PAGE']),
+            before=request.args.get('before'),
+            after=request.args.get('after')
+        )
+    except ValueError:
+        return error('Invalid cursor', 400)
+    
+    return jsonify({
+        'status': 'success',
+        'feed': feed_type,
+        'posts': select_fields(_with_pending(page['posts'])),
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+    })
+
+
+@api.route('/posts')
+def posts_batch():
+    """Many posts by id: /posts?ids=1,2,3"""
+    try:
+        post_ids = _ids_arg()
+    except ValueError as e:
+        return error(str(e), 400)
+    posts = db.get_posts_by_ids(_database(), post_ids, session.get('user_id'))
+    return jsonify({'status': 'success', 'posts': select_fields(_with_pending(posts))})
+
+
+@api.route('/posts/<int:post_id>')
+def post(post_id):
+    posts = db.get_posts_by_ids(_database(), [post_id], session.get('user_id'))
+    if not posts:
+        return error('Post not found', 404)
+    return jsonify({'status': 'success', 'post': select_fields(_with_pending(posts)[0])})
+
+
+@api.route('/posts/<int:post_id>/comments')
+def post_comments(post_id):
+    if not db.get_posts_by_ids(_database(), [post_id], session.get('user_id')):
+        return error('Post not found', 404)
+    comments = db.get_post_comments(_database(), post_id)
+    queue = current_app.extensions.get('write_behind')
+    if queue:
+        queue.overlay_comments(comments)
+    return jsonify({'status': 'success', 'comments': select_fields(comments)})
+
+
+# ==================== USERS ====================
+
+@api.route('/users')
+def users_batch():
+    """Many public profiles by id: /users?ids=1,2,3"""
+    try:
+        user_ids = _ids_arg()
+    except ValueError as e:
+        return error(str(e), 400)
+    users = db.get_users_by_ids(_database(), user_ids)
+    return jsonify({'status': 'success', 'users': select_fields(users)})
+
+
+@api.route('/users/<int:user_id>')
+def user(user_id):
+    users = db.get_users_by_ids(_database(), [user_id])
+    if not users:
+        return error('User not found', 404)
+    profile = dict(users[0], stats=db.get_user_stats(_database(), user_id))
+    return jsonify({'status': 'success', 'user': select_fields(profile)})
+
+
+# ==================== NOTIFICATIONS & MESSAGES ====================
+
+@api.route('/notifications')
+@api_login_required
+def notifications():
+    notifications = db.get_user_notifications(
+        _database(), session['user_id'], limit=_limit(50),
+        unread_only=request.args.get('unread') in ('1', 'true')
+    )
+    return jsonify({'status': 'success', 'notifications': select_fields(notifications)})
+
+
+@api.route('/conversations')
+@api_login_required
+def conversations():
+    conversations = db.get_user_conversations(_database(), session['user_id'])
+    return jsonify({'status': 'success', 'conversations': select_fields(conversations)})
+
+
+@api.route('/conversations/<int:user_id>/messages')
+@api_login_required
+def conversation_messages(user_id):
+    messages = db.get_conversation(
+        _database(), session['user_id'], user_id,
+        limit=_limit(current_app.config['MESSAGES_PER_PAGE'])
+    )
+    return jsonify({'status': 'success', 'messages': select_fields(messages)})
+
+
+# ==================== COMPRESSION ====================
+
+@api.after_request
+def compress_response(response):
+    """gzip JSON bodies above API_COMPRESS_MIN_BYTES for clients that accept it"""
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.status_code < 200
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.accept_encodings):
+        return response
+    body = response.get_data()
+    if len(body) < current_app.config['API_COMPRESS_MIN_BYTES']:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=current_app.config['API_COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
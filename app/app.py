@@ -1,10 +1,22 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from werkzeug.utils import secure_filename
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, g
 from werkzeug.security import check_password_hash
 import os
+import threading
+import time
 from functools import wraps
 from config import config, Config
 import db_utils as db
+import db_pool
+import event_bus
+import friend_graph
+import media
+import metrics
+import page_cache
+import password_hasher
+import static_files
+import user_cache
+import write_behind
+from api import api as api_v1
 
 app = Flask(__name__)
 
@@ -12,6 +24,16 @@ app = Flask(__name__)
 env = os.environ.get('FLASK_ENV', 'development')
 app.config.from_object(config[env])
 Config.init_app(app)
+db_pool.init_app(app)
+metrics.init_app(app)
+user_cache.init_app(app)
+friend_graph.init_app(app)
+media.init_app(app)
+password_hasher.init_app(app)
+static_files.init_app(app)
+page_cache.init_app(app)
+app.register_blueprint(api_v1)
+event_bus.init_app(app)
 
 DATABASE = app.config['DATABASE']
 
@@ -32,27 +54,139 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+# ==================== WRITE-BEHIND TOGGLES ====================
+
+write_queue = None
+if app.config['WRITE_BEHIND_ENABLED']:
+    write_queue = write_behind.WriteBehindQueue(
+        DATABASE,
+        flush_interval=app.config['WRITE_BEHIND_FLUSH_INTERVAL'],
+        max_pending=app.config['WRITE_BEHIND_MAX_PENDING']
+    )
+    app.extensions['write_behind'] = write_queue
+
+_SYNC_TOGGLES = {
+    'post_like': lambda target_id, user_id: db.toggle_like_post(DATABASE, target_id, user_id),
+    'comment_like': lambda target_id, user_id: db.toggle_like_comment(DATABASE, target_id, user_id),
+    'post_save': lambda target_id, user_id: db.toggle_save_post(DATABASE, user_id, target_id),
+}
+
+def toggle(kind, target_id):
+    """Toggle a like/save for the current user, queued when write-behind is on"""
+    if write_queue:
+        return write_queue.toggle(kind, target_id, session['user_id'])
+    return _SYNC_TOGGLES[kind](target_id, session['user_id'])
+
+def with_pending(posts):
+    """Show this worker's queued likes/saves on a list of posts"""
+    if write_queue:
+        write_queue.overlay_posts(posts, session.get('user_id'))
+    return posts
+
+def with_pending_comments(comments):
+    """Show this worker's queued comment likes"""
+    if write_queue:
+        write_queue.overlay_comments(comments)
+    return comments
+
+# ==================== TRENDING REFRESH ====================
+
+def refresh_trending_loop(interval):
+    """Keep the trending ranking at most interval seconds old, off the request path"""
+    while True:
+        try:
+            db.refresh_trending_if_stale(DATABASE, interval)
+        except Exception:
+            app.logger.exception("Refreshing trending hashtags failed")
+        time.sleep(interval)
+
+# ==================== BACKGROUND THREADS ====================
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_threads():
+    """Start this worker's write-behind, trending and event threads once.
+
+    Runs before the first request rather than at import: processes that
+    only import this module start none of them. That includes media's
+    spawned variant workers, which re-run the launching script.
+    """
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    if write_queue:
+        write_queue.start()
+    if app.config['TRENDING_REFRESH_INTERVAL']:
+        threading.Thread(target=refresh_trending_loop, args=(app.config['TRENDING_REFRESH_INTERVAL'],),
+                         name='trending-refresh', daemon=True).start()
+    if event_bus.bus is not None:
+        event_bus.bus.start()
+
+app.before_request(start_background_threads)
+
 # ==================== CONTEXT PROCESSORS ====================
 
+_header_cache = {}
+_header_cache_lock = threading.Lock()
+HEADER_CACHE_MAX_USERS = 10000
+
+def get_header_state(user_id):
+    """Header user and unread badges, read once per request.
+
+    With HEADER_CACHE_TTL set, the state is also kept in process memory
+    for that many seconds so page navigation skips the database.
+    """
+    if 'header_state' in g:
+        return g.header_state
+    
+    ttl = app.config['HEADER_CACHE_TTL']
+    now = time.monotonic()
+    state = None
+    if ttl:
+        cached = _header_cache.get(user_id)
+        if cached and cached[0] > now:
+            state = cached[1]
+    
+    if state is None:
+        state = db.get_header_state(DATABASE, user_id)
+        if ttl:
+            with _header_cache_lock:
+                if len(_header_cache) >= HEADER_CACHE_MAX_USERS:
+                    for key in [k for k, (expires, _) in _header_cache.items() if expires <= now]:
+                        del _header_cache[key]
+                    if len(_header_cache) >= HEADER_CACHE_MAX_USERS:
+                        _header_cache.clear()
+                _header_cache[user_id] = (now + ttl, state)
+    
+    g.header_state = state
+    return state
+
+def invalidate_header_state(user_id):
+    """Drop cached header state after the user's own badges or profile changed"""
+    _header_cache.pop(user_id, None)
+    g.pop('header_state', None)
+
 @app.context_processor
 def inject_user():
     """Inject current user and unread counts into all templates"""
     if 'user_id' in session:
-        user = db.get_user_by_id(DATABASE, session['user_id'])
-        unread_notifications = db.get_unread_count(DATABASE, session['user_id'])
-        unread_messages = sum(
-            conv['unread_count'] 
-            for conv in db.get_user_conversations(DATABASE, session['user_id'])
-        )
-        return dict(
-            current_user=user,
-            unread_notifications=unread_notifications,
-            unread_messages=unread_messages
-        )
+        return get_header_state(session['user_id'])
     return dict(current_user=None, unread_notifications=0, unread_messages=0)
 
 # ==================== AUTHENTICATION ROUTES ====================
 
+def hasher_busy(template):
+    """Fast 503 for a login/registration turned away by the hashing pool"""
+    flash('Too many people are signing in right now. Please try again in a moment.', 'warning')
+    response = app.make_response((render_template(template), 503))
+    response.headers['Retry-After'] = str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+    return response
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     """User registration"""
@@ -87,10 +221,13 @@ def register():
             return redirect(url_for('register'))
         
         # Create user
-        user_id = db.create_user(
-            DATABASE, username, email, password, major, interests, 
-            bio, study_level, campus, student_number
-        )
+        try:
+            user_id = db.create_user(
+                DATABASE, username, email, password, major, interests, 
+                bio, study_level, campus, student_number
+            )
+        except password_hasher.HasherBusy:
+            return hasher_busy('register.html')
         
         if user_id:
             session['user_id'] = user_id
@@ -109,7 +246,10 @@ def login():
         username = request.form.get('username', '').strip()
         password = request.form.get('password')
         
-        user = db.authenticate_user(DATABASE, username, password)
+        try:
+            user = db.authenticate_user(DATABASE, username, password)
+        except password_hasher.HasherBusy:
+            return hasher_busy('login.html')
         
         if user:
             session['user_id'] = user['id']
@@ -136,40 +276,85 @@ def logout():
 
 @app.route('/')
 def index():
-    """Home page with post feed"""
-    page = request.args.get('page', 1, type=int)
-    posts_per_page = app.config['POSTS_PER_PAGE']
-    offset = (page - 1) * posts_per_page
-    
+    """Home page with post feed (keyset pagination via ?before= / ?after= cursors)
+
+    Logged-in users see their home timeline (own and friends' posts);
+    ?feed=all or anonymous visitors get the global feed.
+    """
     user_id = session.get('user_id')
-    posts = db.get_all_posts(DATABASE, user_id, limit=posts_per_page, offset=offset)
+    feed_type = 'home' if user_id and request.args.get('feed') != 'all' else 'all'
+    get_page = db.get_timeline_page if feed_type == 'home' else db.get_feed_page
+    try:
+        feed = get_page(
+            DATABASE, user_id,
+            limit=app.config['POSTS_PER_PAGE'],
+            before=request.args.get('before'),
+            after=request.args.get('after')
+        )
+    except ValueError:
+        # Stale or tampered cursor, start again from the top
+        return redirect(url_for('index'))
     
-    trending_tags = db.get_trending_hashtags(DATABASE, limit=5)
+    page_cache.tag('feed')
+    page_cache.tag_posts(feed['posts'])
+    
+    window = request.args.get('trending')
+    if window not in app.config['TRENDING_WINDOWS']:
+        window = app.config['TRENDING_DEFAULT_WINDOW']
+    trending_tags = db.get_trending_hashtags(
+        DATABASE, limit=5, window=window,
+        max_age=app.config['TRENDING_REFRESH_INTERVAL'],
+        windows=app.config['TRENDING_WINDOWS']
+    )
     
-    return render_template('index.html', posts=posts, page=page, trending_tags=trending_tags)
+    return render_template(
+        'index.html',
+        posts=with_pending(feed['posts']),
+        next_cursor=feed['next_cursor'],
+        prev_cursor=feed['prev_cursor'],
+        feed_type=feed_type,
+        trending_tags=trending_tags
+    )
 
 @app.route('/search')
 def search():
-    """Search posts and users"""
+    """Search posts, comments and users (full-text, ranked, paginated)"""
     query = request.args.get('q', '').strip()
     search_type = request.args.get('type', 'all')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+    offset = (page - 1) * per_page
     
     results = {
         'users': [],
         'posts': [],
+        'comments': [],
         'hashtags': []
     }
     
     if query:
-        if search_type in ['all', 'users']:
-            results['users'] = db.search_users(DATABASE, query, limit=20)
-        
         if search_type in ['all', 'hashtags'] and query.startswith('#'):
             tag = query[1:]
-            results['posts'] = db.search_posts_by_hashtag(DATABASE, tag, limit=30)
+            results['posts'] = with_pending(db.search_posts_by_hashtag(DATABASE, tag, limit=30))
             results['hashtags'] = [{'tag': tag}]
+        else:
+            if search_type in ['all', 'users']:
+                results['users'] = db.search_users(DATABASE, query, limit=per_page, offset=offset)
+            
+            if search_type in ['all', 'posts']:
+                results['posts'] = with_pending(db.search_posts(
+                    DATABASE, query, session.get('user_id'), limit=per_page, offset=offset
+                ))
+            
+            if search_type in ['all', 'comments']:
+                results['comments'] = db.search_comments(DATABASE, query, limit=per_page, offset=offset)
+    
+    has_more = any(len(results[key]) == per_page for key in ('users', 'posts', 'comments'))
     
-    return render_template('search.html', query=query, results=results, search_type=search_type)
+    return render_template(
+        'search.html', query=query, results=results, search_type=search_type,
+        page=page, has_more=has_more
+    )
 
 # ==================== POST ROUTES ====================
 
@@ -191,15 +376,12 @@ def new_post():
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Add timestamp to filename to make it unique
-                import time
-                filename = f"{int(time.time())}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                image_url = filename
+                image_url = media.store_upload(file, app.config['UPLOAD_FOLDER'])
         
-        post_id = db.create_post(DATABASE, session['user_id'], content, post_type, visibility, image_url)
+        post_id = db.create_post(
+            DATABASE, session['user_id'], content, post_type, visibility, image_url,
+            fanout_limit=app.config['TIMELINE_FANOUT_LIMIT']
+        )
         flash('Post created successfully!', 'success')
         return redirect(url_for('view_post', post_id=post_id))
     
@@ -215,7 +397,10 @@ def view_post(post_id):
         flash('Post not found.', 'error')
         return redirect(url_for('index'))
     
-    comments = db.get_post_comments(DATABASE, post_id)
+    with_pending([post])
+    comments = with_pending_comments(db.get_post_comments(DATABASE, post_id))
+    page_cache.tag_posts([post])
+    page_cache.tag_comments(comments)
     
     return render_template('post.html', post=post, comments=comments)
 
@@ -261,7 +446,7 @@ def delete_post(post_id):
 @login_required
 def like_post(post_id):
     """Like/unlike a post"""
-    action = db.toggle_like_post(DATABASE, post_id, session['user_id'])
+    action = toggle('post_like', post_id)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'status': 'success', 'action': action})
@@ -273,7 +458,7 @@ def like_post(post_id):
 @login_required
 def save_post(post_id):
     """Save/unsave a post"""
-    action = db.toggle_save_post(DATABASE, session['user_id'], post_id)
+    action = toggle('post_save', post_id)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'status': 'success', 'action': action})
@@ -285,7 +470,7 @@ def save_post(post_id):
 @login_required
 def saved_posts():
     """View saved posts"""
-    posts = db.get_saved_posts(DATABASE, session['user_id'], limit=50)
+    posts = with_pending(db.get_saved_posts(DATABASE, session['user_id'], limit=50))
     return render_template('saved_posts.html', posts=posts)
 
 # ==================== COMMENT ROUTES ====================
@@ -309,7 +494,7 @@ def add_comment(post_id):
 @login_required
 def like_comment(comment_id):
     """Like/unlike a comment"""
-    action = db.toggle_like_comment(DATABASE, comment_id, session['user_id'])
+    action = toggle('comment_like', comment_id)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'status': 'success', 'action': action})
@@ -324,7 +509,7 @@ def like_comment(comment_id):
 def profile():
     """View own profile"""
     user = db.get_user_by_id(DATABASE, session['user_id'])
-    posts = db.get_user_posts(DATABASE, session['user_id'], limit=50)
+    posts = with_pending(db.get_user_posts(DATABASE, session['user_id'], limit=50))
     stats = db.get_user_stats(DATABASE, session['user_id'])
     
     return render_template('profile.html', user=user, posts=posts, stats=stats, is_own_profile=True)
@@ -348,14 +533,10 @@ def edit_profile():
         if 'profile_picture' in request.files:
             file = request.files['profile_picture']
             if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                import time
-                filename = f"profile_{session['user_id']}_{int(time.time())}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                updates['profile_picture'] = filename
+                updates['profile_picture'] = media.store_upload(file, app.config['UPLOAD_FOLDER'])
         
         if db.update_user_profile(DATABASE, session['user_id'], **updates):
+            invalidate_header_state(session['user_id'])
             flash('Profile updated successfully!', 'success')
         else:
             flash('Failed to update profile.', 'error')
@@ -374,8 +555,10 @@ def view_user(user_id):
         flash('User not found.', 'error')
         return redirect(url_for('index'))
     
-    posts = db.get_user_posts(DATABASE, user_id, limit=50)
+    posts = with_pending(db.get_user_posts(DATABASE, user_id, limit=50))
     stats = db.get_user_stats(DATABASE, user_id)
+    page_cache.tag(f"user:{user_id}")
+    page_cache.tag_posts(posts)
     
     # Check friendship status
     is_friend = False
@@ -437,7 +620,12 @@ def users():
     users_list = conn.execute(query, params).fetchall()
     conn.close()
     
-    return render_template('users.html', users=[dict(u) for u in users_list], sort_by=sort_by)
+    suggestions = []
+    if 'user_id' in session:
+        suggestions = db.get_friend_suggestions(DATABASE, session['user_id'], limit=5)
+    
+    return render_template('users.html', users=[dict(u) for u in users_list], sort_by=sort_by,
+                           suggestions=suggestions)
 
 # ==================== FRIEND ROUTES ====================
 
@@ -448,6 +636,14 @@ def friends():
     friends_list = db.get_user_friends(DATABASE, session['user_id'])
     return render_template('friends.html', friends=friends_list)
 
+@app.route('/friends/suggestions')
+@login_required
+def friend_suggestions():
+    """People you may know, as JSON"""
+    limit = min(request.args.get('limit', 10, type=int), app.config['SUGGESTIONS_PER_USER'])
+    suggestions = db.get_friend_suggestions(DATABASE, session['user_id'], limit=max(limit, 1))
+    return jsonify({'status': 'success', 'suggestions': suggestions})
+
 @app.route('/friends/requests')
 @login_required
 def friend_requests():
@@ -485,7 +681,9 @@ def respond_friend_request(friendship_id, action):
         flash('Invalid action.', 'error')
         return redirect(url_for('friend_requests'))
     
-    db.respond_to_friend_request(DATABASE, friendship_id, action)
+    db.respond_to_friend_request(
+        DATABASE, friendship_id, action, backfill=app.config['TIMELINE_BACKFILL']
+    )
     flash(f'Friend request {action}!', 'success')
     return redirect(url_for('friend_requests'))
 
@@ -520,6 +718,7 @@ def conversation(user_id):
     
     # Mark messages as read
     db.mark_messages_read(DATABASE, session['user_id'], user_id)
+    invalidate_header_state(session['user_id'])
     
     return render_template('conversation.html', other_user=other_user, messages=conversation_messages)
 
@@ -562,6 +761,7 @@ def notifications():
 def mark_notification_read(notification_id):
     """Mark a notification as read"""
     db.mark_notification_read(DATABASE, notification_id)
+    invalidate_header_state(session['user_id'])
     return redirect(url_for('notifications'))
 
 @app.route('/notifications/mark-all-read', methods=['POST'])
@@ -569,6 +769,7 @@ def mark_notification_read(notification_id):
 def mark_all_notifications_read():
     """Mark all notifications as read"""
     db.mark_all_notifications_read(DATABASE, session['user_id'])
+    invalidate_header_state(session['user_id'])
     flash('All notifications marked as read.', 'success')
     return redirect(url_for('notifications'))
 
@@ -577,9 +778,42 @@ def mark_all_notifications_read():
 @app.route('/hashtag/<tag>')
 def hashtag(tag):
     """View posts with a specific hashtag"""
-    posts = db.search_posts_by_hashtag(DATABASE, tag, limit=50)
+    posts = with_pending(db.search_posts_by_hashtag(DATABASE, tag, limit=50))
+    page_cache.tag(f"hashtag:{tag.lower()}")
+    page_cache.tag_posts(posts)
     return render_template('hashtag.html', tag=tag, posts=posts)
 
+# ==================== LIVE UPDATES ====================
+
+@app.route('/events')
+@login_required
+def events():
+    """Server-Sent Events stream of the user's new notifications and messages"""
+    if event_bus.bus is None:
+        return jsonify({'status': 'error', 'error': 'Live updates are disabled'}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    stream = event_bus.stream(
+        session['user_id'], last_event_id,
+        heartbeat_interval=app.config['EVENTS_HEARTBEAT_INTERVAL'],
+        max_seconds=app.config['EVENTS_MAX_STREAM_SECONDS'],
+        retry_ms=app.config['EVENTS_RETRY_MS']
+    )
+    if stream is None:
+        response = jsonify({'status': 'error', 'error': 'Too many live connections'})
+        response.headers['Retry-After'] = str(app.config['EVENTS_RETRY_MS'] // 1000)
+        return response, 503
+    
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # don't let nginx buffer the stream
+    })
+
 # ==================== ERROR HANDLERS ====================
 
 @app.errorhandler(404)
@@ -0,0 +1,75 @@
+import time
+
+# Rows kept in a change log; followers further behind than this start over
+RETENTION = 10000
+# Old rows are deleted on every PRUNE_EVERY-th append
+PRUNE_EVERY = 1000
+
+
+class ChangeLog:
+    """Append-only table through which workers share their writes.
+
+    The table has an AUTOINCREMENT seq plus the given columns. A writer
+    appends inside its transaction so the row commits with the change;
+    every worker keeps a Follower that polls for rows after the last seq
+    it has seen.
+    """
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = tuple(columns)
+        self._insert = (f"INSERT INTO {table} ({', '.join(self.columns)}) "
+                        f"VALUES ({', '.join('?' for _ in self.columns)})")
+        self._select = (f"SELECT {', '.join(self.columns)} FROM {table} "
+                        f"WHERE seq > ? AND seq <= ? ORDER BY seq")
+
+    def append(self, conn, *values):
+        """Add one row and prune old ones now and then; returns its seq"""
+        seq = conn.execute(self._insert, values).lastrowid
+        if seq % PRUNE_EVERY == 0:
+            conn.execute(f"DELETE FROM {self.table} WHERE seq <= ?", (seq - RETENTION,))
+        return seq
+
+    def head(self, conn):
+        """Latest seq, 0 for an empty log"""
+        return conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.table}").fetchone()[0]
+
+    def follower(self, seq=None):
+        """A position in this log; seq=None means nothing has been seen yet"""
+        return Follower(self, seq)
+
+
+class Follower:
+    """One worker's read position in a ChangeLog"""
+
+    def __init__(self, log, seq=None):
+        self.log = log
+        self.seq = seq
+        # A follower starting from a known seq has just loaded that state
+        self.synced_at = time.monotonic() if seq is not None else 0.0
+
+    def reset(self, seq=None):
+        self.seq = seq
+        self.synced_at = time.monotonic() if seq is not None else 0.0
+
+    def poll(self, conn, interval):
+        """Rows appended since the last poll, oldest first.
+
+        Returns [] when polled again within interval seconds, and None on
+        the first poll or when the log was pruned past our position: the
+        caller must then drop everything it derived from the log. Either
+        way the follower moves to the current head.
+        """
+        now = time.monotonic()
+        if now - self.synced_at < interval:
+            return []
+        first_seq, max_seq = conn.execute(
+            f"SELECT MIN(seq), MAX(seq) FROM {self.log.table}").fetchone()
+        max_seq = max_seq or 0
+        last_seq = self.seq
+        self.seq, self.synced_at = max_seq, now
+        if last_seq is None or (first_seq is not None and first_seq > last_seq + 1):
+            return None
+        if max_seq <= last_seq:
+            return []
+        return conn.execute(self.log._select, (last_seq, max_seq)).fetchall()
@@ -10,6 +10,21 @@ class Config:
     # Database
     DATABASE = os.path.join(BASE_DIR, 'uis_connect.db')
     
+    # Connection pool (idle connections kept per worker thread)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 4)
+    DB_STATEMENT_CACHE_SIZE = 128
+    
+    # SQLite PRAGMAs applied to every new connection (in this order)
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 5000,       # ms to wait for a lock before "database is locked"
+        'journal_mode': 'WAL',      # readers no longer block on writers
+        'synchronous': 'NORMAL',    # safe with WAL, fsync only at checkpoints
+        'temp_store': 'MEMORY',
+        'cache_size': -16000,       # negative = KiB, so 16MB page cache
+    }
+    # Run a passive WAL checkpoint at most this often (seconds, 0 = only auto)
+    SQLITE_CHECKPOINT_INTERVAL = 60
+    
     # Secret key for sessions (CHANGE THIS IN PRODUCTION!)
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
@@ -19,15 +34,131 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
+    # Password hashing (werkzeug method string, e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:1000000') runs on PASSWORD_HASH_WORKERS threads; with
+    # PASSWORD_HASH_MAX_PENDING more already waiting, logins/registrations
+    # get a 503 "try again" instead of queueing. Stored hashes made with
+    # other parameters are upgraded on the user's next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    PASSWORD_HASH_MAX_PENDING = 16
+    PASSWORD_HASH_RETRY_AFTER = 2  # seconds, sent with the 503
+
     # Upload configuration
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    # Uploads are stored by content hash; images also get these downscaled
+    # variants (longest side in px), built in a process pool when Pillow is
+    # installed
+    UPLOAD_VARIANTS = {'thumb': 160, 'feed': 960}
+    THUMBNAIL_WORKERS = 2
+    # Partly written uploads/variants; outside static/ so they are never
+    # served, and on the same filesystem as UPLOAD_FOLDER for os.replace()
+    UPLOAD_TMP_FOLDER = os.path.join(BASE_DIR, 'upload_tmp')
+    
+    # Static files: url_for('static') adds ?v=<content hash>; versioned URLs
+    # and content-addressed uploads are cached for a year, anything else is
+    # revalidated after STATIC_MAX_AGE seconds (ETag -> 304)
+    STATIC_FINGERPRINT = True
+    STATIC_MAX_AGE = 0
+    STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+    # Let the front proxy send file bytes: None, 'x-sendfile' (Apache/lighttpd)
+    # or 'x-accel-redirect' (nginx, internal location at STATIC_ACCEL_PREFIX)
+    STATIC_SENDFILE = os.environ.get('STATIC_SENDFILE') or None
+    STATIC_ACCEL_PREFIX = '/_static/'
     
     # Pagination
     POSTS_PER_PAGE = 20
     USERS_PER_PAGE = 30
     MESSAGES_PER_PAGE = 50
+    SEARCH_RESULTS_PER_PAGE = 20
+    
+    # In-process cache of user records (no password hash); other workers'
+    # writes are picked up from user_cache_log every SYNC_INTERVAL seconds
+    USER_CACHE_SIZE = 5000  # 0 disables
+    USER_CACHE_TTL = 60
+    USER_CACHE_SYNC_INTERVAL = 1.0
+    
+    # Accepted friendships are held in memory per worker; other workers'
+    # changes are replayed from friendship_changes every SYNC_INTERVAL seconds
+    FRIEND_GRAPH_SYNC_INTERVAL = 1.0
+    
+    # Home timeline: authors with more friends than this are merged in at
+    # read time instead of being fanned out on write
+    TIMELINE_FANOUT_LIMIT = 1000
+    TIMELINE_BACKFILL = 100  # posts copied into a new friend's timeline
+    
+    # Seconds to cache header state (user + unread badges) per user in
+    # process memory; 0 disables and reads it once per request
+    HEADER_CACHE_TTL = 0
+    
+    # Trending hashtags: window name -> (window length, half-life) in hours
+    TRENDING_WINDOWS = {
+        '1h': (1, 0.5),
+        '24h': (24, 6),
+        '7d': (168, 48),
+    }
+    TRENDING_DEFAULT_WINDOW = '24h'
+    TRENDING_TOP_N = 20
+    # Seconds between recomputations by a background thread per worker (the
+    # first to find the ranking stale does it); 0 leaves it to
+    # `manage.py refresh-trending` from cron
+    TRENDING_REFRESH_INTERVAL = 60
+    
+    # Server-Sent Events (/events): each open stream holds a worker thread,
+    # so only enable with a threaded/async server; streams close after
+    # EVENTS_MAX_STREAM_SECONDS and the browser resumes via Last-Event-ID
+    EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED', 'false').lower() in ['true', 'on', '1']
+    EVENTS_POLL_INTERVAL = 0.5
+    EVENTS_HEARTBEAT_INTERVAL = 15
+    EVENTS_MAX_STREAM_SECONDS = 300
+    EVENTS_RETRY_MS = 3000
+    EVENTS_MAX_SUBSCRIBERS = 500  # per worker
+    EVENTS_RETENTION_HOURS = 24
+    
+    # JSON API (/api/v1): ids per batch request, page size cap and gzip
+    API_BATCH_MAX_IDS = 100
+    API_MAX_LIMIT = 100
+    API_COMPRESS_MIN_BYTES = 1024
+    API_COMPRESS_LEVEL = 6
+    
+    # Rendered pages for logged-out visitors, evicted by tag when db_utils
+    # writes touch what they show (other workers' writes are picked up every
+    # SYNC_INTERVAL seconds); TTL is only a backstop
+    PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 0 disables
+    PAGE_CACHE_TTL = 300
+    PAGE_CACHE_SYNC_INTERVAL = 1.0
+    PAGE_CACHE_ENDPOINTS = ('index', 'view_post', 'hashtag', 'view_user')
+    
+    # "People you may know": per-signal weights, suggestions kept per user and
+    # how many same-major/same-campus users are considered besides friends
+    # of friends
+    SUGGESTION_WEIGHTS = {
+        'mutual_friends': 3.0,  # per mutual friend
+        'major': 2.0,
+        'campus': 1.0,
+        'study_level': 0.5,
+        'interests': 2.0,       # times the Jaccard overlap of interests
+    }
+    SUGGESTIONS_PER_USER = 20
+    SUGGESTION_CANDIDATE_POOL = 200
+    
+    # Write-behind for like/save toggles: queue them in memory and write
+    # them in one transaction every WRITE_BEHIND_FLUSH_INTERVAL seconds
+    WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() in ['true', 'on', '1']
+    WRITE_BEHIND_FLUSH_INTERVAL = 0.25
+    WRITE_BEHIND_MAX_PENDING = 1000  # flush early once this many toggles are queued
+    
+    # SQL/route instrumentation, served in Prometheus text format at
+    # METRICS_PATH (per worker process). Scrapes must send
+    # "Authorization: Bearer <METRICS_TOKEN>"; without a token the endpoint
+    # is only served with DEBUG on.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() in ['true', 'on', '1']
+    METRICS_PATH = '/metrics'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_QUERY_MS = 100          # log queries slower than this, 0 disables
+    SLOW_QUERY_EXPLAIN = True    # add EXPLAIN QUERY PLAN to slow-query log lines
     
     # Application settings
     APP_NAME = 'UIS-Connect'
@@ -51,6 +182,7 @@ class Config:
         """Initialize application"""
         # Create upload directory if it doesn't exist
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(Config.UPLOAD_TMP_FOLDER, exist_ok=True)
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -62,6 +194,19 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SESSION_COOKIE_SECURE = True
+    
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 10000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'temp_store': 'MEMORY',
+        'cache_size': -64000,           # 64MB page cache
+        'mmap_size': 268435456,         # 256MB memory-mapped reads
+        'wal_autocheckpoint': 4000,     # pages; periodic checkpoints do the rest
+        'journal_size_limit': 67108864, # truncate the WAL back to 64MB
+    }
+    SQLITE_CHECKPOINT_INTERVAL = 30
+    HEADER_CACHE_TTL = 5
 
 class TestingConfig(Config):
     """Testing configuration"""
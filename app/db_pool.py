@@ -0,0 +1,212 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+from config import Config
+
+# Defaults used until init_app() / configure() is called (e.g. from scripts)
+POOL_SIZE = Config.DB_POOL_SIZE
+STATEMENT_CACHE_SIZE = Config.DB_STATEMENT_CACHE_SIZE
+PRAGMAS = dict(Config.SQLITE_PRAGMAS)
+CHECKPOINT_INTERVAL = Config.SQLITE_CHECKPOINT_INTERVAL
+
+_local = threading.local()
+_checkpoint_lock = threading.Lock()
+_last_checkpoint = {}
+_connect_hooks = []
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool.
+
+    While the connection is bound to a scope (a Flask request or a
+    connection_scope() block) close() is a no-op, so every db_utils call
+    in that scope keeps using the same connection and statement cache.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.database_path = None
+        self.scoped = False
+
+    def close(self):
+        if self.scoped:
+            return
+        release(self)
+
+    def really_close(self):
+        sqlite3.Connection.close(self)
+
+
+# Class of newly opened connections (a PooledConnection subclass)
+CONNECTION_CLASS = PooledConnection
+
+
+def configure(pool_size=None, statement_cache_size=None, pragmas=None,
+              checkpoint_interval=None, connection_class=None):
+    """Change pool settings (applies to connections opened afterwards)"""
+    global POOL_SIZE, STATEMENT_CACHE_SIZE, PRAGMAS, CHECKPOINT_INTERVAL, CONNECTION_CLASS
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if statement_cache_size is not None:
+        STATEMENT_CACHE_SIZE = statement_cache_size
+    if pragmas is not None:
+        PRAGMAS = dict(pragmas)
+    if checkpoint_interval is not None:
+        CHECKPOINT_INTERVAL = checkpoint_interval
+    if connection_class is not None:
+        CONNECTION_CLASS = connection_class
+
+
+def on_connect(hook):
+    """Call hook(conn) on every connection the pool opens from now on"""
+    _connect_hooks.append(hook)
+
+
+def _idle_connections(database_path):
+    """Idle connections for this thread and database"""
+    if not hasattr(_local, 'idle'):
+        _local.idle = {}
+    return _local.idle.setdefault(database_path, [])
+
+
+def _open(database_path):
+    conn = sqlite3.connect(
+        database_path,
+        factory=CONNECTION_CLASS,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    conn.database_path = database_path
+    apply_pragmas(conn, PRAGMAS)
+    for hook in _connect_hooks:
+        hook(conn)
+    return conn
+
+
+def apply_pragmas(conn, pragmas):
+    """Apply a PRAGMA profile to a connection"""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def checkpoint(conn, mode='PASSIVE'):
+    """Run a WAL checkpoint and return (busy, wal_pages, checkpointed_pages)"""
+    if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+
+def _maybe_checkpoint(conn):
+    """Passive checkpoint once per CHECKPOINT_INTERVAL per database.
+
+    Keeps the WAL short without making a random committing request pay
+    for a large auto-checkpoint.
+    """
+    if not CHECKPOINT_INTERVAL or conn.database_path == ':memory:':
+        return
+    now = time.monotonic()
+    with _checkpoint_lock:
+        if now - _last_checkpoint.get(conn.database_path, 0) < CHECKPOINT_INTERVAL:
+            return
+        _last_checkpoint[conn.database_path] = now
+    try:
+        checkpoint(conn)
+    except sqlite3.OperationalError:
+        pass
+
+
+def acquire(database_path):
+    """Take an idle connection from this thread's pool or open a new one"""
+    idle = _idle_connections(database_path)
+    if idle:
+        return idle.pop()
+    return _open(database_path)
+
+
+def release(conn):
+    """Return a connection to this thread's pool, closing it if the pool is full"""
+    conn.scoped = False
+    if conn.in_transaction:
+        conn.rollback()
+    _maybe_checkpoint(conn)
+
+    # In-memory databases are private to their connection, never reuse them
+    idle = _idle_connections(conn.database_path)
+    if conn.database_path != ':memory:' and len(idle) < POOL_SIZE:
+        idle.append(conn)
+    else:
+        conn.really_close()
+
+
+def _scope_connections():
+    """Connections bound to the current scope, or None outside any scope"""
+    if has_app_context():
+        if '_db_connections' not in g:
+            g._db_connections = {}
+        return g._db_connections
+    stack = getattr(_local, 'scopes', None)
+    return stack[-1] if stack else None
+
+
+def get_connection(database_path):
+    """Return the scope's shared connection, or a pooled one outside a scope"""
+    scoped = _scope_connections()
+    if scoped is None:
+        return acquire(database_path)
+
+    conn = scoped.get(database_path)
+    if conn is None:
+        conn = acquire(database_path)
+        conn.scoped = True
+        scoped[database_path] = conn
+    return conn
+
+
+def _release_all(connections):
+    for conn in connections.values():
+        release(conn)
+    connections.clear()
+
+
+@contextmanager
+def connection_scope():
+    """Share one connection per database for everything inside the block.
+
+    Use this in scripts and background jobs; Flask requests get the same
+    behaviour automatically once init_app() has been called.
+    """
+    if not hasattr(_local, 'scopes'):
+        _local.scopes = []
+    connections = {}
+    _local.scopes.append(connections)
+    try:
+        yield
+    finally:
+        _local.scopes.pop()
+        _release_all(connections)
+
+
+def close_idle():
+    """Close every idle connection held by this thread"""
+    for idle in getattr(_local, 'idle', {}).values():
+        while idle:
+            idle.pop().really_close()
+
+
+def init_app(app):
+    """Bind pooled connections to the Flask app context"""
+    configure(
+        pool_size=app.config.get('DB_POOL_SIZE'),
+        statement_cache_size=app.config.get('DB_STATEMENT_CACHE_SIZE'),
+        pragmas=app.config.get('SQLITE_PRAGMAS'),
+        checkpoint_interval=app.config.get('SQLITE_CHECKPOINT_INTERVAL')
+    )
+
+    @app.teardown_appcontext
+    def release_db_connections(exception=None):
+        connections = g.pop('_db_connections', None)
+        if connections:
+            _release_all(connections)
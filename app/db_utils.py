@@ -1,21 +1,39 @@
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import re
+import base64
+import heapq
+import json
+import threading
+import time
+from collections import Counter
+import db_pool
+import event_bus
+import friend_graph
+import page_cache
+import password_hasher
+import user_cache
+from config import Config
+from markupsafe import Markup, escape
 
 def get_db_connection(database_path):
-    """Create and return a database connection"""
-    conn = sqlite3.connect(database_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Return a pooled database connection.
+
+    Inside a Flask request (or db_pool.connection_scope()) all calls share
+    one connection; close() hands it back to the pool instead of closing it.
+    """
+    return db_pool.get_connection(database_path)
 
 # ==================== USER FUNCTIONS ====================
 
 def create_user(db_path, username, email, password, major=None, interests=None, 
                 bio=None, study_level=None, campus=None, student_number=None):
-    """Create a new user"""
+    """Create a new user.
+
+    Raises password_hasher.HasherBusy when the hashing pool is full.
+    """
+    password_hash = password_hasher.hash_password(password)
     conn = get_db_connection(db_path)
-    password_hash = generate_password_hash(password)
     
     try:
         cursor = conn.execute("""
@@ -37,7 +55,12 @@ def create_user(db_path, username, email, password, major=None, interests=None,
         conn.close()
 
 def authenticate_user(db_path, username, password):
-    """Authenticate user with username and password"""
+    """Authenticate user with username and password.
+
+    A hash made with other parameters than PASSWORD_HASH_METHOD is replaced
+    on success. Raises password_hasher.HasherBusy when the hashing pool is
+    full.
+    """
     conn = get_db_connection(db_path)
     user = conn.execute(
         "SELECT * FROM users WHERE username = ? AND is_active = 1", 
@@ -45,16 +68,36 @@ def authenticate_user(db_path, username, password):
     ).fetchone()
     conn.close()
     
-    if user and check_password_hash(user['password_hash'], password):
-        return dict(user)
-    return None
+    if not user:
+        return None
+    matches, new_hash = password_hasher.verify_password(user['password_hash'], password)
+    if not matches:
+        return None
+    if new_hash:
+        # Only if the password wasn't changed while we were hashing
+        conn = get_db_connection(db_path)
+        conn.execute(
+            "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+            (new_hash, user['id'], user['password_hash'])
+        )
+        conn.commit()
+        conn.close()
+    return dict(user)
+
+# Columns safe to cache and hand to templates (everything but the password hash)
+USER_COLUMNS = ('id, username, email, major, interests, bio, study_level, campus, '
+                'student_number, profile_picture, is_active, last_login')
+
+def _load_user(conn, user_id):
+    user = conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+    return dict(user) if user else None
 
 def get_user_by_id(db_path, user_id):
-    """Get user by ID"""
+    """Get user by ID (without the password hash, served from the user cache)"""
     conn = get_db_connection(db_path)
-    user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+    user = user_cache.get(conn, db_path, user_id, _load_user)
     conn.close()
-    return dict(user) if user else None
+    return user
 
 def get_user_by_username(db_path, username):
     """Get user by username"""
@@ -63,6 +106,25 @@ def get_user_by_username(db_path, username):
     conn.close()
     return dict(user) if user else None
 
+# Columns other users may see
+PUBLIC_USER_COLUMNS = ('id, username, major, interests, bio, study_level, campus, '
+                       'profile_picture')
+
+def get_users_by_ids(db_path, user_ids):
+    """Get the public profiles of many active users in one query, in the order of user_ids"""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return []
+    
+    conn = get_db_connection(db_path)
+    rows = conn.execute(f"""
+        SELECT {PUBLIC_USER_COLUMNS} FROM users
+        WHERE id IN (SELECT value FROM json_each(?)) AND is_active = 1
+    """, (json.dumps(user_ids),)).fetchall()
+    conn.close()
+    users = {row['id']: dict(row) for row in rows}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
 def update_user_profile(db_path, user_id, **kwargs):
     """Update user profile"""
     allowed_fields = ['email', 'major', 'interests', 'bio', 'study_level', 
@@ -78,6 +140,8 @@ def update_user_profile(db_path, user_id, **kwargs):
     conn = get_db_connection(db_path)
     try:
         conn.execute(f"UPDATE users SET {set_clause} WHERE id = ?", values)
+        user_cache.log_change(conn, db_path, user_id)
+        page_cache.invalidate(conn, [f"user:{user_id}"])
         conn.commit()
         return True
     except sqlite3.Error:
@@ -93,29 +157,44 @@ def update_last_login(db_path, user_id):
         "UPDATE users SET last_login = datetime('now') WHERE id = ?", 
         (user_id,)
     )
+    user_cache.log_change(conn, db_path, user_id)
     conn.commit()
     conn.close()
 
-def search_users(db_path, query, limit=50):
-    """Search users by username, major, or interests"""
+def deactivate_user(db_path, user_id):
+    """Deactivate a user account"""
     conn = get_db_connection(db_path)
-    search_pattern = f"%{query}%"
-    users = conn.execute("""
-        SELECT id, username, major, interests, study_level, campus, profile_picture
-        FROM users
-        WHERE (username LIKE ? OR major LIKE ? OR interests LIKE ?)
-        AND is_active = 1
-        ORDER BY username ASC
-        LIMIT ?
-    """, (search_pattern, search_pattern, search_pattern, limit)).fetchall()
+    conn.execute("UPDATE users SET is_active = 0 WHERE id = ?", (user_id,))
+    user_cache.log_change(conn, db_path, user_id)
+    page_cache.invalidate(conn, [f"user:{user_id}"])
+    conn.commit()
+    conn.close()
+
+def search_users(db_path, query, limit=50, offset=0):
+    """Search users by username, major, interests or bio (full-text, best match first)"""
+    match = _fts_query(query)
+    if not match:
+        return []
+    
+    conn = get_db_connection(db_path)
+    users = conn.execute(f"""
+        SELECT u.id, u.username, u.major, u.interests, u.study_level, u.campus, u.profile_picture,
+               snippet(users_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 12) AS snippet
+        FROM users_fts
+        JOIN users u ON u.id = users_fts.rowid
+        WHERE users_fts MATCH ? AND u.is_active = 1
+        ORDER BY bm25(users_fts, 10.0, 4.0, 2.0, 1.0)
+        LIMIT ? OFFSET ?
+    """, (match, limit, offset)).fetchall()
     conn.close()
-    return [dict(user) for user in users]
+    return [_with_highlight(user) for user in users]
 
 # ==================== POST FUNCTIONS ====================
 
 def create_post(db_path, user_id, content, post_type='general', 
-                visibility='public', image_url=None):
-    """Create a new post"""
+                visibility='public', image_url=None,
+                fanout_limit=Config.TIMELINE_FANOUT_LIMIT):
+    """Create a new post and fan it out to friends' home timelines"""
     conn = get_db_connection(db_path)
     cursor = conn.execute("""
         INSERT INTO posts (user_id, content, post_type, visibility, image_url)
@@ -123,23 +202,30 @@ def create_post(db_path, user_id, content, post_type='general',
     """, (user_id, content, post_type, visibility, image_url))
     post_id = cursor.lastrowid
     
-    # Extract and save hashtags
+    # Extract and save hashtags (a few set-based statements, same transaction)
     hashtags = extract_hashtags(content)
-    for tag in hashtags:
-        save_hashtag(conn, post_id, tag)
+    ingest_hashtags(conn, [(post_id, hashtags)])
+    
+    fan_out_post(conn, post_id, user_id, visibility, fanout_limit)
+    page_cache.invalidate(
+        conn, ['feed', f"user:{user_id}"] + [f"hashtag:{tag.lower()}" for tag in hashtags]
+    )
     
     conn.commit()
     conn.close()
     return post_id
 
-def get_all_posts(db_path, user_id=None, limit=50, offset=0, visibility_filter=None):
-    """Get all posts with likes and comment counts"""
+def get_all_posts(db_path, user_id=None, limit=50, offset=0, visibility_filter=None,
+                  before=None, after=None):
+    """Get all posts with likes and comment counts.
+
+    Pass a decoded cursor key as `before` (older posts) or `after` (newer
+    posts) for keyset pagination; offset is ignored in that case.
+    """
     conn = get_db_connection(db_path)
     
     query = """
         SELECT p.*, u.username, u.profile_picture,
-               (SELECT COUNT(*) FROM likes WHERE post_id = p.id) AS like_count,
-               (SELECT COUNT(*) FROM comments WHERE post_id = p.id) AS comment_count,
                (SELECT COUNT(*) > 0 FROM likes WHERE post_id = p.id AND user_id = ?) AS user_liked,
                (SELECT COUNT(*) > 0 FROM saved_posts WHERE post_id = p.id AND user_id = ?) AS user_saved
         FROM posts p
@@ -153,20 +239,76 @@ def get_all_posts(db_path, user_id=None, limit=50, offset=0, visibility_filter=N
         query += " AND p.visibility = ?"
         params.append(visibility_filter)
     
-    query += " ORDER BY p.is_pinned DESC, p.timestamp DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+    if before is not None:
+        query += " AND (p.is_pinned, p.timestamp, p.id) < (?, ?, ?)"
+        params.extend(before)
+        query += " ORDER BY p.is_pinned DESC, p.timestamp DESC, p.id DESC LIMIT ?"
+        params.append(limit)
+    elif after is not None:
+        # Walk forwards from the cursor, then flip back to feed order
+        query += " AND (p.is_pinned, p.timestamp, p.id) > (?, ?, ?)"
+        params.extend(after)
+        query += " ORDER BY p.is_pinned ASC, p.timestamp ASC, p.id ASC LIMIT ?"
+        params.append(limit)
+    else:
+        query += " ORDER BY p.is_pinned DESC, p.timestamp DESC, p.id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
     
-    posts = conn.execute(query, params).fetchall()
+    posts = [dict(post) for post in conn.execute(query, params).fetchall()]
     conn.close()
-    return [dict(post) for post in posts]
+    if after is not None:
+        posts.reverse()
+    return posts
+
+def encode_cursor(post):
+    """Encode a post's feed position as an opaque cursor string"""
+    key = [post['is_pinned'], post['timestamp'], post['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor(); raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        is_pinned, timestamp, post_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if not (isinstance(is_pinned, int) and isinstance(timestamp, str) and isinstance(post_id, int)):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return (is_pinned, timestamp, post_id)
+
+def get_feed_page(db_path, user_id=None, limit=20, before=None, after=None):
+    """Get one page of the feed with opaque next/prev cursors.
+
+    `before`/`after` are cursors from a previous page. Every page costs one
+    index range scan, however far back the user has scrolled. This is the
+    global feed, so it only holds public posts; friends-only posts reach
+    friends through their home timeline.
+    """
+    before_key = decode_cursor(before) if before else None
+    after_key = decode_cursor(after) if after and not before else None
+
+    # Fetch one extra row to know whether there is another page
+    posts = get_all_posts(db_path, user_id, limit=limit + 1, visibility_filter='public',
+                          before=before_key, after=after_key)
+    has_more = len(posts) > limit
+    if after_key is not None:
+        posts = posts[-limit:] if has_more else posts
+        has_newer, has_older = has_more, True
+    else:
+        posts = posts[:limit]
+        has_newer, has_older = before_key is not None, has_more
+
+    return {
+        'posts': posts,
+        'next_cursor': encode_cursor(posts[-1]) if posts and has_older else None,
+        'prev_cursor': encode_cursor(posts[0]) if posts and has_newer else None,
+    }
 
 def get_post_by_id(db_path, post_id, user_id=None):
     """Get a single post by ID"""
     conn = get_db_connection(db_path)
     post = conn.execute("""
         SELECT p.*, u.username, u.profile_picture,
-               (SELECT COUNT(*) FROM likes WHERE post_id = p.id) AS like_count,
-               (SELECT COUNT(*) FROM comments WHERE post_id = p.id) AS comment_count,
                (SELECT COUNT(*) > 0 FROM likes WHERE post_id = p.id AND user_id = ?) AS user_liked,
                (SELECT COUNT(*) > 0 FROM saved_posts WHERE post_id = p.id AND user_id = ?) AS user_saved
         FROM posts p
@@ -176,13 +318,43 @@ def get_post_by_id(db_path, post_id, user_id=None):
     conn.close()
     return dict(post) if post else None
 
+def can_view_post(graph, post, user_id):
+    """Whether user_id may see a post: public, their own, or a friend's non-private post"""
+    if post['visibility'] == 'public' or post['user_id'] == user_id:
+        return True
+    return (user_id is not None and post['visibility'] != 'private'
+            and graph.are_friends(user_id, post['user_id']))
+
+def get_posts_by_ids(db_path, post_ids, user_id=None):
+    """Get many posts in one query, in the order of post_ids.
+
+    Posts the viewer may not see are left out (see can_view_post).
+    """
+    post_ids = list(dict.fromkeys(post_ids))
+    if not post_ids:
+        return []
+    
+    conn = get_db_connection(db_path)
+    rows = conn.execute("""
+        SELECT p.*, u.username, u.profile_picture,
+               EXISTS (SELECT 1 FROM likes WHERE post_id = p.id AND user_id = ?) AS user_liked,
+               EXISTS (SELECT 1 FROM saved_posts WHERE post_id = p.id AND user_id = ?) AS user_saved
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        WHERE p.id IN (SELECT value FROM json_each(?))
+    """, (user_id, user_id, json.dumps(post_ids))).fetchall()
+    graph = friend_graph.get_graph(conn, db_path)
+    conn.close()
+    
+    posts = {row['id']: dict(row) for row in rows}
+    return [posts[post_id] for post_id in post_ids
+            if post_id in posts and can_view_post(graph, posts[post_id], user_id)]
+
 def get_user_posts(db_path, user_id, limit=50):
     """Get all posts by a specific user"""
     conn = get_db_connection(db_path)
     posts = conn.execute("""
-        SELECT p.*, u.username, u.profile_picture,
-               (SELECT COUNT(*) FROM likes WHERE post_id = p.id) AS like_count,
-               (SELECT COUNT(*) FROM comments WHERE post_id = p.id) AS comment_count
+        SELECT p.*, u.username, u.profile_picture
         FROM posts p
         JOIN users u ON p.user_id = u.id
         WHERE p.user_id = ?
@@ -205,12 +377,29 @@ def update_post(db_path, post_id, content, post_type=None):
             UPDATE posts SET content = ?, edited_at = datetime('now')
             WHERE id = ?
         """, (content, post_id))
+    page_cache.invalidate(conn, [f"post:{post_id}"])
     conn.commit()
     conn.close()
 
+def _post_listing_tags(conn, post_id):
+    """Page cache tags for a change to a post's place in feeds and its author's profile"""
+    post = conn.execute("SELECT user_id FROM posts WHERE id = ?", (post_id,)).fetchone()
+    tags = ['feed', f"post:{post_id}"]
+    if post:
+        tags.append(f"user:{post['user_id']}")
+    return tags
+
 def delete_post(db_path, post_id):
-    """Delete a post"""
+    """Delete a post together with its comments, likes and hashtag uses"""
     conn = get_db_connection(db_path)
+    page_cache.invalidate(conn, _post_listing_tags(conn, post_id))
+    conn.execute("""
+        DELETE FROM likes
+        WHERE post_id = ? OR comment_id IN (SELECT id FROM comments WHERE post_id = ?)
+    """, (post_id, post_id))
+    conn.execute("DELETE FROM comments WHERE post_id = ?", (post_id,))
+    conn.execute("DELETE FROM timeline WHERE post_id = ?", (post_id,))
+    remove_post_hashtags(conn, post_id)
     conn.execute("DELETE FROM posts WHERE id = ?", (post_id,))
     conn.commit()
     conn.close()
@@ -221,6 +410,7 @@ def toggle_pin_post(db_path, post_id):
     conn.execute("""
         UPDATE posts SET is_pinned = NOT is_pinned WHERE id = ?
     """, (post_id,))
+    page_cache.invalidate(conn, _post_listing_tags(conn, post_id))
     conn.commit()
     conn.close()
 
@@ -234,16 +424,23 @@ def add_comment(db_path, post_id, user_id, content, parent_comment_id=None):
         VALUES (?, ?, ?, ?)
     """, (post_id, user_id, content, parent_comment_id))
     comment_id = cursor.lastrowid
+    conn.execute("UPDATE posts SET comment_count = comment_count + 1 WHERE id = ?", (post_id,))
+    page_cache.invalidate(conn, [f"post:{post_id}"])
     conn.commit()
     conn.close()
     return comment_id
 
+def _comment_post_tags(conn, comment_ids):
+    """Page cache tags for the posts that show these comments"""
+    return [f"post:{post_id}" for (post_id,) in conn.execute("""
+        SELECT DISTINCT post_id FROM comments WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(list(comment_ids)),))]
+
 def get_post_comments(db_path, post_id):
     """Get all comments for a post"""
     conn = get_db_connection(db_path)
     comments = conn.execute("""
-        SELECT c.*, u.username, u.profile_picture,
-               (SELECT COUNT(*) FROM likes WHERE comment_id = c.id) AS like_count
+        SELECT c.*, u.username, u.profile_picture
         FROM comments c
         JOIN users u ON c.user_id = u.id
         WHERE c.post_id = ?
@@ -259,14 +456,22 @@ def update_comment(db_path, comment_id, content):
         UPDATE comments SET content = ?, edited_at = datetime('now')
         WHERE id = ?
     """, (content, comment_id))
+    page_cache.invalidate(conn, _comment_post_tags(conn, [comment_id]))
     conn.commit()
     conn.close()
 
 def delete_comment(db_path, comment_id):
     """Delete a comment"""
     conn = get_db_connection(db_path)
-    conn.execute("DELETE FROM comments WHERE id = ?", (comment_id,))
-    conn.commit()
+    comment = conn.execute("SELECT post_id FROM comments WHERE id = ?", (comment_id,)).fetchone()
+    if comment:
+        conn.execute("DELETE FROM likes WHERE comment_id = ?", (comment_id,))
+        conn.execute("DELETE FROM comments WHERE id = ?", (comment_id,))
+        conn.execute("""
+            UPDATE posts SET comment_count = MAX(comment_count - 1, 0) WHERE id = ?
+        """, (comment['post_id'],))
+        page_cache.invalidate(conn, [f"post:{comment['post_id']}"])
+        conn.commit()
     conn.close()
 
 # ==================== LIKE FUNCTIONS ====================
@@ -280,13 +485,18 @@ def toggle_like_post(db_path, post_id, user_id):
     
     if existing:
         conn.execute("DELETE FROM likes WHERE id = ?", (existing['id'],))
+        conn.execute("""
+            UPDATE posts SET like_count = MAX(like_count - 1, 0) WHERE id = ?
+        """, (post_id,))
         action = 'unliked'
     else:
         conn.execute("""
             INSERT INTO likes (post_id, user_id) VALUES (?, ?)
         """, (post_id, user_id))
+        conn.execute("UPDATE posts SET like_count = like_count + 1 WHERE id = ?", (post_id,))
         action = 'liked'
     
+    page_cache.invalidate(conn, [f"post:{post_id}"])
     conn.commit()
     conn.close()
     return action
@@ -300,17 +510,78 @@ def toggle_like_comment(db_path, comment_id, user_id):
     
     if existing:
         conn.execute("DELETE FROM likes WHERE id = ?", (existing['id'],))
+        conn.execute("""
+            UPDATE comments SET like_count = MAX(like_count - 1, 0) WHERE id = ?
+        """, (comment_id,))
         action = 'unliked'
     else:
         conn.execute("""
             INSERT INTO likes (comment_id, user_id) VALUES (?, ?)
         """, (comment_id, user_id))
+        conn.execute("UPDATE comments SET like_count = like_count + 1 WHERE id = ?", (comment_id,))
         action = 'liked'
     
+    page_cache.invalidate(conn, _comment_post_tags(conn, [comment_id]))
     conn.commit()
     conn.close()
     return action
 
+# Table, target column and counter table behind each kind of toggle
+TOGGLE_KINDS = {
+    'post_like': ('likes', 'post_id', 'posts'),
+    'comment_like': ('likes', 'comment_id', 'comments'),
+    'post_save': ('saved_posts', 'post_id', None),
+}
+
+def get_toggle_state(db_path, kind, target_id, user_id):
+    """Whether the user currently likes/saves the target"""
+    table, column, _ = TOGGLE_KINDS[kind]
+    conn = get_db_connection(db_path)
+    row = conn.execute(f"""
+        SELECT 1 FROM {table} WHERE {column} = ? AND user_id = ? LIMIT 1
+    """, (target_id, user_id)).fetchone()
+    conn.close()
+    return row is not None
+
+def apply_toggle_states(db_path, states):
+    """Set final like/save states in one transaction (a group commit).
+
+    states is an iterable of (kind, target_id, user_id, active). Each
+    write is idempotent and counters only move when a row really changed,
+    so replaying a batch or racing another worker cannot skew them.
+    """
+    conn = get_db_connection(db_path)
+    try:
+        liked_posts, liked_comments = set(), set()
+        for kind, target_id, user_id, active in states:
+            table, column, counter_table = TOGGLE_KINDS[kind]
+            if active:
+                changed = conn.execute(f"""
+                    INSERT INTO {table} ({column}, user_id)
+                    SELECT ?, ? WHERE NOT EXISTS (
+                        SELECT 1 FROM {table} WHERE {column} = ? AND user_id = ?
+                    )
+                """, (target_id, user_id, target_id, user_id)).rowcount
+            else:
+                changed = -conn.execute(f"""
+                    DELETE FROM {table} WHERE {column} = ? AND user_id = ?
+                """, (target_id, user_id)).rowcount
+            if changed and counter_table:
+                conn.execute(f"""
+                    UPDATE {counter_table} SET like_count = MAX(like_count + ?, 0) WHERE id = ?
+                """, (changed, target_id))
+                (liked_posts if counter_table == 'posts' else liked_comments).add(target_id)
+        page_cache.invalidate(
+            conn, [f"post:{post_id}" for post_id in liked_posts]
+            + (_comment_post_tags(conn, liked_comments) if liked_comments else [])
+        )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 # ==================== FRIENDSHIP FUNCTIONS ====================
 
 def send_friend_request(db_path, from_user_id, to_user_id):
@@ -355,60 +626,248 @@ def get_friend_requests(db_path, user_id):
     conn.close()
     return [dict(req) for req in requests]
 
-def respond_to_friend_request(db_path, friendship_id, status):
+def respond_to_friend_request(db_path, friendship_id, status,
+                              backfill=Config.TIMELINE_BACKFILL):
     """Respond to a friend request (accept/reject)"""
     if status not in ['accepted', 'rejected']:
         return False
     
     conn = get_db_connection(db_path)
+    friendship = conn.execute(
+        "SELECT user_id_1, user_id_2, status FROM friendships WHERE id = ?", (friendship_id,)
+    ).fetchone()
     conn.execute("""
         UPDATE friendships 
         SET status = ?, responded_at = datetime('now')
         WHERE id = ?
     """, (status, friendship_id))
+    
+    # Only a change into or out of 'accepted' touches the graph and timelines
+    changed = (friendship is not None
+               and (friendship['status'] == 'accepted') != (status == 'accepted'))
+    if changed:
+        user_id_1, user_id_2 = friendship['user_id_1'], friendship['user_id_2']
+        accepted = status == 'accepted'
+        if accepted:
+            backfill_timeline(conn, user_id_1, user_id_2, backfill)
+            backfill_timeline(conn, user_id_2, user_id_1, backfill)
+        else:
+            unlink_timelines(conn, user_id_1, user_id_2)
+        friend_graph.log_change(conn, user_id_1, user_id_2, accepted)
+        page_cache.invalidate(conn, [f"user:{user_id_1}", f"user:{user_id_2}"])
     conn.commit()
     conn.close()
+    if changed:
+        friend_graph.apply_change(db_path, user_id_1, user_id_2, accepted)
     return True
 
+def get_friend_graph(db_path):
+    """Get the in-memory friend graph (see friend_graph.py)"""
+    conn = get_db_connection(db_path)
+    graph = friend_graph.get_graph(conn, db_path)
+    conn.close()
+    return graph
+
 def get_user_friends(db_path, user_id):
     """Get all accepted friends of a user"""
+    friend_ids = get_friend_graph(db_path).friends(user_id)
+    if not friend_ids:
+        return []
+    
     conn = get_db_connection(db_path)
     friends = conn.execute("""
         SELECT u.id, u.username, u.profile_picture, u.major, u.study_level, u.campus
-        FROM friendships f
-        JOIN users u ON (
-            (f.user_id_1 = ? AND u.id = f.user_id_2) OR 
-            (f.user_id_2 = ? AND u.id = f.user_id_1)
-        )
-        WHERE f.status = 'accepted' AND u.is_active = 1
+        FROM users u
+        WHERE u.id IN (SELECT value FROM json_each(?)) AND u.is_active = 1
         ORDER BY u.username ASC
-    """, (user_id, user_id)).fetchall()
+    """, (json.dumps(friend_ids.tolist()),)).fetchall()
     conn.close()
     return [dict(friend) for friend in friends]
 
 def are_friends(db_path, user_id1, user_id2):
     """Check if two users are friends"""
-    conn = get_db_connection(db_path)
-    friendship = conn.execute("""
-        SELECT * FROM friendships
-        WHERE ((user_id_1 = ? AND user_id_2 = ?) OR (user_id_1 = ? AND user_id_2 = ?))
-        AND status = 'accepted'
-    """, (user_id1, user_id2, user_id2, user_id1)).fetchone()
-    conn.close()
-    return friendship is not None
+    return get_friend_graph(db_path).are_friends(user_id1, user_id2)
 
 def remove_friend(db_path, user_id1, user_id2):
     """Remove friendship between two users"""
     conn = get_db_connection(db_path)
+    removed = conn.execute("""
+        SELECT 1 FROM friendships
+        WHERE ((user_id_1 = ? AND user_id_2 = ?) OR (user_id_1 = ? AND user_id_2 = ?))
+          AND status = 'accepted'
+    """, (user_id1, user_id2, user_id2, user_id1)).fetchone() is not None
     conn.execute("""
         DELETE FROM friendships
         WHERE (user_id_1 = ? AND user_id_2 = ?) OR (user_id_1 = ? AND user_id_2 = ?)
     """, (user_id1, user_id2, user_id2, user_id1))
+    unlink_timelines(conn, user_id1, user_id2)
+    if removed:
+        friend_graph.log_change(conn, user_id1, user_id2, False)
+        page_cache.invalidate(conn, [f"user:{user_id1}", f"user:{user_id2}"])
     conn.commit()
     conn.close()
+    if removed:
+        friend_graph.apply_change(db_path, user_id1, user_id2, False)
+
+# ==================== TIMELINE FUNCTIONS ====================
+
+def fan_out_post(conn, post_id, author_id, visibility, fanout_limit=Config.TIMELINE_FANOUT_LIMIT):
+    """Copy a new post into the author's and their friends' timelines.
+
+    Authors with more than fanout_limit friends only get the post in their
+    own timeline and are marked as pull authors; readers merge their posts
+    in at read time. Once an author is back under the limit, the posts made
+    since they were marked are copied to their friends. Runs inside the
+    caller's transaction.
+    """
+    conn.execute("""
+        INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, timestamp)
+        SELECT user_id, id, user_id, timestamp FROM posts WHERE id = ?
+    """, (post_id,))
+    
+    if visibility == 'private':
+        return
+    
+    friend_count = conn.execute("""
+        SELECT (SELECT COUNT(*) FROM friendships WHERE user_id_1 = ? AND status = 'accepted') +
+               (SELECT COUNT(*) FROM friendships WHERE user_id_2 = ? AND status = 'accepted')
+    """, (author_id, author_id)).fetchone()[0]
+    
+    if friend_count > fanout_limit:
+        conn.execute("INSERT OR IGNORE INTO timeline_pull_authors (user_id) VALUES (?)", (author_id,))
+        return
+    
+    pulled_since = conn.execute(
+        "SELECT marked_at FROM timeline_pull_authors WHERE user_id = ?", (author_id,)
+    ).fetchone()
+    if pulled_since:
+        # Back under the limit: readers stop merging this author in, so
+        # copy what they only saw through the merge into their timelines
+        conn.execute("""
+            INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, timestamp)
+            SELECT f.friend_id, p.id, p.user_id, p.timestamp
+            FROM (SELECT user_id_2 AS friend_id FROM friendships
+                  WHERE user_id_1 = ? AND status = 'accepted'
+                  UNION ALL
+                  SELECT user_id_1 FROM friendships
+                  WHERE user_id_2 = ? AND status = 'accepted') f, posts p
+            WHERE p.user_id = ? AND p.visibility != 'private' AND p.timestamp >= ?
+        """, (author_id, author_id, author_id, pulled_since['marked_at']))
+        conn.execute("DELETE FROM timeline_pull_authors WHERE user_id = ?", (author_id,))
+    conn.execute("""
+        INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, timestamp)
+        SELECT f.user_id_2, p.id, p.user_id, p.timestamp
+        FROM friendships f, posts p
+        WHERE f.user_id_1 = ? AND f.status = 'accepted' AND p.id = ?
+        UNION ALL
+        SELECT f.user_id_1, p.id, p.user_id, p.timestamp
+        FROM friendships f, posts p
+        WHERE f.user_id_2 = ? AND f.status = 'accepted' AND p.id = ?
+    """, (author_id, post_id, author_id, post_id))
+
+def backfill_timeline(conn, user_id, author_id, limit=Config.TIMELINE_BACKFILL):
+    """Copy an author's most recent posts into a (new) friend's timeline"""
+    conn.execute("""
+        INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, timestamp)
+        SELECT ?, id, user_id, timestamp FROM posts
+        WHERE user_id = ? AND visibility != 'private'
+        ORDER BY timestamp DESC
+        LIMIT ?
+    """, (user_id, author_id, limit))
+
+def unlink_timelines(conn, user_id1, user_id2):
+    """Remove each user's posts from the other's timeline (no longer friends)"""
+    conn.execute("""
+        DELETE FROM timeline
+        WHERE (user_id = ? AND author_id = ?) OR (user_id = ? AND author_id = ?)
+    """, (user_id1, user_id2, user_id2, user_id1))
+
+def _timeline_keys(conn, user_id, limit, before=None, after=None):
+    """(timestamp, post_id) keys for one timeline page, newest first.
+
+    Merges the materialized timeline with posts from friends that are
+    pull authors (too many friends to fan out on write).
+    """
+    if before is not None:
+        seek, order, bound = "AND (timestamp, {id}) < (?, ?)", "DESC", list(before)
+    elif after is not None:
+        seek, order, bound = "AND (timestamp, {id}) > (?, ?)", "ASC", list(after)
+    else:
+        seek, order, bound = "", "DESC", []
+    
+    keys = conn.execute(f"""
+        SELECT timestamp, post_id FROM timeline
+        WHERE user_id = ? {seek.format(id='post_id')}
+        ORDER BY timestamp {order}, post_id {order}
+        LIMIT ?
+    """, [user_id] + bound + [limit]).fetchall()
+    keys = [tuple(k) for k in keys]
+    
+    pull_authors = [row[0] for row in conn.execute("""
+        SELECT pa.user_id FROM timeline_pull_authors pa
+        JOIN friendships f ON f.user_id_1 = ? AND f.user_id_2 = pa.user_id AND f.status = 'accepted'
+        UNION
+        SELECT pa.user_id FROM timeline_pull_authors pa
+        JOIN friendships f ON f.user_id_2 = ? AND f.user_id_1 = pa.user_id AND f.status = 'accepted'
+    """, (user_id, user_id))]
+    
+    for author_id in pull_authors:
+        keys.extend(tuple(k) for k in conn.execute(f"""
+            SELECT timestamp, id FROM posts
+            WHERE user_id = ? AND visibility != 'private' {seek.format(id='id')}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT ?
+        """, [author_id] + bound + [limit]).fetchall())
+    
+    keys = sorted(set(keys), reverse=(order == "DESC"))[:limit]
+    if order == "ASC":
+        keys.reverse()
+    return keys
+
+def get_timeline_page(db_path, user_id, limit=20, before=None, after=None):
+    """Get one page of a user's home timeline with opaque next/prev cursors.
+
+    Same cursor format and return shape as get_feed_page.
+    """
+    before_key = decode_cursor(before)[1:] if before else None
+    after_key = decode_cursor(after)[1:] if after and not before else None
+    
+    conn = get_db_connection(db_path)
+    keys = _timeline_keys(conn, user_id, limit + 1, before_key, after_key)
+    has_more = len(keys) > limit
+    if after_key is not None:
+        keys = keys[-limit:] if has_more else keys
+        has_newer, has_older = has_more, True
+    else:
+        keys = keys[:limit]
+        has_newer, has_older = before_key is not None, has_more
+    
+    posts = []
+    if keys:
+        post_ids = [post_id for _, post_id in keys]
+        placeholders = ', '.join('?' * len(post_ids))
+        rows = conn.execute(f"""
+            SELECT p.*, u.username, u.profile_picture,
+                   (SELECT COUNT(*) > 0 FROM likes WHERE post_id = p.id AND user_id = ?) AS user_liked,
+                   (SELECT COUNT(*) > 0 FROM saved_posts WHERE post_id = p.id AND user_id = ?) AS user_saved
+            FROM posts p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.id IN ({placeholders}) AND u.is_active = 1
+        """, [user_id, user_id] + post_ids).fetchall()
+        by_id = {row['id']: dict(row) for row in rows}
+        posts = [by_id[post_id] for post_id in post_ids if post_id in by_id]
+    conn.close()
+    
+    return {
+        'posts': posts,
+        'next_cursor': encode_cursor(posts[-1]) if posts and has_older else None,
+        'prev_cursor': encode_cursor(posts[0]) if posts and has_newer else None,
+    }
 
 # ==================== MESSAGING FUNCTIONS ====================
 
+MESSAGE_SNIPPET_LENGTH = 100
+
 def send_message(db_path, sender_id, receiver_id, content):
     """Send a direct message"""
     conn = get_db_connection(db_path)
@@ -417,8 +876,34 @@ def send_message(db_path, sender_id, receiver_id, content):
         VALUES (?, ?, ?)
     """, (sender_id, receiver_id, content))
     message_id = cursor.lastrowid
+    _bump_counter(conn, receiver_id, 'unread_messages', 1)
+    
+    # Keep the inbox summary for this pair up to date
+    receiver_is_low = receiver_id < sender_id
+    conn.execute("""
+        INSERT INTO conversations
+            (user_low, user_high, last_message_id, last_message_at, snippet, unread_low, unread_high)
+        SELECT ?, ?, id, timestamp, substr(content, 1, ?), ?, ? FROM messages WHERE id = ?
+        ON CONFLICT(user_low, user_high) DO UPDATE SET
+            last_message_id = excluded.last_message_id,
+            last_message_at = excluded.last_message_at,
+            snippet = excluded.snippet,
+            unread_low = unread_low + excluded.unread_low,
+            unread_high = unread_high + excluded.unread_high
+    """, (min(sender_id, receiver_id), max(sender_id, receiver_id), MESSAGE_SNIPPET_LENGTH,
+          int(receiver_is_low), int(not receiver_is_low), message_id))
+    
+    if event_bus.ENABLED:
+        sender = user_cache.get(conn, db_path, sender_id, _load_user)
+        event_bus.publish(conn, receiver_id, 'message', dict(
+            _unread_counts(conn, receiver_id),
+            message_id=message_id, sender_id=sender_id,
+            sender_username=sender['username'] if sender else None,
+            snippet=content[:MESSAGE_SNIPPET_LENGTH]
+        ))
     conn.commit()
     conn.close()
+    event_bus.wake()
     return message_id
 
 def get_conversation(db_path, user_id1, user_id2, limit=50):
@@ -440,40 +925,40 @@ def get_conversation(db_path, user_id1, user_id2, limit=50):
     return [dict(msg) for msg in messages]
 
 def get_user_conversations(db_path, user_id):
-    """Get all conversations for a user"""
+    """Get all conversations for a user from the conversations summary table"""
     conn = get_db_connection(db_path)
     conversations = conn.execute("""
-        SELECT DISTINCT
-            CASE 
-                WHEN m.sender_id = ? THEN m.receiver_id
-                ELSE m.sender_id
-            END as other_user_id,
-            u.username as other_username,
-            u.profile_picture,
-            MAX(m.timestamp) as last_message_time,
-            (SELECT COUNT(*) FROM messages 
-             WHERE receiver_id = ? AND sender_id = other_user_id AND is_read = 0) as unread_count
-        FROM messages m
-        JOIN users u ON u.id = (
-            CASE 
-                WHEN m.sender_id = ? THEN m.receiver_id
-                ELSE m.sender_id
-            END
-        )
-        WHERE m.sender_id = ? OR m.receiver_id = ?
-        GROUP BY other_user_id
-        ORDER BY last_message_time DESC
-    """, (user_id, user_id, user_id, user_id, user_id)).fetchall()
+        SELECT c.user_high AS other_user_id, u.username AS other_username, u.profile_picture,
+               c.last_message_at AS last_message_time, c.last_message_id, c.snippet,
+               c.unread_low AS unread_count
+        FROM conversations c
+        JOIN users u ON u.id = c.user_high
+        WHERE c.user_low = ?
+        UNION ALL
+        SELECT c.user_low AS other_user_id, u.username AS other_username, u.profile_picture,
+               c.last_message_at AS last_message_time, c.last_message_id, c.snippet,
+               c.unread_high AS unread_count
+        FROM conversations c
+        JOIN users u ON u.id = c.user_low
+        WHERE c.user_high = ? AND c.user_low != c.user_high
+        ORDER BY last_message_time DESC, last_message_id DESC
+    """, (user_id, user_id)).fetchall()
     conn.close()
     return [dict(conv) for conv in conversations]
 
 def mark_messages_read(db_path, user_id, other_user_id):
     """Mark all messages from another user as read"""
     conn = get_db_connection(db_path)
-    conn.execute("""
+    marked = conn.execute("""
         UPDATE messages SET is_read = 1
         WHERE receiver_id = ? AND sender_id = ? AND is_read = 0
-    """, (user_id, other_user_id))
+    """, (user_id, other_user_id)).rowcount
+    if marked:
+        _bump_counter(conn, user_id, 'unread_messages', -marked)
+        side = 'unread_low' if user_id < other_user_id else 'unread_high'
+        conn.execute(f"""
+            UPDATE conversations SET {side} = 0 WHERE user_low = ? AND user_high = ?
+        """, (min(user_id, other_user_id), max(user_id, other_user_id)))
     conn.commit()
     conn.close()
 
@@ -487,8 +972,16 @@ def create_notification(db_path, user_id, content, notification_type, related_id
         VALUES (?, ?, ?, ?)
     """, (user_id, content, notification_type, related_id))
     notification_id = cursor.lastrowid
+    _bump_counter(conn, user_id, 'unread_notifications', 1)
+    if event_bus.ENABLED:
+        event_bus.publish(conn, user_id, 'notification', dict(
+            _unread_counts(conn, user_id),
+            notification_id=notification_id, content=content,
+            notification_type=notification_type, related_id=related_id
+        ))
     conn.commit()
     conn.close()
+    event_bus.wake()
     return notification_id
 
 def get_user_notifications(db_path, user_id, limit=50, unread_only=False):
@@ -510,14 +1003,20 @@ def get_user_notifications(db_path, user_id, limit=50, unread_only=False):
 def mark_notification_read(db_path, notification_id):
     """Mark a notification as read"""
     conn = get_db_connection(db_path)
-    conn.execute("UPDATE notifications SET is_read = 1 WHERE id = ?", (notification_id,))
-    conn.commit()
+    notification = conn.execute(
+        "SELECT user_id FROM notifications WHERE id = ? AND is_read = 0", (notification_id,)
+    ).fetchone()
+    if notification:
+        conn.execute("UPDATE notifications SET is_read = 1 WHERE id = ?", (notification_id,))
+        _bump_counter(conn, notification['user_id'], 'unread_notifications', -1)
+        conn.commit()
     conn.close()
 
 def mark_all_notifications_read(db_path, user_id):
     """Mark all notifications as read for a user"""
     conn = get_db_connection(db_path)
-    conn.execute("UPDATE notifications SET is_read = 1 WHERE user_id = ?", (user_id,))
+    conn.execute("UPDATE notifications SET is_read = 1 WHERE user_id = ? AND is_read = 0", (user_id,))
+    conn.execute("UPDATE user_counters SET unread_notifications = 0 WHERE user_id = ?", (user_id,))
     conn.commit()
     conn.close()
 
@@ -525,12 +1024,49 @@ def get_unread_count(db_path, user_id):
     """Get count of unread notifications"""
     conn = get_db_connection(db_path)
     count = conn.execute("""
-        SELECT COUNT(*) as count FROM notifications 
-        WHERE user_id = ? AND is_read = 0
+        SELECT unread_notifications AS count FROM user_counters WHERE user_id = ?
     """, (user_id,)).fetchone()
     conn.close()
     return count['count'] if count else 0
 
+# ==================== COUNTER FUNCTIONS ====================
+
+def _bump_counter(conn, user_id, column, delta):
+    """Add delta to one of a user's unread counters (never below zero)"""
+    conn.execute(f"""
+        INSERT INTO user_counters (user_id, {column}) VALUES (?, MAX(?, 0))
+        ON CONFLICT(user_id) DO UPDATE SET {column} = MAX({column} + ?, 0)
+    """, (user_id, delta, delta))
+
+def _unread_counts(conn, user_id):
+    """A user's unread badges as stored in user_counters"""
+    row = conn.execute("""
+        SELECT unread_messages, unread_notifications FROM user_counters WHERE user_id = ?
+    """, (user_id,)).fetchone()
+    return dict(row) if row else {'unread_messages': 0, 'unread_notifications': 0}
+
+def get_header_state(db_path, user_id):
+    """Get what the page header needs in one query: a slim user record and unread badges"""
+    conn = get_db_connection(db_path)
+    row = conn.execute("""
+        SELECT u.id, u.username, u.profile_picture,
+               COALESCE(c.unread_notifications, 0) AS unread_notifications,
+               COALESCE(c.unread_messages, 0) AS unread_messages
+        FROM users u
+        LEFT JOIN user_counters c ON c.user_id = u.id
+        WHERE u.id = ? AND u.is_active = 1
+    """, (user_id,)).fetchone()
+    conn.close()
+    
+    if not row:
+        return dict(current_user=None, unread_notifications=0, unread_messages=0)
+    return dict(
+        current_user={'id': row['id'], 'username': row['username'],
+                      'profile_picture': row['profile_picture']},
+        unread_notifications=row['unread_notifications'],
+        unread_messages=row['unread_messages']
+    )
+
 # ==================== SAVED POSTS FUNCTIONS ====================
 
 def toggle_save_post(db_path, user_id, post_id):
@@ -557,10 +1093,7 @@ def get_saved_posts(db_path, user_id, limit=50):
     """Get all saved posts for a user"""
     conn = get_db_connection(db_path)
     posts = conn.execute("""
-        SELECT p.*, u.username, u.profile_picture,
-               (SELECT COUNT(*) FROM likes WHERE post_id = p.id) AS like_count,
-               (SELECT COUNT(*) FROM comments WHERE post_id = p.id) AS comment_count,
-               sp.saved_at
+        SELECT p.*, u.username, u.profile_picture, sp.saved_at
         FROM saved_posts sp
         JOIN posts p ON sp.post_id = p.id
         JOIN users u ON p.user_id = u.id
@@ -571,6 +1104,80 @@ def get_saved_posts(db_path, user_id, limit=50):
     conn.close()
     return [dict(post) for post in posts]
 
+# ==================== SEARCH FUNCTIONS ====================
+
+# Control characters FTS5 puts around matches; swapped for <mark> after escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+def _fts_query(query):
+    """Turn free text into a safe FTS5 query: every word must match, the last as a prefix"""
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+def _with_highlight(row):
+    """Row as a dict with its snippet HTML-escaped and matches wrapped in <mark>"""
+    result = dict(row)
+    result['snippet'] = Markup(
+        str(escape(result['snippet'] or ''))
+        .replace(_MARK_START, '<mark>')
+        .replace(_MARK_END, '</mark>')
+    )
+    return result
+
+def search_posts(db_path, query, user_id=None, limit=20, offset=0):
+    """Full-text search over public post content, ranked by BM25"""
+    match = _fts_query(query)
+    if not match:
+        return []
+    
+    conn = get_db_connection(db_path)
+    posts = conn.execute(f"""
+        SELECT p.*, u.username, u.profile_picture,
+               snippet(posts_fts, 0, '{_MARK_START}', '{_MARK_END}', '…', 24) AS snippet,
+               (SELECT COUNT(*) > 0 FROM likes WHERE post_id = p.id AND user_id = ?) AS user_liked
+        FROM posts_fts
+        JOIN posts p ON p.id = posts_fts.rowid
+        JOIN users u ON p.user_id = u.id
+        WHERE posts_fts MATCH ? AND p.visibility = 'public' AND u.is_active = 1
+        ORDER BY bm25(posts_fts)
+        LIMIT ? OFFSET ?
+    """, (user_id, match, limit, offset)).fetchall()
+    conn.close()
+    return [_with_highlight(post) for post in posts]
+
+def search_comments(db_path, query, limit=20, offset=0):
+    """Full-text search over comments on public posts, ranked by BM25"""
+    match = _fts_query(query)
+    if not match:
+        return []
+    
+    conn = get_db_connection(db_path)
+    comments = conn.execute(f"""
+        SELECT c.*, u.username, u.profile_picture,
+               snippet(comments_fts, 0, '{_MARK_START}', '{_MARK_END}', '…', 24) AS snippet
+        FROM comments_fts
+        JOIN comments c ON c.id = comments_fts.rowid
+        JOIN posts p ON p.id = c.post_id
+        JOIN users u ON c.user_id = u.id
+        WHERE comments_fts MATCH ? AND p.visibility = 'public' AND u.is_active = 1
+        ORDER BY bm25(comments_fts)
+        LIMIT ? OFFSET ?
+    """, (match, limit, offset)).fetchall()
+    conn.close()
+    return [_with_highlight(comment) for comment in comments]
+
+def rebuild_search_index(db_path):
+    """Rebuild all full-text indexes from their source tables"""
+    conn = get_db_connection(db_path)
+    for table in ('posts_fts', 'comments_fts', 'users_fts'):
+        conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+        conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
 # ==================== HASHTAG FUNCTIONS ====================
 
 def extract_hashtags(content):
@@ -579,42 +1186,235 @@ def extract_hashtags(content):
 
 def save_hashtag(conn, post_id, tag):
     """Save hashtag for a post"""
-    tag = tag.lower()
+    ingest_hashtags(conn, [(post_id, [tag])])
+
+# SQLite limits bound parameters per statement; stay well below it
+_HASHTAG_BATCH = 400
+
+def ingest_hashtags(conn, post_tags, record_trending=True):
+    """Save the hashtags of one or more new posts with set-based statements.
+
+    post_tags is an iterable of (post_id, tags). Tags are lowercased and
+    deduplicated per post in Python, then each batch costs three
+    statements: a multi-row hashtag upsert (bumping use_count and
+    returning ids), a multi-row post_hashtags insert and a multi-row
+    trending bucket upsert. Runs inside the caller's transaction.
+    """
+    links = sorted({(post_id, tag.lower()) for post_id, tags in post_tags for tag in tags})
+    if not links:
+        return
     
-    # Check if hashtag exists
-    hashtag = conn.execute("SELECT id FROM hashtags WHERE tag = ?", (tag,)).fetchone()
+    uses = {}
+    for _, tag in links:
+        uses[tag] = uses.get(tag, 0) + 1
     
-    if hashtag:
-        hashtag_id = hashtag['id']
-        conn.execute("UPDATE hashtags SET use_count = use_count + 1 WHERE id = ?", (hashtag_id,))
-    else:
-        cursor = conn.execute("INSERT INTO hashtags (tag) VALUES (?)", (tag,))
-        hashtag_id = cursor.lastrowid
+    tag_ids = {}
+    tags = sorted(uses)
+    for start in range(0, len(tags), _HASHTAG_BATCH):
+        batch = tags[start:start + _HASHTAG_BATCH]
+        rows = conn.execute(f"""
+            INSERT INTO hashtags (tag, use_count) VALUES {', '.join(['(?, ?)'] * len(batch))}
+            ON CONFLICT(tag) DO UPDATE SET use_count = use_count + excluded.use_count
+            RETURNING id, tag
+        """, [value for tag in batch for value in (tag, uses[tag])]).fetchall()
+        tag_ids.update((row['tag'], row['id']) for row in rows)
+    
+    for start in range(0, len(links), _HASHTAG_BATCH):
+        batch = links[start:start + _HASHTAG_BATCH]
+        conn.execute(f"""
+            INSERT OR IGNORE INTO post_hashtags (post_id, hashtag_id)
+            VALUES {', '.join(['(?, ?)'] * len(batch))}
+        """, [value for post_id, tag in batch for value in (post_id, tag_ids[tag])])
+    
+    if record_trending:
+        record_hashtag_uses(conn, uses, tag_ids)
+
+def remove_post_hashtags(conn, post_id):
+    """Undo ingest_hashtags for a post: use_count, trending buckets, post_hashtags.
+
+    Decrements the bucket of the post's own hour. Call before deleting the
+    post, inside the caller's transaction.
+    """
+    post = conn.execute("""
+        SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 3600 AS bucket_hour
+        FROM posts WHERE id = ?
+    """, (post_id,)).fetchone()
+    if post is None:
+        return
+    conn.execute("""
+        UPDATE hashtags SET use_count = MAX(use_count - 1, 0)
+        WHERE id IN (SELECT hashtag_id FROM post_hashtags WHERE post_id = ?)
+    """, (post_id,))
+    conn.execute("""
+        UPDATE hashtag_buckets SET uses = uses - 1
+        WHERE bucket_hour = ? AND hashtag_id IN (SELECT hashtag_id FROM post_hashtags WHERE post_id = ?)
+    """, (post['bucket_hour'], post_id))
+    conn.execute("""
+        DELETE FROM hashtag_buckets
+        WHERE bucket_hour = ? AND uses <= 0
+          AND hashtag_id IN (SELECT hashtag_id FROM post_hashtags WHERE post_id = ?)
+    """, (post['bucket_hour'], post_id))
+    conn.execute("DELETE FROM post_hashtags WHERE post_id = ?", (post_id,))
+
+def reindex_hashtags(db_path, batch_size=1000):
+    """Rebuild hashtags/post_hashtags (and recent trending buckets) from post content.
+
+    Runs as one transaction, streaming posts in id order. Tags that no
+    longer appear in any post are removed. Returns (posts, links) counts.
+    """
+    conn = get_db_connection(db_path)
+    conn.execute("DELETE FROM post_hashtags")
+    conn.execute("UPDATE hashtags SET use_count = 0")
     
+    post_count = 0
+    last_id = 0
+    while True:
+        posts = conn.execute("""
+            SELECT id, content FROM posts WHERE id > ? ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not posts:
+            break
+        ingest_hashtags(conn, [(post['id'], extract_hashtags(post['content'] or ''))
+                               for post in posts], record_trending=False)
+        post_count += len(posts)
+        last_id = posts[-1]['id']
+    
+    conn.execute("DELETE FROM hashtags WHERE use_count = 0")
+    conn.execute("DELETE FROM hashtag_buckets")
+    conn.execute("""
+        INSERT INTO hashtag_buckets (bucket_hour, hashtag_id, uses)
+        SELECT CAST(strftime('%s', p.timestamp) AS INTEGER) / 3600, ph.hashtag_id, COUNT(*)
+        FROM post_hashtags ph
+        JOIN posts p ON p.id = ph.post_id
+        WHERE p.timestamp >= datetime('now', '-7 days')
+        GROUP BY 1, 2
+    """)
+    link_count = conn.execute("SELECT COUNT(*) FROM post_hashtags").fetchone()[0]
+    conn.commit()
+    conn.close()
+    _trending_cache.clear()
+    return post_count, link_count
+
+# ==================== TRENDING FUNCTIONS ====================
+
+_trending_cache = {}
+_trending_refresh_lock = threading.Lock()
+
+def record_hashtag_uses(conn, uses, tag_ids, at=None):
+    """Add uses ({tag: count}) to the current hour's trending buckets (caller commits)"""
+    bucket_hour = int((at or time.time()) // 3600)
+    rows = [(bucket_hour, tag_ids[tag], count) for tag, count in uses.items()]
+    for start in range(0, len(rows), _HASHTAG_BATCH):
+        batch = rows[start:start + _HASHTAG_BATCH]
+        conn.execute(f"""
+            INSERT INTO hashtag_buckets (bucket_hour, hashtag_id, uses)
+            VALUES {', '.join(['(?, ?, ?)'] * len(batch))}
+            ON CONFLICT(bucket_hour, hashtag_id) DO UPDATE SET uses = uses + excluded.uses
+        """, [value for row in batch for value in row])
+
+def refresh_trending_hashtags(db_path, windows=Config.TRENDING_WINDOWS,
+                              top_n=Config.TRENDING_TOP_N, now=None):
+    """Recompute the top-N trending hashtags for every window.
+
+    Each hour bucket's uses are weighted by exp decay with the window's
+    half-life, so a burst in the last hour outranks a tag that was busy
+    days ago. Buckets older than the longest window are pruned.
+    """
+    now = now or time.time()
+    now_hours = now / 3600
+    longest = max(length for length, _ in windows.values())
+    oldest_bucket = int(now_hours) - longest + 1
+    
+    conn = get_db_connection(db_path)
+    buckets = conn.execute("""
+        SELECT b.bucket_hour, b.hashtag_id, b.uses, h.tag
+        FROM hashtag_buckets b
+        JOIN hashtags h ON h.id = b.hashtag_id
+        WHERE b.bucket_hour >= ?
+    """, (oldest_bucket,)).fetchall()
+    
+    rows = []
+    for name, (length, half_life) in windows.items():
+        first_bucket = int(now_hours) - length + 1
+        scores = {}
+        for bucket in buckets:
+            if bucket['bucket_hour'] < first_bucket:
+                continue
+            age = max(now_hours - (bucket['bucket_hour'] + 0.5), 0)
+            entry = scores.setdefault(bucket['hashtag_id'], [bucket['tag'], 0, 0.0])
+            entry[1] += bucket['uses']
+            entry[2] += bucket['uses'] * 0.5 ** (age / half_life)
+        ranked = sorted(scores.items(), key=lambda item: item[1][2], reverse=True)[:top_n]
+        rows.extend(
+            (name, rank, hashtag_id, tag, uses, score, now)
+            for rank, (hashtag_id, (tag, uses, score)) in enumerate(ranked, 1)
+        )
+    
+    conn.execute("DELETE FROM trending_hashtags")
+    conn.executemany("""
+        INSERT INTO trending_hashtags (time_window, rank, hashtag_id, tag, uses, score, computed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.execute("DELETE FROM hashtag_buckets WHERE bucket_hour < ?", (oldest_bucket,))
+    conn.commit()
+    conn.close()
+    _trending_cache.clear()
+
+def refresh_trending_if_stale(db_path, max_age=Config.TRENDING_REFRESH_INTERVAL):
+    """Recompute trending hashtags unless another worker did so within max_age seconds.
+
+    Returns True if this call refreshed them.
+    """
+    now = time.time()
+    conn = get_db_connection(db_path)
+    computed_at = conn.execute(
+        "SELECT MAX(computed_at) FROM trending_hashtags"
+    ).fetchone()[0]
+    conn.close()
+    
+    if computed_at is not None and now - computed_at < max_age:
+        return False
+    if not _trending_refresh_lock.acquire(blocking=False):
+        return False
     try:
-        conn.execute("INSERT INTO post_hashtags (post_id, hashtag_id) VALUES (?, ?)", 
-                    (post_id, hashtag_id))
-    except sqlite3.IntegrityError:
-        pass
+        refresh_trending_hashtags(db_path, now=now)
+    finally:
+        _trending_refresh_lock.release()
+    return True
 
-def get_trending_hashtags(db_path, limit=10):
-    """Get trending hashtags"""
+def get_trending_hashtags(db_path, limit=10, window=Config.TRENDING_DEFAULT_WINDOW,
+                          max_age=Config.TRENDING_REFRESH_INTERVAL,
+                          windows=Config.TRENDING_WINDOWS):
+    """Get trending hashtags from the precomputed table.
+
+    Only reads: the ranking is recomputed by refresh_trending_if_stale()
+    in the background or by `manage.py refresh-trending`. The result is
+    cached in process for max_age seconds; unknown windows fall back to
+    TRENDING_DEFAULT_WINDOW.
+    """
+    if window not in windows:
+        window = Config.TRENDING_DEFAULT_WINDOW
+    now = time.time()
+    cached = _trending_cache.get((db_path, window))
+    if cached and now - cached[0] < max_age:
+        return cached[1][:limit]
+    
     conn = get_db_connection(db_path)
-    hashtags = conn.execute("""
-        SELECT tag, use_count FROM hashtags
-        ORDER BY use_count DESC
-        LIMIT ?
-    """, (limit,)).fetchall()
+    hashtags = [dict(tag) for tag in conn.execute("""
+        SELECT tag, uses AS use_count, score FROM trending_hashtags
+        WHERE time_window = ?
+        ORDER BY rank
+    """, (window,)).fetchall()]
     conn.close()
-    return [dict(tag) for tag in hashtags]
+    
+    _trending_cache[(db_path, window)] = (now, hashtags)
+    return hashtags[:limit]
 
 def search_posts_by_hashtag(db_path, tag, limit=50):
     """Search posts by hashtag"""
     conn = get_db_connection(db_path)
     posts = conn.execute("""
-        SELECT p.*, u.username, u.profile_picture,
-               (SELECT COUNT(*) FROM likes WHERE post_id = p.id) AS like_count,
-               (SELECT COUNT(*) FROM comments WHERE post_id = p.id) AS comment_count
+        SELECT p.*, u.username, u.profile_picture
         FROM posts p
         JOIN users u ON p.user_id = u.id
         JOIN post_hashtags ph ON p.id = ph.post_id
@@ -626,8 +1426,191 @@ def search_posts_by_hashtag(db_path, tag, limit=50):
     conn.close()
     return [dict(post) for post in posts]
 
+# ==================== SUGGESTION FUNCTIONS ====================
+
+def _interest_set(interests):
+    return frozenset(
+        word.strip().lower() for word in re.split(r'[,;/\n]', interests or '') if word.strip()
+    )
+
+def _attribute_buckets(users, column, pool):
+    """Up to pool most recently active user ids per value of column"""
+    buckets = {}
+    for user in users:
+        value = (user[column] or '').strip().lower()
+        if value:
+            members = buckets.setdefault(value, [])
+            if len(members) < pool:
+                members.append(user['id'])
+    return buckets
+
+def refresh_friend_suggestions(db_path, top_k=Config.SUGGESTIONS_PER_USER,
+                               weights=Config.SUGGESTION_WEIGHTS,
+                               candidate_pool=Config.SUGGESTION_CANDIDATE_POOL,
+                               batch_size=500):
+    """Recompute the top-K "people you may know" for every active user.
+
+    Candidates are friends of friends, counted from the in-memory friend
+    graph, plus the most recently active users sharing a major or campus.
+    Each is scored as a weighted sum of mutual friends, matching
+    major/campus/study level and interest overlap. Existing friends and
+    users with a pending or rejected request are skipped. Results are
+    written batch_size users per transaction; returns the number of users
+    scored.
+    """
+    conn = get_db_connection(db_path)
+    graph = friend_graph.get_graph(conn, db_path)
+    users = conn.execute("""
+        SELECT id, major, campus, study_level, interests FROM users
+        WHERE is_active = 1
+        ORDER BY last_login IS NULL, last_login DESC
+    """).fetchall()
+    excluded = {}
+    for user_id_1, user_id_2 in conn.execute(
+            "SELECT user_id_1, user_id_2 FROM friendships WHERE status != 'accepted'"):
+        excluded.setdefault(user_id_1, set()).add(user_id_2)
+        excluded.setdefault(user_id_2, set()).add(user_id_1)
+    
+    profiles = {
+        user['id']: ((user['major'] or '').strip().lower(), (user['campus'] or '').strip().lower(),
+                     user['study_level'], _interest_set(user['interests']))
+        for user in users
+    }
+    by_major = _attribute_buckets(users, 'major', candidate_pool)
+    by_campus = _attribute_buckets(users, 'campus', candidate_pool)
+    
+    computed_at = time.time()
+    rows = []
+    batch_ids = []
+    for position, user in enumerate(users, 1):
+        user_id = user['id']
+        major, campus, level, interests = profiles[user_id]
+        friends = graph.friends(user_id)
+        
+        mutual = Counter()
+        for friend_id in friends:
+            mutual.update(graph.friends(friend_id))
+        candidates = set(mutual)
+        candidates.update(by_major.get(major, ()))
+        candidates.update(by_campus.get(campus, ()))
+        candidates.discard(user_id)
+        candidates.difference_update(friends)
+        candidates.difference_update(excluded.get(user_id, ()))
+        
+        scored = []
+        for candidate_id in candidates:
+            profile = profiles.get(candidate_id)
+            if profile is None:
+                continue
+            reasons = []
+            score = 0.0
+            if mutual[candidate_id]:
+                score += weights['mutual_friends'] * mutual[candidate_id]
+                reasons.append('mutual_friends')
+            if major and profile[0] == major:
+                score += weights['major']
+                reasons.append('major')
+            if campus and profile[1] == campus:
+                score += weights['campus']
+                reasons.append('campus')
+            if level and profile[2] == level:
+                score += weights['study_level']
+                reasons.append('study_level')
+            if interests and profile[3]:
+                shared = len(interests & profile[3])
+                if shared:
+                    score += weights['interests'] * shared / len(interests | profile[3])
+                    reasons.append('interests')
+            if score > 0:
+                scored.append((score, candidate_id, mutual[candidate_id], ','.join(reasons)))
+        
+        rows.extend(
+            (user_id, candidate_id, score, mutual_count, reasons, computed_at)
+            for score, candidate_id, mutual_count, reasons in heapq.nlargest(top_k, scored)
+        )
+        batch_ids.append(user_id)
+        if len(batch_ids) == batch_size or position == len(users):
+            conn.execute("""
+                DELETE FROM friend_suggestions WHERE user_id IN (SELECT value FROM json_each(?))
+            """, (json.dumps(batch_ids),))
+            conn.executemany("""
+                INSERT INTO friend_suggestions
+                    (user_id, suggested_id, score, mutual_count, reasons, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+            rows = []
+            batch_ids = []
+    
+    conn.execute("""
+        DELETE FROM friend_suggestions
+        WHERE user_id NOT IN (SELECT id FROM users WHERE is_active = 1)
+    """)
+    conn.commit()
+    conn.close()
+    return len(users)
+
+def get_friend_suggestions(db_path, user_id, limit=10):
+    """Get precomputed friend suggestions, skipping anyone befriended or requested since"""
+    conn = get_db_connection(db_path)
+    suggestions = conn.execute("""
+        SELECT u.id, u.username, u.profile_picture, u.major, u.study_level, u.campus,
+               s.score, s.mutual_count, s.reasons
+        FROM friend_suggestions s
+        JOIN users u ON u.id = s.suggested_id
+        WHERE s.user_id = ? AND u.is_active = 1
+          AND NOT EXISTS (SELECT 1 FROM friendships f
+                          WHERE f.user_id_1 = s.user_id AND f.user_id_2 = s.suggested_id)
+          AND NOT EXISTS (SELECT 1 FROM friendships f
+                          WHERE f.user_id_1 = s.suggested_id AND f.user_id_2 = s.user_id)
+        ORDER BY s.score DESC
+        LIMIT ?
+    """, (user_id, limit)).fetchall()
+    conn.close()
+    return [
+        dict(suggestion, reasons=suggestion['reasons'].split(',') if suggestion['reasons'] else [])
+        for suggestion in suggestions
+    ]
+
 # ==================== UTILITY FUNCTIONS ====================
 
+def reconcile_counters(db_path):
+    """Recompute like/comment and unread counters from the source tables.
+
+    Repairs drift left by crashes or manual edits. Returns the number of
+    posts, comments and users whose counters were wrong.
+    """
+    conn = get_db_connection(db_path)
+    posts_fixed = conn.execute("""
+        UPDATE posts SET
+            like_count = (SELECT COUNT(*) FROM likes WHERE post_id = posts.id),
+            comment_count = (SELECT COUNT(*) FROM comments WHERE post_id = posts.id)
+        WHERE like_count != (SELECT COUNT(*) FROM likes WHERE post_id = posts.id)
+           OR comment_count != (SELECT COUNT(*) FROM comments WHERE post_id = posts.id)
+    """).rowcount
+    comments_fixed = conn.execute("""
+        UPDATE comments SET
+            like_count = (SELECT COUNT(*) FROM likes WHERE comment_id = comments.id)
+        WHERE like_count != (SELECT COUNT(*) FROM likes WHERE comment_id = comments.id)
+    """).rowcount
+    users_fixed = conn.execute("""
+        INSERT OR REPLACE INTO user_counters (user_id, unread_messages, unread_notifications)
+        SELECT u.id, actual.unread_messages, actual.unread_notifications
+        FROM users u
+        JOIN (
+            SELECT u2.id AS user_id,
+                   (SELECT COUNT(*) FROM messages WHERE receiver_id = u2.id AND is_read = 0) AS unread_messages,
+                   (SELECT COUNT(*) FROM notifications WHERE user_id = u2.id AND is_read = 0) AS unread_notifications
+            FROM users u2
+        ) actual ON actual.user_id = u.id
+        LEFT JOIN user_counters c ON c.user_id = u.id
+        WHERE COALESCE(c.unread_messages, 0) != actual.unread_messages
+           OR COALESCE(c.unread_notifications, 0) != actual.unread_notifications
+    """).rowcount
+    conn.commit()
+    conn.close()
+    return {'posts': posts_fixed, 'comments': comments_fixed, 'users': users_fixed}
+
 def get_user_stats(db_path, user_id):
     """Get statistics for a user"""
     conn = get_db_connection(db_path)
@@ -638,10 +1621,7 @@ def get_user_stats(db_path, user_id):
         (user_id,)
     ).fetchone()['count']
     
-    stats['friend_count'] = conn.execute("""
-        SELECT COUNT(*) as count FROM friendships 
-        WHERE (user_id_1 = ? OR user_id_2 = ?) AND status = 'accepted'
-    """, (user_id, user_id)).fetchone()['count']
+    stats['friend_count'] = friend_graph.get_graph(conn, db_path).degree(user_id)
     
     stats['total_likes_received'] = conn.execute("""
         SELECT COUNT(*) as count FROM likes l
@@ -0,0 +1,300 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import db_pool
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Events replayed to a resuming client at most; older ones are skipped
+REPLAY_LIMIT = 100
+# Events fetched per poll
+POLL_BATCH = 1000
+# Seconds between pruning runs
+PRUNE_INTERVAL = 600
+
+# Only the bus thread prunes the events table, so nothing is written to it
+# unless the bus runs
+ENABLED = Config.EVENTS_ENABLED
+
+
+def configure(enabled=None):
+    """Turn event publishing on or off"""
+    global ENABLED
+    if enabled is not None:
+        ENABLED = enabled
+
+
+def publish(conn, user_id, kind, data):
+    """Append an event for user_id inside the caller's transaction.
+
+    Returns its id, or None when events are disabled.
+    """
+    if not ENABLED:
+        return None
+    return conn.execute(
+        "INSERT INTO events (user_id, kind, payload) VALUES (?, ?, ?)",
+        (user_id, kind, json.dumps(data))
+    ).lastrowid
+
+
+def replay(db_path, user_id, after_id, limit=REPLAY_LIMIT):
+    """Events for user_id newer than after_id, oldest first"""
+    conn = db_pool.acquire(db_path)
+    try:
+        rows = conn.execute("""
+            SELECT id, kind, payload FROM (
+                SELECT id, kind, payload FROM events
+                WHERE user_id = ? AND id > ?
+                ORDER BY id DESC LIMIT ?
+            ) ORDER BY id
+        """, (user_id, after_id, limit)).fetchall()
+    finally:
+        db_pool.release(conn)
+    return [(row['id'], row['kind'], row['payload']) for row in rows]
+
+
+def latest_event_id(db_path):
+    conn = db_pool.acquire(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+    finally:
+        db_pool.release(conn)
+
+
+class Subscription:
+    """One open stream: a small buffer plus a condition to wait on"""
+
+    def __init__(self, user_id, max_buffer):
+        self.user_id = user_id
+        self.events = deque(maxlen=max_buffer)
+        self.condition = threading.Condition()
+
+    def put(self, event):
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify()
+
+    def get(self, timeout):
+        """Wait up to timeout seconds and return the buffered events (maybe none)"""
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+
+class EventBus:
+    """Fans events from the events table out to this worker's open streams.
+
+    One thread per worker polls the table every poll_interval seconds, and
+    only while someone is subscribed, so idle clients cost a parked thread
+    and no queries. wake() polls immediately after a local write.
+    """
+
+    def __init__(self, db_path, poll_interval=Config.EVENTS_POLL_INTERVAL,
+                 max_subscribers=Config.EVENTS_MAX_SUBSCRIBERS,
+                 retention_hours=Config.EVENTS_RETENTION_HOURS):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.retention_hours = retention_hours
+        self._subscribers = {}  # user_id -> set of Subscription
+        self._count = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._last_prune = 0.0
+
+    # ---------- subscribers ----------
+
+    def subscribe(self, user_id, max_buffer=REPLAY_LIMIT):
+        """Register a stream; returns None when the worker is at max_subscribers"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            if self._last_id is None:
+                # First listener: poll from here on; older events come from replay()
+                self._last_id = latest_event_id(self.db_path)
+            subscription = Subscription(user_id, max_buffer)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._count -= 1
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        return self._count
+
+    # ---------- polling ----------
+
+    def wake(self):
+        self._wake.set()
+
+    def poll(self):
+        """Deliver events written since the last poll; returns how many were delivered"""
+        with self._lock:
+            if not self._count:
+                # Nobody listening: skip the query, subscribe() restarts from the newest event
+                self._last_id = None
+                return 0
+            last_id = self._last_id
+        
+        conn = db_pool.acquire(self.db_path)
+        try:
+            rows = conn.execute("""
+                SELECT id, user_id, kind, payload FROM events WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, POLL_BATCH)).fetchall()
+        finally:
+            db_pool.release(conn)
+        
+        delivered = 0
+        with self._lock:
+            for row in rows:
+                for subscription in self._subscribers.get(row['user_id'], ()):
+                    subscription.put((row['id'], row['kind'], row['payload']))
+                    delivered += 1
+            if rows and self._last_id is not None:
+                self._last_id = rows[-1]['id']
+        return delivered
+
+    def prune(self):
+        """Delete events older than retention_hours"""
+        conn = db_pool.acquire(self.db_path)
+        try:
+            conn.execute("DELETE FROM events WHERE created_at < datetime('now', ?)",
+                         (f'-{self.retention_hours} hours',))
+            conn.commit()
+        finally:
+            db_pool.release(conn)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.poll()
+                if time.monotonic() - self._last_prune >= PRUNE_INTERVAL:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except Exception:
+                logger.exception("Event poll failed")
+
+    def start(self):
+        """Start the polling thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-bus', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# The worker's bus, set by init_app(); db_utils wakes it after a publish
+bus = None
+
+
+def wake():
+    if bus is not None:
+        bus.wake()
+
+
+def format_event(event_id, kind, payload):
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+
+
+class Stream:
+    """Response body for one SSE client.
+
+    The server calls close() even when it never iterates the body (a HEAD
+    request, a client gone before the first chunk), and closing an
+    unstarted generator skips its finally, so the subscription is
+    released here instead.
+    """
+
+    def __init__(self, bus, subscription, chunks):
+        self.bus = bus
+        self.subscription = subscription
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        try:
+            self._chunks.close()
+        finally:
+            self.bus.unsubscribe(self.subscription)
+
+
+def stream(user_id, last_event_id, heartbeat_interval, max_seconds, retry_ms):
+    """Return the SSE response body for one client (None when at capacity).
+
+    Subscribes first and then replays anything after last_event_id, so no
+    event falls between the two. Sends a comment line every
+    heartbeat_interval seconds and ends after max_seconds; the browser
+    reconnects with Last-Event-ID and picks up where it left off.
+    """
+    subscription = bus.subscribe(user_id)
+    if subscription is None:
+        return None
+    
+    def generate():
+        yield f"retry: {retry_ms}\n\n"
+        sent = last_event_id
+        if sent is None:
+            sent = latest_event_id(bus.db_path)
+        else:
+            for event in replay(bus.db_path, user_id, sent):
+                yield format_event(*event)
+                sent = event[0]
+        
+        deadline = time.monotonic() + max_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = subscription.get(min(heartbeat_interval, remaining))
+            fresh = [event for event in events if event[0] > sent]
+            if fresh:
+                for event in fresh:
+                    yield format_event(*event)
+                sent = fresh[-1][0]
+            else:
+                yield ": keep-alive\n\n"
+    
+    return Stream(bus, subscription, generate())
+
+
+def init_app(app):
+    """Create this worker's bus when EVENTS_ENABLED is set (app.py starts it)"""
+    global bus
+    configure(enabled=bool(app.config.get('EVENTS_ENABLED')))
+    if not ENABLED:
+        return
+    bus = EventBus(
+        app.config['DATABASE'],
+        poll_interval=app.config['EVENTS_POLL_INTERVAL'],
+        max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS'],
+        retention_hours=app.config['EVENTS_RETENTION_HOURS']
+    )
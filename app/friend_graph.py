@@ -0,0 +1,154 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+from change_log import ChangeLog
+from config import Config
+
+SYNC_INTERVAL = Config.FRIEND_GRAPH_SYNC_INTERVAL
+
+# Typecode for adjacency arrays: 4 bytes per friendship endpoint
+TYPECODE = 'i'
+
+_EMPTY = array(TYPECODE)
+
+_log = ChangeLog('friendship_changes', ('user_id_1', 'user_id_2', 'is_friend'))
+
+_lock = threading.Lock()
+_graphs = {}  # db_path -> FriendGraph
+
+
+def _contains(sorted_ids, user_id):
+    i = bisect_left(sorted_ids, user_id)
+    return i < len(sorted_ids) and sorted_ids[i] == user_id
+
+
+class FriendGraph:
+    """Accepted friendships as one sorted integer array per user"""
+
+    def __init__(self, adjacency=None, seq=0):
+        self.adjacency = adjacency or {}
+        self.follower = _log.follower(seq)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, conn):
+        """Build the graph from the friendships table"""
+        seq = _log.head(conn)
+        lists = {}
+        for user_id_1, user_id_2 in conn.execute(
+                "SELECT user_id_1, user_id_2 FROM friendships WHERE status = 'accepted'"):
+            lists.setdefault(user_id_1, []).append(user_id_2)
+            lists.setdefault(user_id_2, []).append(user_id_1)
+        adjacency = {user_id: array(TYPECODE, sorted(set(ids))) for user_id, ids in lists.items()}
+        return cls(adjacency, seq)
+
+    def friends(self, user_id):
+        return self.adjacency.get(user_id, _EMPTY)
+
+    def are_friends(self, user_id_1, user_id_2):
+        a, b = self.friends(user_id_1), self.friends(user_id_2)
+        if len(a) > len(b):
+            a, user_id_2 = b, user_id_1
+        return _contains(a, user_id_2)
+
+    def degree(self, user_id):
+        return len(self.friends(user_id))
+
+    def mutual_friends(self, user_id_1, user_id_2):
+        """Sorted list of users who are friends with both"""
+        small, large = self.friends(user_id_1), self.friends(user_id_2)
+        if len(small) > len(large):
+            small, large = large, small
+        if not small:
+            return []
+        if len(small) * 8 < len(large):
+            return [u for u in small if _contains(large, u)]
+        return sorted(set(small).intersection(large))
+
+    def mutual_count(self, user_id_1, user_id_2):
+        return len(self.mutual_friends(user_id_1, user_id_2))
+
+    def add(self, user_id_1, user_id_2):
+        with self.lock:
+            for a, b in ((user_id_1, user_id_2), (user_id_2, user_id_1)):
+                ids = self.adjacency.setdefault(a, array(TYPECODE))
+                if not _contains(ids, b):
+                    insort(ids, b)
+
+    def remove(self, user_id_1, user_id_2):
+        with self.lock:
+            for a, b in ((user_id_1, user_id_2), (user_id_2, user_id_1)):
+                ids = self.adjacency.get(a)
+                if ids is None:
+                    continue
+                i = bisect_left(ids, b)
+                if i < len(ids) and ids[i] == b:
+                    del ids[i]
+                if not ids:
+                    del self.adjacency[a]
+
+    def memory_bytes(self):
+        """Approximate size of the adjacency arrays"""
+        return sum(ids.buffer_info()[1] * ids.itemsize for ids in self.adjacency.values())
+
+
+def configure(sync_interval=None):
+    """Change graph settings and drop loaded graphs"""
+    global SYNC_INTERVAL
+    if sync_interval is not None:
+        SYNC_INTERVAL = sync_interval
+    clear()
+
+
+def get_graph(conn, db_path):
+    """Return the friend graph for db_path, loading or syncing it as needed"""
+    with _lock:
+        graph = _graphs.get(db_path)
+        if graph is None:
+            graph = _graphs[db_path] = FriendGraph.load(conn)
+            return graph
+    if not _sync(conn, graph):
+        with _lock:
+            graph = _graphs[db_path] = FriendGraph.load(conn)
+    return graph
+
+
+def _sync(conn, graph):
+    """Replay friendship changes made since the last poll; False if a reload is needed"""
+    changes = graph.follower.poll(conn, SYNC_INTERVAL)
+    if changes is None:
+        return False
+    for user_id_1, user_id_2, is_friend in changes:
+        if is_friend:
+            graph.add(user_id_1, user_id_2)
+        else:
+            graph.remove(user_id_1, user_id_2)
+    return True
+
+
+def log_change(conn, user_id_1, user_id_2, is_friend):
+    """Record an accepted or removed friendship inside the writing transaction"""
+    _log.append(conn, user_id_1, user_id_2, 1 if is_friend else 0)
+
+
+def apply_change(db_path, user_id_1, user_id_2, is_friend):
+    """Update this worker's graph right after the change has committed"""
+    graph = _graphs.get(db_path)
+    if graph is None:
+        return
+    if is_friend:
+        graph.add(user_id_1, user_id_2)
+    else:
+        graph.remove(user_id_1, user_id_2)
+
+
+def clear():
+    """Forget every loaded graph"""
+    with _lock:
+        _graphs.clear()
+
+
+def init_app(app):
+    """Configure the friend graph from the Flask app config"""
+    configure(sync_interval=app.config.get('FRIEND_GRAPH_SYNC_INTERVAL'))
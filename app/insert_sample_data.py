@@ -1,72 +1,95 @@
-from db_utils import get_db_connection
+import sys
 
-def insert_sample_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
+from config import Config
+import db_utils as db
 
+# Every sample account uses this password
+SAMPLE_PASSWORD = 'password123'
+
+
+def insert_sample_data(db_path):
+    """Insert a small demo data set into a migrated database.
+
+    Goes through the regular write functions so counters, timelines and
+    hashtags stay consistent. For production-sized data sets use
+    benchmarks/generate_dataset.py instead.
+    """
     # USERS
     users = [
-        (1, 'odin01', 'Computer Science', 'Gaming, AI'),
-        (2, 'kellyS', 'Mechanical Engineering', 'Design, CAD'),
-        (3, 'max123', 'Data Science', 'Machine Learning'),
-        (4, 'stureT', 'IT', 'Coding, Linux'),
-        (5, 'lena99', 'Biology', 'Nature'),
-        (6, 'emmaX', 'Economics', 'Finance, Books'),
-        (7, 'alex10', 'Physics', 'Astronomy'),
-        (8, 'saraD', 'Mathematics', 'Puzzles'),
-        (9, 'chrisB', 'Cybersecurity', 'Networks'),
-        (10, 'tinaV', 'Architecture', 'Drawing')
+        ('odin01', 'Computer Science', 'Gaming, AI'),
+        ('kellyS', 'Mechanical Engineering', 'Design, CAD'),
+        ('max123', 'Data Science', 'Machine Learning'),
+        ('stureT', 'IT', 'Coding, Linux'),
+        ('lena99', 'Biology', 'Nature'),
+        ('emmaX', 'Economics', 'Finance, Books'),
+        ('alex10', 'Physics', 'Astronomy'),
+        ('saraD', 'Mathematics', 'Puzzles'),
+        ('chrisB', 'Cybersecurity', 'Networks'),
+        ('tinaV', 'Architecture', 'Drawing')
     ]
-    cur.executemany("INSERT INTO Users (id, username, major, interests) VALUES (?, ?, ?, ?);", users)
+    user_ids = []
+    for username, major, interests in users:
+        user_id = db.create_user(db_path, username, f"{username.lower()}@uis.no", SAMPLE_PASSWORD,
+                                 major=major, interests=interests, study_level='Bachelor',
+                                 campus='Ullandhaug')
+        if user_id is None:
+            print(f" Skipping existing user {username}")
+            user_id = db.get_user_by_username(db_path, username)['id']
+        user_ids.append(user_id)
 
-    # POSTS
+    # POSTS (author index, content)
     posts = [
-        (1, 1, 'Hello world! First post.', '2025-04-01 10:00'),
-        (2, 2, 'Anyone up for a study group in mechanics?', '2025-04-01 11:00'),
-        (3, 3, 'Check out my ML model results!', '2025-04-02 09:30'),
-        (4, 4, 'Linux is life ', '2025-04-02 12:45'),
-        (5, 5, 'Biology notes for the exam ', '2025-04-03 08:15'),
-        (6, 6, 'Which book to read next?', '2025-04-03 13:20'),
-        (7, 7, 'My physics homework is wild ', '2025-04-04 14:05'),
-        (8, 8, 'Cool math riddle: ...', '2025-04-04 16:00'),
-        (9, 9, 'Network attack trends', '2025-04-05 09:45'),
-        (10, 10, 'Architecture sketch of campus', '2025-04-05 17:00')
+        (0, 'Hello world! First post. #welcome'),
+        (1, 'Anyone up for a study group in mechanics? #studygroup'),
+        (2, 'Check out my ML model results! #machinelearning'),
+        (3, 'Linux is life #linux'),
+        (4, 'Biology notes for the exam #exams'),
+        (5, 'Which book to read next?'),
+        (6, 'My physics homework is wild #exams'),
+        (7, 'Cool math riddle: ...'),
+        (8, 'Network attack trends #security'),
+        (9, 'Architecture sketch of campus')
     ]
-    cur.executemany("INSERT INTO Posts (id, user_id, content, timestamp) VALUES (?, ?, ?, ?);", posts)
+    post_ids = [db.create_post(db_path, user_ids[author], content) for author, content in posts]
 
-    # COMMENTS
+    # COMMENTS (post index, author index, content)
     comments = [
-        (1, 1, 2, 'Welcome to UIS-Connect!', '2025-04-01 10:05'),
-        (2, 2, 3, 'I’m in for the study group!', '2025-04-01 11:30'),
-        (3, 3, 1, 'Nice work on that model.', '2025-04-02 09:45'),
-        (4, 4, 5, 'Totally agree!', '2025-04-02 13:00'),
-        (5, 5, 6, 'Thanks for sharing.', '2025-04-03 08:30'),
-        (6, 6, 8, 'Try "Rich Dad Poor Dad".', '2025-04-03 14:00'),
-        (7, 7, 9, 'Physics gang ', '2025-04-04 14:30'),
-        (8, 8, 10, 'Love that puzzle!', '2025-04-04 16:15'),
-        (9, 9, 4, 'Good stuff.', '2025-04-05 10:00'),
-        (10, 10, 7, 'That’s beautiful!', '2025-04-05 17:30')
+        (0, 1, 'Welcome to UIS-Connect!'),
+        (1, 2, 'I’m in for the study group!'),
+        (2, 0, 'Nice work on that model.'),
+        (3, 4, 'Totally agree!'),
+        (4, 5, 'Thanks for sharing.'),
+        (5, 7, 'Try "Rich Dad Poor Dad".'),
+        (6, 8, 'Physics gang'),
+        (7, 9, 'Love that puzzle!'),
+        (8, 3, 'Good stuff.'),
+        (9, 6, 'That’s beautiful!')
     ]
-    cur.executemany("INSERT INTO Comments (id, post_id, user_id, content, timestamp) VALUES (?, ?, ?, ?, ?);", comments)
+    for post, author, content in comments:
+        db.add_comment(db_path, post_ids[post], user_ids[author], content)
 
-    # LIKES
+    # LIKES (post index, user index)
     likes = [
-        (1, 1, 2), (2, 1, 3), (3, 2, 4), (4, 3, 5), (5, 3, 6),
-        (6, 4, 7), (7, 5, 8), (8, 6, 9), (9, 7, 10), (10, 8, 1)
+        (0, 1), (0, 2), (1, 3), (2, 4), (2, 5),
+        (3, 6), (4, 7), (5, 8), (6, 9), (7, 0)
     ]
-    cur.executemany("INSERT INTO Likes (id, post_id, user_id) VALUES (?, ?, ?);", likes)
+    for post, user in likes:
+        db.toggle_like_post(db_path, post_ids[post], user_ids[user])
 
-    # FRIENDSHIPS
+    # FRIENDSHIPS (requester index, recipient index), all accepted
     friendships = [
-        (1, 1, 2), (2, 1, 3), (3, 2, 4), (4, 3, 5), (5, 4, 6),
-        (6, 5, 7), (7, 6, 8), (8, 7, 9), (9, 8, 10), (10, 9, 1)
+        (0, 1), (0, 2), (1, 3), (2, 4), (3, 5),
+        (4, 6), (5, 7), (6, 8), (7, 9), (8, 0)
     ]
-    cur.executemany("INSERT INTO Friendships (id, user_id_1, user_id_2) VALUES (?, ?, ?);", friendships)
+    for requester, recipient in friendships:
+        if not db.send_friend_request(db_path, user_ids[requester], user_ids[recipient]):
+            continue
+        for friend_request in db.get_friend_requests(db_path, user_ids[recipient]):
+            if friend_request['user_id'] == user_ids[requester]:
+                db.respond_to_friend_request(db_path, friend_request['id'], 'accepted')
 
-    conn.commit()
-    conn.close()
     print(" Sample data inserted successfully.")
 
 # Run it
 if __name__ == '__main__':
-    insert_sample_data()
+    insert_sample_data(sys.argv[1] if len(sys.argv) > 1 else Config.DATABASE)
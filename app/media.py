@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import url_for
+from config import Config
+
+try:
+    from PIL import Image
+except ImportError:  # variants are optional; templates fall back to the original
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Defaults used until init_app() / configure() is called (e.g. from scripts)
+UPLOAD_FOLDER = Config.UPLOAD_FOLDER
+TMP_FOLDER = Config.UPLOAD_TMP_FOLDER
+VARIANTS = dict(Config.UPLOAD_VARIANTS)
+WORKERS = Config.THUMBNAIL_WORKERS
+
+# Formats Pillow can shrink without losing animation
+RESIZABLE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+
+_CHUNK_SIZE = 64 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+_known_variants = set()
+KNOWN_VARIANTS_MAX = 100000
+
+
+def configure(upload_folder=None, tmp_folder=None, variants=None, workers=None):
+    """Change upload settings"""
+    global UPLOAD_FOLDER, TMP_FOLDER, VARIANTS, WORKERS
+    if upload_folder is not None:
+        UPLOAD_FOLDER = upload_folder
+    if tmp_folder is not None:
+        TMP_FOLDER = tmp_folder
+    if variants is not None:
+        VARIANTS = dict(variants)
+    if workers is not None:
+        WORKERS = workers
+    _known_variants.clear()
+
+
+def content_name(digest, extension):
+    """Stored name for a file with this SHA-256, sharded by its first byte"""
+    return f"{digest[:2]}/{digest}.{extension}"
+
+
+def variant_name(name, variant):
+    stem, extension = os.path.splitext(name)
+    return f"{stem}_{variant}{extension}"
+
+
+def store_upload(file, upload_folder=None):
+    """Save an uploaded file under its content hash and return the stored name.
+
+    The upload is streamed to a temporary file while hashing, then renamed
+    into place, so identical uploads share one file. Variants of new files
+    are generated in the background.
+    """
+    upload_folder = upload_folder or UPLOAD_FOLDER
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    digest = hashlib.sha256()
+    
+    os.makedirs(TMP_FOLDER, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=TMP_FOLDER, prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        name = content_name(digest.hexdigest(), extension)
+        path = os.path.join(upload_folder, name)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    schedule_variants(name, upload_folder)
+    return name
+
+
+def _variant_targets(name, upload_folder):
+    return {
+        os.path.join(upload_folder, variant_name(name, variant)): size
+        for variant, size in VARIANTS.items()
+    }
+
+
+def make_variants(source_path, targets, tmp_folder):
+    """Write downscaled copies of an image ({path: max_side}); runs in a worker process"""
+    os.makedirs(tmp_folder, exist_ok=True)
+    written = []
+    with Image.open(source_path) as image:
+        image.load()
+        for path, size in sorted(targets.items(), key=lambda target: -target[1]):
+            if max(image.size) <= size:
+                continue  # already small enough, templates use the original
+            variant = image.copy()
+            variant.thumbnail((size, size))
+            if path.lower().endswith(('.jpg', '.jpeg')) and variant.mode not in ('RGB', 'L'):
+                variant = variant.convert('RGB')
+            fd, tmp_path = tempfile.mkstemp(dir=tmp_folder, prefix='variant-')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    variant.save(out, format=image.format, optimize=True, quality=85)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            written.append(path)
+    return written
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Not fork: the parent runs cache-sync, write-behind, event and
+            # hashing threads, and a forked child could inherit a held lock.
+            # Spawn re-runs the launching script in each child, which is why
+            # app.py starts its threads on the first request, not at import.
+            _executor = ProcessPoolExecutor(max_workers=WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _log_failure(future, name):
+    error = future.exception()
+    if error is not None:
+        logger.error("Generating variants of %s failed", name,
+                     exc_info=(type(error), error, error.__traceback__))
+
+
+def schedule_variants(name, upload_folder=None):
+    """Queue variant generation for a stored upload; returns the future or None"""
+    extension = name.rsplit('.', 1)[-1].lower()
+    if Image is None or not VARIANTS or extension not in RESIZABLE_EXTENSIONS:
+        return None
+    upload_folder = upload_folder or UPLOAD_FOLDER
+    future = _get_executor().submit(
+        make_variants, os.path.join(upload_folder, name), _variant_targets(name, upload_folder),
+        TMP_FOLDER
+    )
+    future.add_done_callback(lambda done: _log_failure(done, name))
+    return future
+
+
+def generate_missing_variants(upload_folder=None):
+    """Generate variants for every stored upload that lacks them; returns the count written"""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed, cannot generate image variants")
+    upload_folder = upload_folder or UPLOAD_FOLDER
+    variant_suffixes = tuple(f"_{variant}." for variant in VARIANTS)
+    written = 0
+    for root, _, files in os.walk(upload_folder):
+        for filename in files:
+            if filename.startswith('.') or any(s in filename for s in variant_suffixes):
+                continue
+            if filename.rsplit('.', 1)[-1].lower() not in RESIZABLE_EXTENSIONS:
+                continue
+            name = os.path.relpath(os.path.join(root, filename), upload_folder)
+            missing = {path: size for path, size in _variant_targets(name, upload_folder).items()
+                       if not os.path.exists(path)}
+            if missing:
+                written += len(make_variants(os.path.join(root, filename), missing, TMP_FOLDER))
+    return written
+
+
+def upload_url(name, variant=None):
+    """URL for an uploaded file, preferring the given variant once it exists"""
+    if variant and variant in VARIANTS:
+        candidate = variant_name(name, variant)
+        if candidate in _known_variants:
+            name = candidate
+        elif os.path.exists(os.path.join(UPLOAD_FOLDER, candidate)):
+            if len(_known_variants) >= KNOWN_VARIANTS_MAX:
+                _known_variants.clear()
+            _known_variants.add(candidate)
+            name = candidate
+    return url_for('static', filename='uploads/' + name)
+
+
+def init_app(app):
+    """Configure uploads from the Flask app config and expose upload_url() to templates"""
+    configure(
+        upload_folder=app.config.get('UPLOAD_FOLDER'),
+        tmp_folder=app.config.get('UPLOAD_TMP_FOLDER'),
+        variants=app.config.get('UPLOAD_VARIANTS'),
+        workers=app.config.get('THUMBNAIL_WORKERS')
+    )
+    app.add_template_global(upload_url)
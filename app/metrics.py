@@ -0,0 +1,313 @@
+import hmac
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, abort, g, has_request_context, request
+from config import Config
+import db_pool
+import page_cache
+import password_hasher
+import user_cache
+
+logger = logging.getLogger(__name__)
+
+# Defaults used until init_app() / configure() is called (e.g. from scripts)
+SLOW_QUERY_MS = Config.SLOW_QUERY_MS
+SLOW_QUERY_EXPLAIN = Config.SLOW_QUERY_EXPLAIN
+
+PREFIX = 'uisconnect_'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# First keyword of a statement -> kind label; anything else is 'other'
+QUERY_KINDS = {'select', 'insert', 'update', 'delete', 'replace', 'with', 'pragma'}
+EXPLAINABLE = {'select', 'insert', 'update', 'delete', 'replace', 'with'}
+
+_PLAN_CACHE_SIZE = 256
+
+_lock = threading.Lock()
+_metrics = []
+_plans = OrderedDict()
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, labels=(), value=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _label_text(self.labels, labels), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        _metrics.append(self)
+
+    def observe(self, labels, value):
+        with _lock:
+            series = self.values.get(labels)
+            if series is None:
+                # One count per bucket, then +Inf, sum
+                series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def samples(self):
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _label_text(self.labels + ('le',), labels + (bound,)), cumulative)
+            yield self.name + '_sum', _label_text(self.labels, labels), series[-1]
+            yield self.name + '_count', _label_text(self.labels, labels), cumulative
+
+
+http_requests = Counter('http_requests_total', 'HTTP requests by endpoint and status',
+                        ('endpoint', 'method', 'status'))
+http_latency = Histogram('http_request_duration_seconds', 'Request latency by endpoint',
+                         ('endpoint', 'method'))
+http_queries = Histogram('http_request_queries', 'SQL queries issued per request',
+                         ('endpoint',), COUNT_BUCKETS)
+http_sql_time = Histogram('http_request_sql_seconds', 'Time spent in SQL per request',
+                          ('endpoint',))
+sql_queries = Counter('sql_queries_total', 'SQL statements by calling function',
+                      ('function', 'kind'))
+sql_seconds = Counter('sql_query_seconds_total', 'Time spent in SQL statements by calling function',
+                      ('function',))
+sql_latency = Histogram('sql_query_duration_seconds', 'SQL statement latency (to first row)',
+                        ('kind',), QUERY_BUCKETS)
+sql_slow = Counter('sql_slow_queries_total', 'Statements slower than SLOW_QUERY_MS',
+                   ('function',))
+sql_commits = Histogram('sql_commit_duration_seconds',
+                        'COMMIT latency, including the WAL write and any fsync', (), QUERY_BUCKETS)
+sql_checkpoints = Histogram('sql_checkpoint_duration_seconds', 'WAL checkpoint latency',
+                            (), QUERY_BUCKETS)
+
+
+def configure(slow_query_ms=None, slow_query_explain=None):
+    """Change slow-query settings"""
+    global SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = slow_query_ms
+    if slow_query_explain is not None:
+        SLOW_QUERY_EXPLAIN = slow_query_explain
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _query_kind(sql):
+    words = sql.split(None, 1)
+    kind = words[0].lower() if words else ''
+    return kind if kind in QUERY_KINDS else 'other'
+
+
+def explain(conn, sql, parameters=()):
+    """EXPLAIN QUERY PLAN for sql as an indented tree, or None if it can't be explained"""
+    with _lock:
+        plan = _plans.get(sql)
+    if plan is not None:
+        return plan
+    try:
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error:
+        return None
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * (depth[node_id] + 1) + detail)
+    plan = '\n'.join(lines)
+    with _lock:
+        _plans[sql] = plan
+        if len(_plans) > _PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def _record(conn, sql, parameters, seconds):
+    """Account one statement to its caller, the current request and the slow log"""
+    # Frame 0 is this function, 1 the connection method, 2 its caller
+    caller = sys._getframe(2)
+    function = f"{caller.f_globals.get('__name__')}.{caller.f_code.co_name}"
+    kind = _query_kind(sql)
+
+    sql_queries.inc((function, kind))
+    sql_seconds.inc((function,), seconds)
+    sql_latency.observe((kind,), seconds)
+    if kind == 'pragma' and 'wal_checkpoint' in sql:
+        sql_checkpoints.observe((), seconds)
+
+    if has_request_context() and '_sql_queries' in g:
+        g._sql_queries += 1
+        g._sql_seconds += seconds
+
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        sql_slow.inc((function,))
+        plan = None
+        if SLOW_QUERY_EXPLAIN and kind in EXPLAINABLE and parameters is not None:
+            plan = explain(conn, sql, parameters)
+        logger.warning("Slow query (%.1f ms) in %s: %s%s", seconds * 1000, function,
+                       ' '.join(sql.split()), '\n' + plan if plan else '')
+
+
+class InstrumentedConnection(db_pool.PooledConnection):
+    """Pooled connection that times every statement and commit"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        _record(self, sql, parameters, time.perf_counter() - start)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        _record(self, sql, None, time.perf_counter() - start)
+        return cursor
+
+    def executescript(self, script):
+        start = time.perf_counter()
+        cursor = super().executescript(script)
+        _record(self, script, None, time.perf_counter() - start)
+        return cursor
+
+    def commit(self):
+        start = time.perf_counter()
+        super().commit()
+        sql_commits.observe((), time.perf_counter() - start)
+
+
+def _cache_gauges():
+    """Current user/page cache figures, read at scrape time"""
+    gauges = []
+    for cache, stats in (('user', user_cache.stats()), ('page', page_cache.stats())):
+        for key, value in stats.items():
+            kind = 'counter' if key in ('hits', 'misses', 'stores', 'evictions', 'expirations', 'invalidations') else 'gauge'
+            suffix = '_total' if kind == 'counter' else ''
+            gauges.append((f"{PREFIX}{cache}_cache_{key}{suffix}", kind, value))
+    return gauges
+
+
+def _hasher_gauges():
+    """Password hashing pool figures, read at scrape time"""
+    stats = password_hasher.stats()
+    return [
+        (f"{PREFIX}password_hashes_total", 'counter', stats['hashed']),
+        (f"{PREFIX}password_hash_seconds_total", 'counter', stats['seconds']),
+        (f"{PREFIX}password_hash_rejected_total", 'counter', stats['rejected']),
+        (f"{PREFIX}password_rehashes_total", 'counter', stats['rehashed']),
+        (f"{PREFIX}password_hash_in_flight", 'gauge', stats['in_flight']),
+    ]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+    for name, kind, value in _cache_gauges() + _hasher_gauges():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Drop every recorded value (for benchmarks and scripts)"""
+    with _lock:
+        for metric in _metrics:
+            metric.values.clear()
+        _plans.clear()
+
+
+def init_app(app):
+    """Instrument pooled connections, time requests and serve METRICS_PATH.
+
+    Does nothing when METRICS_ENABLED is off. Scrapes need the
+    METRICS_TOKEN bearer token; with no token set, METRICS_PATH is only
+    served in DEBUG. Call right after db_pool.init_app() so every pooled
+    connection is instrumented and request timing starts before the other
+    before_request hooks.
+    """
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    configure(
+        slow_query_ms=app.config.get('SLOW_QUERY_MS'),
+        slow_query_explain=app.config.get('SLOW_QUERY_EXPLAIN')
+    )
+    db_pool.configure(connection_class=InstrumentedConnection)
+    token = app.config.get('METRICS_TOKEN')
+    if not token and not app.debug:
+        logger.warning("METRICS_ENABLED without METRICS_TOKEN: %s will answer 404",
+                       app.config.get('METRICS_PATH', '/metrics'))
+
+    @app.before_request
+    def start_request_timer():
+        g._request_started = time.perf_counter()
+        g._sql_queries = 0
+        g._sql_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        http_requests.inc((endpoint, request.method, response.status_code))
+        http_latency.observe((endpoint, request.method), time.perf_counter() - started)
+        http_queries.observe((endpoint,), g._sql_queries)
+        http_sql_time.observe((endpoint,), g._sql_seconds)
+        return response
+
+    def metrics_view():
+        if not token:
+            if not app.debug:
+                abort(404)
+        elif not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            abort(401)
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', metrics_view)
@@ -0,0 +1,67 @@
+import os
+import re
+import sqlite3
+
+from config import Config
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(Config.BASE_DIR), 'database', 'migrations')
+
+_FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+def list_migrations(migrations_dir=MIGRATIONS_DIR):
+    """Return (version, name, path) for every migration file, oldest first"""
+    migrations = []
+    for filename in os.listdir(migrations_dir):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2),
+                               os.path.join(migrations_dir, filename)))
+    return sorted(migrations)
+
+
+def applied_versions(conn):
+    """Return the set of migration versions already applied"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def apply_migrations(db_path, migrations_dir=MIGRATIONS_DIR, pragmas=None):
+    """Apply pending migrations in order, each in its own transaction.
+
+    Works on an existing database in place; a failing migration is rolled
+    back and the error re-raised, leaving earlier migrations applied.
+    pragmas ({name: value}) are set on the migration connection first, e.g.
+    a bigger cache for backfills. Returns the list of (version, name) that
+    were applied.
+    """
+    conn = sqlite3.connect(db_path)
+    applied = []
+    try:
+        for name, value in (pragmas or {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        done = applied_versions(conn)
+        for version, name, path in list_migrations(migrations_dir):
+            if version in done:
+                continue
+            with open(path, 'r') as f:
+                sql = f.read()
+            try:
+                conn.executescript(
+                    "BEGIN;\n" + sql +
+                    f"\nINSERT INTO schema_migrations (version, name) VALUES ({version}, '{name}');\nCOMMIT;"
+                )
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            applied.append((version, name))
+    finally:
+        conn.close()
+    return applied
@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, request, session
+
+import db_pool
+from change_log import ChangeLog
+from config import Config
+
+MAX_BYTES = Config.PAGE_CACHE_MAX_BYTES
+TTL = Config.PAGE_CACHE_TTL
+SYNC_INTERVAL = Config.PAGE_CACHE_SYNC_INTERVAL
+ENDPOINTS = frozenset(Config.PAGE_CACHE_ENDPOINTS)
+DATABASE = Config.DATABASE
+
+# Recently invalidated tags remembered to reject pages rendered before the write
+TAG_VERSIONS_MAX = 10000
+# Rough per-entry bookkeeping cost counted against MAX_BYTES
+ENTRY_OVERHEAD = 512
+
+# Response headers replayed on a hit
+_STORED_HEADERS = ('Content-Type', 'Content-Language', 'Vary')
+
+_log = ChangeLog('page_cache_invalidations', ('tag',))
+_follower = _log.follower()
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # request path -> (expires_at, status, headers, body, tags, size)
+_tag_index = {}           # tag -> set of request paths
+_tag_versions = {}        # tag -> version it was last invalidated at
+_state = {'bytes': 0, 'version': 0, 'floor': 0}
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'invalidations': 0}
+
+
+def configure(max_bytes=None, ttl=None, sync_interval=None, endpoints=None, database=None):
+    """Change cache settings; a max_bytes of 0 disables the cache"""
+    global MAX_BYTES, TTL, SYNC_INTERVAL, ENDPOINTS, DATABASE
+    if max_bytes is not None:
+        MAX_BYTES = max_bytes
+    if ttl is not None:
+        TTL = ttl
+    if sync_interval is not None:
+        SYNC_INTERVAL = sync_interval
+    if endpoints is not None:
+        ENDPOINTS = frozenset(endpoints)
+    if database is not None:
+        DATABASE = database
+    clear()
+
+
+def _remove(key):
+    entry = _entries.pop(key, None)
+    if entry is None:
+        return
+    _state['bytes'] -= entry[5]
+    for name in entry[4]:
+        keys = _tag_index.get(name)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _tag_index[name]
+
+
+def evict(tags):
+    """Drop this worker's cached pages carrying any of the tags"""
+    with _lock:
+        _state['version'] += 1
+        if len(_tag_versions) >= TAG_VERSIONS_MAX:
+            _tag_versions.clear()
+            _state['floor'] = _state['version']
+        for name in tags:
+            _tag_versions[name] = _state['version']
+            for key in list(_tag_index.get(name, ())):
+                _remove(key)
+                _stats['invalidations'] += 1
+
+
+def invalidate(conn, tags):
+    """Record a write for every worker and evict it locally.
+
+    Call inside the writing transaction so the log rows commit with it.
+    """
+    tags = sorted(set(tags))
+    if not tags:
+        return
+    for name in tags:
+        _log.append(conn, name)
+    evict(tags)
+
+
+def _sync(conn):
+    """Evict pages invalidated by other workers since the last poll"""
+    changes = _follower.poll(conn, SYNC_INTERVAL)
+    if changes is None:
+        _drop_pages()
+    elif changes:
+        evict({name for (name,) in changes})
+
+
+def tag(*tags):
+    """Mark the page being rendered as depending on these tags"""
+    if '_page_cache_tags' in g:
+        g._page_cache_tags.update(tags)
+
+
+def tag_posts(posts):
+    """Tag the page with every shown post and its author"""
+    for post in posts:
+        tag(f"post:{post['id']}", f"user:{post['user_id']}")
+
+
+def tag_comments(comments):
+    """Tag the page with every shown comment's author"""
+    tag(*{f"user:{comment['user_id']}" for comment in comments})
+
+
+def _cacheable():
+    return (MAX_BYTES and request.method == 'GET' and request.endpoint in ENDPOINTS
+            and 'user_id' not in session and '_flashes' not in session)
+
+
+def serve_cached_page():
+    """before_request hook: answer anonymous requests from the cache"""
+    if not _cacheable():
+        return None
+    
+    _sync(db_pool.get_connection(DATABASE))
+    key = request.full_path
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry[0] <= now:
+            _remove(key)
+            entry = None
+        if entry:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+            g._page_cache_key = key
+            g._page_cache_tags = set()
+            g._page_cache_version = _state['version']
+            return None
+    
+    response = current_app.response_class(entry[3], status=entry[1], headers=entry[2])
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+
+def store_page(response):
+    """after_request hook: keep rendered anonymous pages"""
+    key = g.pop('_page_cache_key', None)
+    if key is None:
+        return response
+    tags = g.pop('_page_cache_tags')
+    if (response.status_code != 200 or response.direct_passthrough
+            or session.modified or 'Set-Cookie' in response.headers):
+        return response
+    
+    body = response.get_data()
+    headers = [(name, response.headers[name]) for name in _STORED_HEADERS if name in response.headers]
+    size = len(body) + len(key) + ENTRY_OVERHEAD
+    if size > MAX_BYTES // 8:
+        return response
+    
+    started = g._page_cache_version
+    with _lock:
+        # A write to one of the page's tags while it rendered makes it stale
+        if started < _state['floor'] or any(_tag_versions.get(name, 0) > started for name in tags):
+            return response
+        _remove(key)
+        _entries[key] = (time.monotonic() + TTL, response.status_code, headers, body,
+                         frozenset(tags), size)
+        _state['bytes'] += size
+        for name in tags:
+            _tag_index.setdefault(name, set()).add(key)
+        _stats['stores'] += 1
+        while _state['bytes'] > MAX_BYTES and _entries:
+            _remove(next(iter(_entries)))
+            _stats['evictions'] += 1
+    response.headers['X-Cache'] = 'MISS'
+    return response
+
+
+def _drop_pages():
+    with _lock:
+        _entries.clear()
+        _tag_index.clear()
+        _state['bytes'] = 0
+
+
+def clear():
+    """Empty the cache and forget the sync position"""
+    _drop_pages()
+    _follower.reset()
+
+
+def stats():
+    """Hit/miss counters plus current size"""
+    with _lock:
+        result = dict(_stats)
+        result['pages'] = len(_entries)
+        result['bytes'] = _state['bytes']
+    return result
+
+
+def init_app(app):
+    """Serve anonymous GETs of PAGE_CACHE_ENDPOINTS from the cache"""
+    configure(
+        max_bytes=app.config.get('PAGE_CACHE_MAX_BYTES'),
+        ttl=app.config.get('PAGE_CACHE_TTL'),
+        sync_interval=app.config.get('PAGE_CACHE_SYNC_INTERVAL'),
+        endpoints=app.config.get('PAGE_CACHE_ENDPOINTS'),
+        database=app.config.get('DATABASE')
+    )
+    app.before_request(serve_cached_page)
+    app.after_request(store_page)
@@ -0,0 +1,138 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import Config
+
+# Defaults used until init_app() / configure() is called (e.g. from scripts)
+METHOD = Config.PASSWORD_HASH_METHOD
+WORKERS = Config.PASSWORD_HASH_WORKERS
+MAX_PENDING = Config.PASSWORD_HASH_MAX_PENDING
+
+_executor = None
+_executor_lock = threading.Lock()
+_admission = None
+_method_prefix = None
+
+_stats_lock = threading.Lock()
+_stats = {'hashed': 0, 'rejected': 0, 'rehashed': 0, 'seconds': 0.0}
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing when MAX_PENDING hashes are already waiting"""
+
+
+def configure(method=None, workers=None, max_pending=None):
+    """Change the hash method and pool limits (takes effect for new work)"""
+    global METHOD, WORKERS, MAX_PENDING, _executor, _admission, _method_prefix
+    if method is not None:
+        METHOD = method
+    if workers is not None:
+        WORKERS = workers
+    if max_pending is not None:
+        MAX_PENDING = max_pending
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+        _admission = None
+    _method_prefix = None
+
+
+def _get_executor():
+    global _executor, _admission
+    with _executor_lock:
+        if _executor is None:
+            # hashlib's scrypt and pbkdf2_hmac release the GIL, so threads
+            # get real parallelism without pickling passwords to a process
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='password-hash')
+            _admission = threading.BoundedSemaphore(WORKERS + MAX_PENDING)
+        return _executor, _admission
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        with _stats_lock:
+            _stats['hashed'] += 1
+            _stats['seconds'] += time.perf_counter() - start
+
+
+def _run(function, *args):
+    """Run function on the hashing pool and wait for it, or raise HasherBusy"""
+    executor, admission = _get_executor()
+    if not admission.acquire(blocking=False):
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise HasherBusy()
+    try:
+        future = executor.submit(_timed, function, *args)
+    except BaseException:
+        admission.release()
+        raise
+    future.add_done_callback(lambda _: admission.release())
+    return future.result()
+
+
+def _method_prefix_for_config():
+    """METHOD as werkzeug writes it, with its default parameters filled in"""
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = generate_password_hash('', METHOD).split('$', 1)[0]
+    return _method_prefix
+
+
+def needs_rehash(password_hash):
+    """True when password_hash was made with other parameters than METHOD"""
+    return password_hash.split('$', 1)[0] != _method_prefix_for_config()
+
+
+def hash_password(password):
+    """Hash a new password with METHOD on the hashing pool"""
+    return _run(generate_password_hash, password, METHOD)
+
+
+def _verify(password_hash, password, method):
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+def verify_password(password_hash, password):
+    """Check password against password_hash on the hashing pool.
+
+    Returns (matches, new_hash). new_hash is set when the password matched
+    but the stored hash uses outdated parameters; it is computed in the
+    same pool slot so a login takes one admission either way.
+    """
+    matches, new_hash = _run(_verify, password_hash, password, METHOD)
+    if new_hash:
+        with _stats_lock:
+            _stats['rehashed'] += 1
+    return matches, new_hash
+
+
+def stats():
+    """Hashing pool figures (for metrics and benchmarks)"""
+    with _stats_lock:
+        result = dict(_stats)
+    with _executor_lock:
+        admission = _admission
+    # BoundedSemaphore keeps its free slots in _value
+    free = admission._value if admission is not None else WORKERS + MAX_PENDING
+    result['in_flight'] = WORKERS + MAX_PENDING - free
+    return result
+
+
+def init_app(app):
+    """Configure password hashing from the Flask app config"""
+    configure(
+        method=app.config.get('PASSWORD_HASH_METHOD'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS'),
+        max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING')
+    )
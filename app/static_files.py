@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import threading
+
+from flask import abort, current_app, request, send_file
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file as send_file_to_proxy
+
+from config import Config
+
+# Defaults used until init_app() / configure() is called (e.g. from scripts)
+FINGERPRINT = Config.STATIC_FINGERPRINT
+MAX_AGE = Config.STATIC_MAX_AGE
+IMMUTABLE_MAX_AGE = Config.STATIC_IMMUTABLE_MAX_AGE
+SENDFILE = Config.STATIC_SENDFILE
+ACCEL_PREFIX = Config.STATIC_ACCEL_PREFIX
+
+FINGERPRINT_LENGTH = 12
+SENDFILE_MODES = (None, 'x-sendfile', 'x-accel-redirect')
+
+# uploads/<ab>/<sha256>[_variant].<ext>, written by media.store_upload(); the
+# name already identifies the bytes, so these never need hashing
+_CONTENT_ADDRESSED = re.compile(r'^uploads/[0-9a-f]{2}/([0-9a-f]{64}(?:_[a-z]+)?)\.[a-z0-9]+$')
+
+_digest_lock = threading.Lock()
+_digests = {}  # path -> (mtime_ns, size, sha256 hexdigest)
+
+
+def configure(fingerprint=None, max_age=None, immutable_max_age=None, sendfile=False,
+              accel_prefix=None):
+    """Change static serving settings (sendfile=False leaves the mode unchanged)"""
+    global FINGERPRINT, MAX_AGE, IMMUTABLE_MAX_AGE, SENDFILE, ACCEL_PREFIX
+    if fingerprint is not None:
+        FINGERPRINT = fingerprint
+    if max_age is not None:
+        MAX_AGE = max_age
+    if immutable_max_age is not None:
+        IMMUTABLE_MAX_AGE = immutable_max_age
+    if sendfile is not False:
+        if sendfile not in SENDFILE_MODES:
+            raise ValueError(f"Unknown STATIC_SENDFILE mode: {sendfile}")
+        SENDFILE = sendfile
+    if accel_prefix is not None:
+        ACCEL_PREFIX = accel_prefix
+
+
+def file_digest(path, stat=None):
+    """SHA-256 of a file, recomputed only when its mtime or size changes"""
+    stat = stat or os.stat(path)
+    cached = _digests.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    with _digest_lock:
+        _digests[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def fingerprint(filename, static_folder=None):
+    """Short content hash for a static file, or None if it doesn't exist"""
+    path = safe_join(static_folder or current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return file_digest(path)[:FINGERPRINT_LENGTH]
+
+
+def add_fingerprint(endpoint, values):
+    """url_defaults hook: url_for('static', ...) gets ?v=<content hash>"""
+    if endpoint != 'static' or not FINGERPRINT or 'v' in values:
+        return
+    filename = values.get('filename')
+    if filename and not _CONTENT_ADDRESSED.match(filename):
+        version = fingerprint(filename)
+        if version:
+            values['v'] = version
+
+
+def serve_static(filename):
+    """Static view with strong ETags, ranges and far-future caching of versioned URLs"""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    
+    content_addressed = _CONTENT_ADDRESSED.match(filename)
+    if content_addressed:
+        etag = content_addressed.group(1)
+        immutable = True
+    else:
+        etag = file_digest(path)
+        immutable = request.args.get('v') == etag[:FINGERPRINT_LENGTH]
+    max_age = IMMUTABLE_MAX_AGE if immutable else MAX_AGE
+    
+    if SENDFILE:
+        # The proxy sends the bytes and handles Range itself; only answer 304s here
+        response = send_file_to_proxy(path, request.environ, use_x_sendfile=True,
+                                      etag=etag, max_age=max_age, conditional=False)
+        response.make_conditional(request.environ)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+        elif SENDFILE == 'x-accel-redirect':
+            response.headers.pop('X-Sendfile', None)
+            response.headers['X-Accel-Redirect'] = ACCEL_PREFIX + filename
+    else:
+        response = send_file(path, etag=etag, max_age=max_age, conditional=True)
+    
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Fingerprint static URLs and serve static files through serve_static()"""
+    configure(
+        fingerprint=app.config.get('STATIC_FINGERPRINT'),
+        max_age=app.config.get('STATIC_MAX_AGE'),
+        immutable_max_age=app.config.get('STATIC_IMMUTABLE_MAX_AGE'),
+        sendfile=app.config.get('STATIC_SENDFILE'),
+        accel_prefix=app.config.get('STATIC_ACCEL_PREFIX')
+    )
+    app.url_defaults(add_fingerprint)
+    app.view_functions['static'] = serve_static
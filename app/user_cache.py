@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+
+from change_log import ChangeLog
+from config import Config
+
+MAX_SIZE = Config.USER_CACHE_SIZE
+TTL = Config.USER_CACHE_TTL
+SYNC_INTERVAL = Config.USER_CACHE_SYNC_INTERVAL
+
+_log = ChangeLog('user_cache_log', ('user_id',))
+
+_lock = threading.Lock()
+_entries = OrderedDict()   # (db_path, user_id) -> (expires_at, record)
+_followers = {}            # db_path -> Follower of _log
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+
+def configure(max_size=None, ttl=None, sync_interval=None):
+    """Change cache settings; a max_size of 0 disables the cache"""
+    global MAX_SIZE, TTL, SYNC_INTERVAL
+    if max_size is not None:
+        MAX_SIZE = max_size
+    if ttl is not None:
+        TTL = ttl
+    if sync_interval is not None:
+        SYNC_INTERVAL = sync_interval
+    clear()
+
+
+def get(conn, db_path, user_id, loader):
+    """Return the cached record for user_id, calling loader(conn, user_id) on a miss"""
+    if not MAX_SIZE:
+        return loader(conn, user_id)
+    
+    _sync(conn, db_path)
+    key = (db_path, user_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry[0] > now:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return dict(entry[1]) if entry[1] else None
+        if entry:
+            del _entries[key]
+            _stats['expirations'] += 1
+        _stats['misses'] += 1
+    
+    record = loader(conn, user_id)
+    with _lock:
+        _entries[key] = (now + TTL, record)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_SIZE:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+    return dict(record) if record else None
+
+
+def invalidate(db_path, user_id):
+    """Drop one user from this worker's cache"""
+    with _lock:
+        if _entries.pop((db_path, user_id), None) is not None:
+            _stats['invalidations'] += 1
+
+
+def log_change(conn, db_path, user_id):
+    """Record a user write for every worker and evict it locally.
+
+    Call inside the writing transaction so the log entry commits with it.
+    """
+    _log.append(conn, user_id)
+    invalidate(db_path, user_id)
+
+
+def _sync(conn, db_path):
+    """Evict users changed by other workers since the last poll"""
+    follower = _followers.get(db_path)
+    if follower is None:
+        follower = _followers[db_path] = _log.follower()
+    changes = follower.poll(conn, SYNC_INTERVAL)
+    if changes is None:
+        _drop_database(db_path)
+        return
+    for user_id in {user_id for (user_id,) in changes}:
+        invalidate(db_path, user_id)
+
+
+def _drop_database(db_path):
+    with _lock:
+        for key in [key for key in _entries if key[0] == db_path]:
+            del _entries[key]
+
+
+def clear():
+    """Empty the cache and forget sync positions"""
+    with _lock:
+        _entries.clear()
+        _followers.clear()
+
+
+def stats():
+    """Hit/miss counters plus current size and hit ratio"""
+    with _lock:
+        result = dict(_stats)
+        result['size'] = len(_entries)
+    lookups = result['hits'] + result['misses']
+    result['hit_ratio'] = result['hits'] / lookups if lookups else 0.0
+    return result
+
+
+def init_app(app):
+    """Configure the cache from the Flask app config"""
+    configure(
+        max_size=app.config.get('USER_CACHE_SIZE'),
+        ttl=app.config.get('USER_CACHE_TTL'),
+        sync_interval=app.config.get('USER_CACHE_SYNC_INTERVAL')
+    )
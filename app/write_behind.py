@@ -0,0 +1,181 @@
+import atexit
+import logging
+import threading
+
+import db_utils as db
+
+logger = logging.getLogger(__name__)
+
+# Action names returned to the like/save routes, as (inactive, active)
+ACTIONS = {
+    'post_like': ('unliked', 'liked'),
+    'comment_like': ('unliked', 'liked'),
+    'post_save': ('unsaved', 'saved'),
+}
+
+
+class WriteBehindQueue:
+    """Coalescing write-behind queue for like/save toggles.
+
+    toggle() records the user's intended final state in memory and
+    returns immediately; a background thread writes everything pending
+    in one transaction every flush_interval seconds. Repeated toggles of
+    the same (kind, target, user) collapse into one write, and a toggle
+    that ends where the database already is costs nothing.
+
+    Pending state is per process: overlay_posts()/overlay_comments()
+    make this worker's reads reflect it until it is flushed.
+    """
+
+    def __init__(self, db_path, flush_interval=0.25, max_pending=1000):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        # (kind, target_id, user_id) -> [active, base] where base is the
+        # state the database had (or will have) before this entry
+        self._pending = {}
+        self._inflight = {}
+
+    # ---------- writing ----------
+
+    def toggle(self, kind, target_id, user_id):
+        """Flip the user's like/save state and return the action name"""
+        key = (kind, target_id, user_id)
+        with self._lock:
+            current = self._current_state(key)
+        if current is None:
+            # Not queued anywhere: read the committed state outside the lock
+            current = db.get_toggle_state(self.db_path, kind, target_id, user_id)
+        
+        with self._lock:
+            queued = self._current_state(key)
+            if queued is not None:
+                current = queued
+            entry = self._pending.get(key)
+            if entry:
+                entry[0] = not current
+            else:
+                self._pending[key] = [not current, current]
+            pending_count = len(self._pending)
+        
+        if pending_count >= self.max_pending:
+            self._wakeup.set()
+        return ACTIONS[kind][int(not current)]
+
+    def _current_state(self, key):
+        """Queued state for key (pending over in-flight), None if not queued; caller holds _lock"""
+        for layer in (self._pending, self._inflight):
+            if key in layer:
+                return layer[key][0]
+        return None
+
+    def flush(self):
+        """Write everything pending in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                batch = self._inflight
+            
+            states = [(kind, target_id, user_id, active)
+                      for (kind, target_id, user_id), (active, base) in batch.items()
+                      if active != base]
+            try:
+                if states:
+                    db.apply_toggle_states(self.db_path, states)
+            except Exception:
+                logger.exception("Write-behind flush of %d toggles failed, will retry", len(states))
+                with self._lock:
+                    # Keep newer toggles, put the rest back for the next flush
+                    for key, entry in batch.items():
+                        newer = self._pending.get(key)
+                        if newer:
+                            newer[1] = entry[1]
+                        else:
+                            self._pending[key] = entry
+                    self._inflight = {}
+                return 0
+            
+            with self._lock:
+                self._inflight = {}
+            return len(states)
+
+    # ---------- reading ----------
+
+    def state(self, kind, target_id, user_id):
+        """Queued state for one toggle, or None if nothing is pending"""
+        with self._lock:
+            return self._current_state((kind, target_id, user_id))
+
+    def _count_deltas(self, kind):
+        """Net like_count change per target that is queued but not yet committed"""
+        deltas = {}
+        with self._lock:
+            inflight = dict(self._inflight)
+            pending = dict(self._pending)
+        for (entry_kind, target_id, user_id), (active, base) in inflight.items():
+            if entry_kind == kind:
+                deltas[target_id] = deltas.get(target_id, 0) + int(active) - int(base)
+        for (entry_kind, target_id, user_id), (active, base) in pending.items():
+            if entry_kind == kind:
+                deltas[target_id] = deltas.get(target_id, 0) + int(active) - int(base)
+        return deltas
+
+    def overlay_posts(self, posts, user_id=None):
+        """Apply pending likes/saves to post dicts from db_utils (in place)"""
+        if not self._pending and not self._inflight:
+            return posts
+        deltas = self._count_deltas('post_like')
+        for post in posts:
+            if 'like_count' in post:
+                post['like_count'] = max(post['like_count'] + deltas.get(post['id'], 0), 0)
+            if user_id is None:
+                continue
+            liked = self.state('post_like', post['id'], user_id)
+            if liked is not None and 'user_liked' in post:
+                post['user_liked'] = int(liked)
+            saved = self.state('post_save', post['id'], user_id)
+            if saved is not None and 'user_saved' in post:
+                post['user_saved'] = int(saved)
+        return posts
+
+    def overlay_comments(self, comments):
+        """Apply pending comment likes to comment dicts from db_utils (in place)"""
+        if not self._pending and not self._inflight:
+            return comments
+        deltas = self._count_deltas('comment_like')
+        for comment in comments:
+            comment['like_count'] = max(comment['like_count'] + deltas.get(comment['id'], 0), 0)
+        return comments
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the background flusher and drain on interpreter exit"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.drain)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def drain(self):
+        """Stop the flusher and write everything still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        while self._pending:
+            if not self.flush():
+                break
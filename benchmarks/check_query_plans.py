@@ -0,0 +1,370 @@
+"""Query-plan regression check for every db_utils query.
+
+Drives every db_utils function, plus the inline query of the /users route,
+against a scratch copy of a generated dataset. Each distinct SQL statement
+is captured with its parameters at the connection and run through EXPLAIN
+QUERY PLAN. The check fails when a plan scans a large table (SCAN, with or
+without an index) or sorts through a temp B-tree, unless that step is
+allowlisted below for that function with the reason it is acceptable.
+
+    python benchmarks/check_query_plans.py
+    python benchmarks/check_query_plans.py --preset medium --verbose
+
+It also fails when a db_utils function that runs SQL was not exercised.
+New queries must be added to exercise() so that they get checked.
+"""
+import argparse
+import ast
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from config import Config  # noqa: E402
+import db_pool  # noqa: E402
+import generate_dataset  # noqa: E402
+
+# (calling function, plan step) -> why it is acceptable. Steps read
+# "SCAN <table>" (aliases resolved) or "USE TEMP B-TREE FOR <what>".
+ALLOWLIST = {
+    ('app.users', 'SCAN users'):
+        'directory listing; major/campus filters are substring matches',
+    ('app.users', 'USE TEMP B-TREE FOR ORDER BY'):
+        'sorted by a user-chosen column, one page of the directory',
+    ('db_utils.get_all_posts', 'SCAN posts'):
+        'walks idx_posts_feed in ORDER BY order and stops at LIMIT',
+    ('db_utils._comment_post_tags', 'USE TEMP B-TREE FOR DISTINCT'):
+        'dedupes the post ids of a handful of comments',
+    ('db_utils.get_conversation', 'USE TEMP B-TREE FOR ORDER BY'):
+        'merges both directions of one conversation, found by index',
+    ('db_utils.get_friend_requests', 'USE TEMP B-TREE FOR ORDER BY'):
+        "sorts one user's pending requests, found by index",
+    ('db_utils.get_user_conversations', 'USE TEMP B-TREE FOR RIGHT PART OF ORDER BY'):
+        'tie-break on last_message_id within equal timestamps only',
+    ('db_utils.get_user_friends', 'USE TEMP B-TREE FOR ORDER BY'):
+        "sorts one user's friends, looked up by primary key",
+    ('db_utils.search_posts_by_hashtag', 'USE TEMP B-TREE FOR ORDER BY'):
+        'sorts the posts of one tag, found by idx_post_hashtags_hashtag_post',
+    ('db_utils.search_posts', 'USE TEMP B-TREE FOR ORDER BY'):
+        'bm25() rank only exists per FTS match',
+    ('db_utils.search_comments', 'USE TEMP B-TREE FOR ORDER BY'):
+        'bm25() rank only exists per FTS match',
+    ('db_utils.search_users', 'USE TEMP B-TREE FOR ORDER BY'):
+        'bm25() rank only exists per FTS match',
+    ('db_utils.reconcile_counters', 'SCAN posts'):
+        'maintenance command, recounts every row',
+    ('db_utils.reconcile_counters', 'SCAN comments'):
+        'maintenance command, recounts every row',
+    ('db_utils.reconcile_counters', 'SCAN users'):
+        'maintenance command, recounts every row',
+    ('db_utils.reindex_hashtags', 'SCAN post_hashtags'):
+        'maintenance command, rebuilds every link',
+    ('db_utils.reindex_hashtags', 'USE TEMP B-TREE FOR GROUP BY'):
+        'maintenance command, rebuilds the hourly buckets',
+    ('db_utils.refresh_friend_suggestions', 'SCAN users'):
+        'batch job over every active user',
+    ('db_utils.refresh_friend_suggestions', 'SCAN friendships'):
+        'batch job, loads every pending pair once',
+    ('db_utils.refresh_friend_suggestions', 'SCAN friend_suggestions'):
+        'batch job, drops rows of deactivated users',
+    ('db_utils.refresh_friend_suggestions', 'USE TEMP B-TREE FOR ORDER BY'):
+        'batch job; candidate pools are ordered by last login',
+    ('friend_graph.load', 'SCAN friendships'):
+        'loads the whole accepted graph once per process',
+}
+
+# Statement kinds that EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?',
+                        re.IGNORECASE)
+_NOT_ALIASES = {'where', 'join', 'on', 'left', 'inner', 'cross', 'natural', 'outer', 'order',
+                'group', 'limit', 'using', 'set', 'union', 'values', 'select', 'default', 'as',
+                'indexed', 'not', 'having', 'window'}
+_STEP = re.compile(r'^(SCAN|SEARCH) (\S+)(.*)$')
+
+
+class CapturingConnection(db_pool.PooledConnection):
+    """Pooled connection that records each statement, its parameters and caller"""
+
+    captured = {}
+
+    def _capture(self, sql, parameters):
+        caller = sys._getframe(2)
+        function = f"{caller.f_globals.get('__name__')}.{caller.f_code.co_name}"
+        key = (function, ' '.join(sql.split()))
+        self.captured.setdefault(key, parameters)
+
+    def execute(self, sql, parameters=()):
+        self._capture(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        if seq_of_parameters:
+            self._capture(sql, seq_of_parameters[0])
+        return super().executemany(sql, seq_of_parameters)
+
+
+def sql_functions():
+    """Names of db_utils functions that execute SQL themselves"""
+    with open(os.path.join(Config.BASE_DIR, 'db_utils.py'), 'r') as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        for call in ast.walk(node):
+            if (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+                    and call.func.attr in ('execute', 'executemany')):
+                names.add(f"db_utils.{node.name}")
+                break
+    return names
+
+
+def large_tables(conn, min_rows):
+    """Ordinary tables holding at least min_rows rows"""
+    tables = [row[0] for row in conn.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'
+    """)]
+    return {table for table in tables
+            if conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} LIMIT ?)",
+                            (min_rows,)).fetchone()[0] >= min_rows}
+
+
+def table_aliases(sql):
+    """alias -> table for every table reference in sql"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN detail lines, indented by depth"""
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append(('  ' * depth[node_id], detail))
+    return lines
+
+
+def violations(sql, plan, large):
+    """Plan steps that scan a large table or build a temp B-tree"""
+    aliases = table_aliases(sql)
+    found = []
+    for _, detail in plan:
+        if detail.startswith('USE TEMP B-TREE'):
+            found.append(detail)
+            continue
+        match = _STEP.match(detail)
+        if match and match.group(1) == 'SCAN' and 'VIRTUAL TABLE' not in match.group(3):
+            table = aliases.get(match.group(2), match.group(2))
+            if table in large:
+                found.append(f"SCAN {table}")
+    return found
+
+
+def exercise(db_path):
+    """Call every db_utils function that runs SQL, with ids from the dataset"""
+    import db_utils as db
+
+    conn = sqlite3.connect(db_path)
+    author, = conn.execute("""
+        SELECT user_id FROM posts GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone()
+    friend, = conn.execute("""
+        SELECT user_id_2 FROM friendships WHERE user_id_1 = ? AND status = 'accepted' LIMIT 1
+    """, (author,)).fetchone()
+    post_id, = conn.execute("""
+        SELECT id FROM posts WHERE user_id = ? ORDER BY comment_count DESC LIMIT 1
+    """, (author,)).fetchone()
+    comment_id, = conn.execute("SELECT id FROM comments WHERE post_id = ? LIMIT 1",
+                               (post_id,)).fetchone()
+    username, = conn.execute("SELECT username FROM users WHERE id = ?", (author,)).fetchone()
+    conn.close()
+
+    # Reads
+    db.authenticate_user(db_path, username, generate_dataset.PASSWORD)
+    db.get_user_by_id(db_path, author)
+    db.get_user_by_username(db_path, username)
+    db.get_users_by_ids(db_path, [author, friend])
+    db.search_users(db_path, 'user1')
+    page = db.get_feed_page(db_path, author)
+    db.get_feed_page(db_path, author, before=page['next_cursor'])
+    db.get_feed_page(db_path, author, after=page['next_cursor'])
+    db.get_all_posts(db_path, author, visibility_filter='public')
+    db.get_post_by_id(db_path, post_id, author)
+    db.get_posts_by_ids(db_path, [post_id, post_id + 1], author)
+    db.get_user_posts(db_path, author)
+    db.get_post_comments(db_path, post_id)
+    db.get_friend_requests(db_path, author)
+    db.get_user_friends(db_path, author)
+    db.are_friends(db_path, author, friend)
+    timeline = db.get_timeline_page(db_path, author)
+    db.get_timeline_page(db_path, author, before=timeline['next_cursor'])
+    db.get_timeline_page(db_path, author, after=timeline['next_cursor'])
+    db.get_conversation(db_path, author, friend)
+    db.get_user_conversations(db_path, author)
+    db.get_user_notifications(db_path, author)
+    db.get_user_notifications(db_path, author, unread_only=True)
+    db.get_unread_count(db_path, author)
+    db.get_header_state(db_path, author)
+    db.get_saved_posts(db_path, author)
+    db.search_posts(db_path, 'exam', author)
+    db.search_comments(db_path, 'exam')
+    db.refresh_trending_if_stale(db_path, max_age=0)
+    db.get_trending_hashtags(db_path, max_age=0)
+    db.search_posts_by_hashtag(db_path, 'exams')
+    db.get_friend_suggestions(db_path, author)
+    db.get_user_stats(db_path, author)
+    for kind in db.TOGGLE_KINDS:
+        db.get_toggle_state(db_path, kind, comment_id if kind == 'comment_like' else post_id, author)
+
+    # Writes, undone again where the app has a way to
+    new_user = db.create_user(db_path, 'plancheck', 'plancheck@uis.no', 'plancheck')
+    db.update_user_profile(db_path, new_user, bio='Checking plans', campus='Ullandhaug')
+    db.update_last_login(db_path, new_user)
+    # In and out of pull mode, so the fan-out backfill runs too
+    pulled_post = db.create_post(db_path, friend, 'Checking pull mode', fanout_limit=0)
+    pushed_post = db.create_post(db_path, friend, 'Checking push mode', fanout_limit=10 ** 9)
+    new_post = db.create_post(db_path, author, 'Checking query plans #planning')
+    db.update_post(db_path, new_post, 'Checking query plans again #planning', 'question')
+    db.toggle_pin_post(db_path, new_post)
+    db.toggle_pin_post(db_path, new_post)
+    new_comment = db.add_comment(db_path, new_post, friend, 'Looks good')
+    db.add_comment(db_path, new_post, author, 'Thanks', parent_comment_id=new_comment)
+    db.update_comment(db_path, new_comment, 'Looks very good')
+    for _ in range(2):
+        db.toggle_like_post(db_path, new_post, friend)
+        db.toggle_like_comment(db_path, new_comment, author)
+        db.toggle_save_post(db_path, friend, new_post)
+    db.apply_toggle_states(db_path, [('post_like', new_post, friend, True),
+                                     ('comment_like', new_comment, author, True),
+                                     ('post_save', new_post, friend, True)])
+    db.send_friend_request(db_path, new_user, author)
+    for request in db.get_friend_requests(db_path, author):
+        if request['user_id'] == new_user:
+            db.respond_to_friend_request(db_path, request['id'], 'accepted')
+    db.remove_friend(db_path, new_user, author)
+    db.send_message(db_path, friend, author, 'Checking plans')
+    db.mark_messages_read(db_path, author, friend)
+    db.create_notification(db_path, author, 'Checking plans', 'message', friend)
+    notification = db.get_user_notifications(db_path, author, limit=1)[0]
+    db.mark_notification_read(db_path, notification['id'])
+    db.mark_all_notifications_read(db_path, author)
+    with db_pool.connection_scope():
+        scoped = db.get_db_connection(db_path)
+        db.save_hashtag(scoped, new_post, 'planning')
+        scoped.commit()
+    db.delete_comment(db_path, new_comment)
+    db.delete_post(db_path, new_post)
+    db.delete_post(db_path, pushed_post)
+    db.delete_post(db_path, pulled_post)
+    db.deactivate_user(db_path, new_user)
+
+    # Maintenance jobs
+    db.rebuild_search_index(db_path)
+    db.reindex_hashtags(db_path)
+    db.refresh_trending_hashtags(db_path)
+    db.refresh_friend_suggestions(db_path)
+    db.reconcile_counters(db_path)
+
+
+def exercise_users_route(app):
+    """Every sort order and filter of the /users directory query"""
+    client = app.test_client()
+    for sort in ('username', 'major', 'study_level', 'campus'):
+        client.get(f"/users?sort={sort}", base_url='https://localhost')
+    client.get('/users?major=Data&level=Master&campus=Ulland', base_url='https://localhost')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', default='small', choices=sorted(generate_dataset.PRESETS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=generate_dataset.DATA_DIR,
+                        help='where generated datasets are cached')
+    parser.add_argument('--large-rows', type=int, default=1000,
+                        help='tables with at least this many rows count as large')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    dataset = generate_dataset.cached_dataset(args.preset, args.seed, args.data_dir)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'plans.db')
+        shutil.copyfile(dataset, db_path)
+
+        os.environ['FLASK_ENV'] = 'production'
+        os.environ['METRICS_ENABLED'] = 'false'
+        Config.DATABASE = db_path
+        from app import app
+        app.logger.disabled = True
+        db_pool.close_idle()
+        db_pool.configure(connection_class=CapturingConnection)
+        # Check the event payload queries too, without starting the bus thread
+        import event_bus
+        event_bus.configure(enabled=True)
+
+        exercise(db_path)
+        exercise_users_route(app)
+        db_pool.close_idle()
+
+        conn = sqlite3.connect(db_path)
+        large = large_tables(conn, args.large_rows)
+        failures = []
+        used = set()
+        checked = 0
+        for (function, sql), parameters in sorted(CapturingConnection.captured.items()):
+            if not sql.upper().startswith(EXPLAINABLE):
+                continue
+            checked += 1
+            plan = explain(conn, sql, parameters)
+            problems = []
+            for step in violations(sql, plan, large):
+                if (function, step) in ALLOWLIST:
+                    used.add((function, step))
+                else:
+                    problems.append(step)
+            if problems:
+                failures.append((function, sql, plan, problems))
+            if args.verbose:
+                print(f"{function}: {sql[:120]}")
+                for indent, detail in plan:
+                    print(f"    {indent}{detail}")
+        conn.close()
+
+    exercised = {function for function, _ in CapturingConnection.captured}
+    missing = sorted(sql_functions() - exercised)
+
+    print(f"Checked {checked} statements from {len(exercised)} functions "
+          f"(large tables: {', '.join(sorted(large))})")
+    for function, sql, plan, problems in failures:
+        print(f"\nFAIL {function}: {', '.join(problems)}\n  {sql}")
+        for indent, detail in plan:
+            print(f"    {indent}{detail}")
+    for function in missing:
+        print(f"FAIL {function} runs SQL but is not called by exercise()")
+    for function, step in sorted(set(ALLOWLIST) - used):
+        print(f"note: allowlist entry ({function}, {step}) no longer matches any plan")
+
+    if failures or missing:
+        print(f"\n{len(failures)} statements with unapproved scans/sorts, "
+              f"{len(missing)} functions not exercised")
+        return 1
+    print("All query plans are index-backed or allowlisted")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,478 @@
+"""Generate a synthetic UIS-Connect database at production scale.
+
+Builds a fresh database from database/schema.sql and bulk loads users,
+friendships, posts, comments, likes, messages, notifications and saved posts
+with power-law skew: a few users collect most friends, messages and
+notifications, and a few hot posts collect most likes and comments. Rows
+are streamed into executemany() in large transactions on a connection with
+loader-only PRAGMAs (no journal, no fsync). Afterwards the migrations
+build the indexes and backfill counters, timelines, conversations and the
+search index, exactly as on an upgraded production database.
+
+    python benchmarks/generate_dataset.py --preset medium --out /tmp/uis_medium.db
+    python benchmarks/generate_dataset.py --users 1000000 --out /tmp/uis_1m.db
+
+Every account's password is "password". Prints rows/sec for each table.
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from config import Config  # noqa: E402
+import db_utils as db  # noqa: E402
+import migrations  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(Config.BASE_DIR), 'database', 'schema.sql')
+
+# Where cached_dataset() keeps generated databases between runs
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'uis-connect-bench')
+
+# Users per preset; every other volume scales from the per-user averages below
+PRESETS = {
+    'small': 1000,
+    'medium': 20000,
+    'large': 200000,
+}
+
+# Average rows per user (friendships are per user, counted from both sides)
+# or per post/comment for likes and comments
+VOLUMES = {
+    'friends_per_user': 20,
+    'posts_per_user': 5,
+    'comments_per_post': 3,
+    'likes_per_post': 10,
+    'likes_per_comment': 0.5,
+    'messages_per_user': 20,
+    'notifications_per_user': 15,
+    'saved_per_user': 2,
+}
+
+# Unsafe outside a throwaway file being built from scratch: nothing is
+# journaled or fsynced, and the file is locked until the loader closes it
+LOAD_PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'locking_mode': 'EXCLUSIVE',
+    'temp_store': 'MEMORY',
+    'cache_size': -262144,      # 256MB page cache
+}
+
+# Migrations run on their own connection after the load, in WAL mode
+MIGRATION_PRAGMAS = {
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': -262144,
+}
+
+PASSWORD = 'password'
+
+MAJORS = ['Computer Science', 'Data Science', 'Cybersecurity', 'Software Engineering',
+          'Mechanical Engineering', 'Economics', 'Biology', 'Physics', 'Mathematics',
+          'Architecture', 'Business IT', 'Machine Learning', 'Cloud Computing']
+INTERESTS = ['AI', 'Gaming', 'Linux', 'Python', 'Design', 'Books', 'Finance', 'Music',
+             'Football', 'Hiking', 'Photography', 'Robotics', 'Security', 'Startups',
+             'Chess', 'Climbing', 'Cooking', 'Film', 'Astronomy', 'Travel']
+STUDY_LEVELS = ['Bachelor', 'Master', 'PhD']
+CAMPUSES = ['Ullandhaug', 'Bjergsted', 'Arkeologisk museum']
+POST_TYPES = ['general', 'question', 'event', 'study_group']
+WORDS = ('the exam lecture lab campus study group project deadline library coffee '
+         'notes assignment python data model thesis seminar weekend course friends '
+         'anyone help with tomorrow today great idea question looking for meet at '
+         'room building quiz results code bug paper review presentation team').split()
+HASHTAGS = ['exams', 'studygroup', 'uis', 'python', 'machinelearning', 'linux', 'coffee',
+            'library', 'thesis', 'football', 'hiking', 'startup', 'security', 'design',
+            'music', 'internship', 'deadline', 'research', 'campuslife', 'events']
+
+SECONDS_PER_DAY = 86400
+
+
+def zipf_cum_weights(n, alpha, rng):
+    """Cumulative Zipf weights over ids 1..n, with popularity ranks shuffled across ids"""
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(1.0 / rank ** alpha for rank in ranks))
+
+
+def weights_from_cum(cum):
+    """Per-id weights back from cumulative weights"""
+    return [b - a for a, b in zip([0.0] + cum[:-1], cum)]
+
+
+def stamp(t):
+    """SQLite datetime('now') format for a unix time"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t))
+
+
+def spread(i, n, start, end, rng):
+    """Time of the i-th of n rows, increasing with i across [start, end)"""
+    return start + (i + rng.random()) * (end - start) / n
+
+
+def scaled_count(expected, rng):
+    """Round expected to an integer count without losing the fractional part on average"""
+    whole = int(expected)
+    return whole + (rng.random() < expected - whole)
+
+
+def load(conn, table, columns, rows, batch_size, verb='INSERT'):
+    """Stream rows into table with executemany, batch_size rows per transaction.
+
+    Returns (rows inserted, seconds).
+    """
+    sql = (f"{verb} INTO {table} ({', '.join(columns)}) "
+           f"VALUES ({', '.join('?' * len(columns))})")
+    rows = iter(rows)
+    changes = conn.total_changes
+    start = time.perf_counter()
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        conn.executemany(sql, batch)
+        conn.commit()
+    return conn.total_changes - changes, time.perf_counter() - start
+
+
+def generate(path, users, seed=42, days=180, batch_size=100000, volumes=None,
+             fanout_limit=Config.TIMELINE_FANOUT_LIMIT, suggestions=False, log=print):
+    """Build a synthetic database with `users` users at path (which must not exist).
+
+    Returns a list of (step, rows, seconds) in order; the bulk-loaded
+    tables come first, followed by the post-load steps.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    volumes = dict(VOLUMES, **(volumes or {}))
+    rng = random.Random(seed)
+    now = time.time()
+    start = now - days * SECONDS_PER_DAY
+    user_ids = range(1, users + 1)
+    report = []
+
+    def step(name, rows, seconds):
+        report.append((name, rows, seconds))
+        rate = rows / seconds if seconds else 0
+        log(f"  {name:22} {rows:>11,} rows {seconds:8.1f}s {rate:>11,.0f} rows/s")
+
+    # Popularity decides who is befriended, messaged and notified; activity
+    # decides who posts, likes, comments and writes. Both are power laws.
+    popularity_cum = zipf_cum_weights(users, 0.9, rng)
+    activity_cum = zipf_cum_weights(users, 0.6, rng)
+    popularity = weights_from_cum(popularity_cum)
+    mean_popularity = popularity_cum[-1] / users
+
+    def popular(k):
+        return rng.choices(user_ids, cum_weights=popularity_cum, k=k)
+
+    def active(k):
+        return rng.choices(user_ids, cum_weights=activity_cum, k=k)
+
+    conn = sqlite3.connect(path)
+    for name, value in LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+
+    # Users: one shared password hash, hashing millions of passwords is not the point
+    password_hash = generate_password_hash(PASSWORD)
+    signup_end = start + days * SECONDS_PER_DAY / 2
+
+    def user_rows():
+        for user_id in user_ids:
+            created = spread(user_id - 1, users, start - 365 * SECONDS_PER_DAY, signup_end, rng)
+            yield (user_id, f"user{user_id}", f"user{user_id}@uis.no", password_hash,
+                   rng.choice(MAJORS), ', '.join(rng.sample(INTERESTS, rng.randint(1, 3))),
+                   None if rng.random() < 0.5 else f"Hi, I'm user{user_id}",
+                   rng.choice(STUDY_LEVELS), rng.choice(CAMPUSES), str(200000 + user_id),
+                   stamp(created), stamp(now - rng.expovariate(1 / (3 * SECONDS_PER_DAY))))
+
+    step('users', *load(conn, 'users', ('id', 'username', 'email', 'password_hash', 'major',
+                                        'interests', 'bio', 'study_level', 'campus',
+                                        'student_number', 'created_at', 'last_login'),
+                        user_rows(), batch_size))
+    step('user_settings', *load(conn, 'user_settings', ('user_id',),
+                                ((user_id,) for user_id in user_ids), batch_size))
+
+    # Friendships: an active requester and a popular recipient (preferential attachment)
+    target = int(users * volumes['friends_per_user'] / 2)
+    edges = set()
+    attempts = 0
+    while len(edges) < target and attempts < 4 * target + 1000:
+        chunk = min(100000, 2 * (target - len(edges)) + 100)
+        for requester, recipient in zip(active(chunk), popular(chunk)):
+            key = (min(requester, recipient), max(requester, recipient))
+            if requester != recipient and key not in edges:
+                edges.add(key)
+                if len(edges) >= target:
+                    break
+        attempts += chunk
+    edges = [(a, b) if rng.random() < 0.5 else (b, a) for a, b in sorted(edges)]
+    rng.shuffle(edges)
+    friends = [[] for _ in range(users + 1)]
+
+    def friendship_rows():
+        for i, (requester, recipient) in enumerate(edges):
+            requested = spread(i, len(edges), start, now, rng)
+            roll = rng.random()
+            if roll < 0.9:
+                status = 'accepted'
+                friends[requester].append(recipient)
+                friends[recipient].append(requester)
+            else:
+                status = 'pending' if roll < 0.98 else 'rejected'
+            responded = (None if status == 'pending' else
+                         stamp(min(now, requested + rng.expovariate(1 / SECONDS_PER_DAY))))
+            yield requester, recipient, status, stamp(requested), responded
+
+    step('friendships', *load(conn, 'friendships',
+                              ('user_id_1', 'user_id_2', 'status', 'requested_at', 'responded_at'),
+                              friendship_rows(), batch_size))
+    del edges
+
+    # Posts: active authors; heat (Pareto, boosted by author popularity)
+    # decides how many likes, comments and saves a post attracts
+    post_count = int(users * volumes['posts_per_user'])
+    post_authors = array('i', active(post_count))
+    post_times = array('d')
+    heat = array('d')
+
+    def post_rows():
+        for i, author in enumerate(post_authors):
+            posted = spread(i, post_count, start, now, rng)
+            post_times.append(posted)
+            heat.append(rng.paretovariate(1.3) * math.sqrt(popularity[author - 1] / mean_popularity))
+            words = rng.choices(WORDS, k=rng.randint(5, 30))
+            for _ in range(rng.choice((0, 0, 1, 1, 2))):
+                words.insert(rng.randrange(len(words) + 1), '#' + rng.choice(HASHTAGS))
+            roll = rng.random()
+            visibility = 'public' if roll < 0.8 else 'friends' if roll < 0.97 else 'private'
+            yield (i + 1, author, ' '.join(words).capitalize(), rng.choice(POST_TYPES),
+                   visibility, stamp(posted))
+
+    step('posts', *load(conn, 'posts', ('id', 'user_id', 'content', 'post_type', 'visibility',
+                                        'timestamp'), post_rows(), batch_size))
+    total_heat = sum(heat)
+
+    def reaction_time(after):
+        return stamp(min(now, after + rng.expovariate(1 / (6 * 3600))))
+
+    # Comments: per-post counts follow heat; a fifth are replies
+    comment_total = post_count * volumes['comments_per_post']
+    comment_times = array('d')
+
+    def comment_rows():
+        comment_id = 0
+        for post_id, posted in enumerate(post_times, 1):
+            count = scaled_count(comment_total * heat[post_id - 1] / total_heat, rng)
+            first = comment_id + 1
+            for author in active(count):
+                comment_id += 1
+                commented = min(now, posted + rng.expovariate(1 / (6 * 3600)))
+                comment_times.append(commented)
+                parent = rng.randint(first, comment_id - 1) if comment_id > first and rng.random() < 0.2 else None
+                yield (comment_id, post_id, author, parent,
+                       ' '.join(rng.choices(WORDS, k=rng.randint(2, 15))).capitalize(),
+                       stamp(commented))
+
+    step('comments', *load(conn, 'comments', ('id', 'post_id', 'user_id', 'parent_comment_id',
+                                              'content', 'timestamp'),
+                           comment_rows(), batch_size))
+
+    # Likes: per-post counts follow heat, likers are active users, one like per user
+    like_total = post_count * volumes['likes_per_post']
+
+    def post_like_rows():
+        for post_id, posted in enumerate(post_times, 1):
+            count = min(users, scaled_count(like_total * heat[post_id - 1] / total_heat, rng))
+            for user_id in set(active(count)):
+                yield post_id, user_id, reaction_time(posted)
+
+    def comment_like_rows():
+        rate = 1 / volumes['likes_per_comment'] if volumes['likes_per_comment'] else 0
+        for comment_id, commented in enumerate(comment_times, 1):
+            count = min(users, int(rng.expovariate(rate))) if rate else 0
+            for user_id in set(active(count)):
+                yield comment_id, user_id, reaction_time(commented)
+
+    step('likes (posts)', *load(conn, 'likes', ('post_id', 'user_id', 'timestamp'),
+                                post_like_rows(), batch_size))
+    step('likes (comments)', *load(conn, 'likes', ('comment_id', 'user_id', 'timestamp'),
+                                   comment_like_rows(), batch_size))
+
+    # Messages: active senders, mostly to friends, otherwise to popular users;
+    # everything older than two days has been read
+    message_count = int(users * volumes['messages_per_user'])
+
+    def message_rows():
+        for i, (sender, stranger) in enumerate(zip(active(message_count), popular(message_count))):
+            sent = spread(i, message_count, start, now, rng)
+            receiver = rng.choice(friends[sender]) if friends[sender] and rng.random() < 0.8 else stranger
+            if receiver == sender:
+                continue
+            is_read = int(sent < now - 2 * SECONDS_PER_DAY or rng.random() < 0.5)
+            yield (sender, receiver, ' '.join(rng.choices(WORDS, k=rng.randint(2, 20))).capitalize(),
+                   is_read, stamp(sent))
+
+    step('messages', *load(conn, 'messages', ('sender_id', 'receiver_id', 'content', 'is_read',
+                                              'timestamp'), message_rows(), batch_size))
+
+    # Notifications go to popular users; the actor is an active user
+    notification_count = int(users * volumes['notifications_per_user'])
+
+    def notification_rows():
+        for i, (user_id, actor) in enumerate(zip(popular(notification_count),
+                                                 active(notification_count))):
+            created = spread(i, notification_count, start, now, rng)
+            roll = rng.random()
+            if roll < 0.5:
+                kind, content, related = 'like', f"user{actor} liked your post", rng.randint(1, post_count)
+            elif roll < 0.75:
+                kind, content, related = 'comment', f"user{actor} commented on your post", rng.randint(1, post_count)
+            elif roll < 0.85:
+                kind, content, related = 'friend_request', f"user{actor} sent you a friend request", actor
+            else:
+                kind, content, related = 'message', f"New message from user{actor}", actor
+            is_read = int(created < now - 2 * SECONDS_PER_DAY or rng.random() < 0.5)
+            yield user_id, content, kind, related, is_read, stamp(created)
+
+    step('notifications', *load(conn, 'notifications', ('user_id', 'content', 'notification_type',
+                                                        'related_id', 'is_read', 'created_at'),
+                                notification_rows(), batch_size))
+
+    # Saved posts follow heat too; duplicates are dropped by UNIQUE(user_id, post_id)
+    saved_count = int(users * volumes['saved_per_user'])
+    heat_cum = list(itertools.accumulate(heat))
+    post_ids = range(1, post_count + 1)
+
+    def saved_rows():
+        saved_posts = rng.choices(post_ids, cum_weights=heat_cum, k=saved_count) if post_count else []
+        for user_id, post_id in zip(active(saved_count), saved_posts):
+            yield user_id, post_id, reaction_time(post_times[post_id - 1])
+
+    step('saved_posts', *load(conn, 'saved_posts', ('user_id', 'post_id', 'saved_at'),
+                              saved_rows(), batch_size, verb='INSERT OR IGNORE'))
+    del friends, post_authors, post_times, comment_times, heat, heat_cum
+
+    # Hand over to the regular tooling with the normal journal mode
+    conn.execute("PRAGMA locking_mode = NORMAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+    began = time.perf_counter()
+    applied = migrations.apply_migrations(path, pragmas=MIGRATION_PRAGMAS)
+    step(f"migrations ({len(applied)})", 0, time.perf_counter() - began)
+
+    began = time.perf_counter()
+    posts_indexed, links = db.reindex_hashtags(path)
+    step('reindex hashtags', links, time.perf_counter() - began)
+
+    began = time.perf_counter()
+    db.refresh_trending_hashtags(path)
+    step('trending hashtags', 0, time.perf_counter() - began)
+
+    # Migration 004 fans every post out; authors over the fan-out limit are
+    # pull authors in the live app, so match that here. All their posts are
+    # pulled, so they count as marked since their first one.
+    began = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        INSERT OR IGNORE INTO timeline_pull_authors (user_id, marked_at)
+        SELECT user_id, COALESCE((SELECT MIN(timestamp) FROM posts WHERE posts.user_id = authors.user_id),
+                                 datetime('now'))
+        FROM (
+            SELECT user_id FROM (
+                SELECT user_id_1 AS user_id FROM friendships WHERE status = 'accepted'
+                UNION ALL
+                SELECT user_id_2 FROM friendships WHERE status = 'accepted'
+            )
+            GROUP BY user_id
+            HAVING COUNT(*) > ?
+        ) authors
+    """, (fanout_limit,))
+    pulled = conn.execute("""
+        DELETE FROM timeline
+        WHERE user_id != author_id
+          AND author_id IN (SELECT user_id FROM timeline_pull_authors)
+    """).rowcount
+    conn.commit()
+    step('timeline pull authors', pulled, time.perf_counter() - began)
+
+    if suggestions:
+        conn.close()
+        began = time.perf_counter()
+        step('friend suggestions', db.refresh_friend_suggestions(path),
+             time.perf_counter() - began)
+        conn = sqlite3.connect(path)
+
+    began = time.perf_counter()
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    step('analyze', 0, time.perf_counter() - began)
+    return report
+
+
+def cached_dataset(preset, seed=42, data_dir=DATA_DIR):
+    """Path of the generated database for preset/seed, built on first use"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{preset}-seed{seed}.db")
+    if not os.path.exists(path):
+        print(f"Generating {preset} dataset into {path}")
+        partial = path + '.partial'
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(partial + suffix):
+                os.remove(partial + suffix)
+        generate(partial, PRESETS[preset], seed=seed)
+        os.replace(partial, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True, help='path of the database to create')
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    size.add_argument('--users', type=int, help='number of users (overrides --preset)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--days', type=int, default=180, help='history to spread activity over')
+    parser.add_argument('--batch-size', type=int, default=100000,
+                        help='rows per executemany() transaction')
+    parser.add_argument('--suggestions', action='store_true',
+                        help='also precompute friend suggestions')
+    parser.add_argument('--force', action='store_true', help='overwrite --out if it exists')
+    for name, default in VOLUMES.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=float, default=default)
+    args = parser.parse_args()
+
+    if args.force:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.out + suffix):
+                os.remove(args.out + suffix)
+
+    users = args.users or PRESETS[args.preset]
+    print(f"Generating {users:,} users into {args.out} (seed={args.seed})")
+    began = time.perf_counter()
+    report = generate(args.out, users, seed=args.seed, days=args.days,
+                      batch_size=args.batch_size, suggestions=args.suggestions,
+                      volumes={name: getattr(args, name) for name in VOLUMES})
+    seconds = time.perf_counter() - began
+    loaded = sum(rows for name, rows, _ in itertools.takewhile(
+        lambda entry: not entry[0].startswith('migrations'), report))
+    print(f"Loaded {loaded:,} rows in {seconds:.1f}s ({loaded / seconds:,.0f} rows/s overall), "
+          f"{os.path.getsize(args.out) / 2 ** 20:,.0f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
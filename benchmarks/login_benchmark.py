@@ -0,0 +1,138 @@
+"""Login storm benchmark for the bounded password-hashing pool.
+
+Fires POST /login from --clients concurrent threads at the Flask app (test
+client, one per thread) against a scratch copy of a generated dataset, and
+alongside them a reader thread hitting a cheap page, to show whether
+hashing starves other requests. Reports login throughput, latency of
+accepted and rejected (503) logins, and the reader's latency.
+
+    python benchmarks/login_benchmark.py --clients 32 --seconds 10
+    python benchmarks/login_benchmark.py --hash-workers 4 --max-pending 64
+    python benchmarks/login_benchmark.py --method pbkdf2:sha256:600000   # rehash on login
+
+Generated datasets store werkzeug's default hash, so a --method other than
+that makes every user's first login also upgrade the stored hash.
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from config import Config  # noqa: E402
+import db_pool  # noqa: E402
+import generate_dataset  # noqa: E402
+from route_benchmark import percentile  # noqa: E402
+
+
+def storm(app, user_ids, clients, seconds, seed, retry_delay):
+    """Run the login clients plus one reader; returns per-kind latency lists"""
+    results = {'accepted': [], 'rejected': [], 'failed': [], 'reader': []}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def login_client(n):
+        rng = random.Random(seed + n)
+        client = app.test_client()
+        mine = {'accepted': [], 'rejected': [], 'failed': []}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.post('/login', base_url='https://localhost', data={
+                'username': f"user{rng.choice(user_ids)}",
+                'password': generate_dataset.PASSWORD,
+            })
+            elapsed = time.perf_counter() - start
+            if response.status_code == 302:
+                mine['accepted'].append(elapsed)
+            elif response.status_code == 503:
+                mine['rejected'].append(elapsed)
+                # Like a person retrying, not a tight loop
+                time.sleep(rng.uniform(0.5, 1.5) * retry_delay)
+            else:
+                mine['failed'].append(elapsed)
+        with lock:
+            for kind, latencies in mine.items():
+                results[kind].extend(latencies)
+        db_pool.close_idle()
+
+    def reader():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get('/login', base_url='https://localhost')
+            results['reader'].append(time.perf_counter() - start)
+            time.sleep(0.01)
+        db_pool.close_idle()
+
+    threads = [threading.Thread(target=login_client, args=(n,)) for n in range(clients)]
+    threads.append(threading.Thread(target=reader))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', default='small', choices=sorted(generate_dataset.PRESETS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=generate_dataset.DATA_DIR,
+                        help='where generated datasets are cached')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--retry-delay', type=float, default=0.5,
+                        help='average seconds a client waits after a 503')
+    parser.add_argument('--method', help='PASSWORD_HASH_METHOD (default: from Config)')
+    parser.add_argument('--hash-workers', type=int, help='PASSWORD_HASH_WORKERS')
+    parser.add_argument('--max-pending', type=int, help='PASSWORD_HASH_MAX_PENDING')
+    args = parser.parse_args()
+
+    dataset = generate_dataset.cached_dataset(args.preset, args.seed, args.data_dir)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'login.db')
+        shutil.copyfile(dataset, db_path)
+
+        os.environ['FLASK_ENV'] = 'production'
+        Config.DATABASE = db_path
+        from app import app
+        import password_hasher
+        app.logger.disabled = True
+        password_hasher.configure(method=args.method, workers=args.hash_workers,
+                                  max_pending=args.max_pending)
+
+        conn = sqlite3.connect(db_path)
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE is_active = 1")]
+        conn.close()
+
+        print(f"preset={args.preset} clients={args.clients} method={password_hasher.METHOD} "
+              f"hash_workers={password_hasher.WORKERS} max_pending={password_hasher.MAX_PENDING}")
+        start = time.perf_counter()
+        results = storm(app, user_ids, args.clients, args.seconds, args.seed, args.retry_delay)
+        elapsed = time.perf_counter() - start
+        stats = password_hasher.stats()
+        db_pool.close_idle()
+
+    print(f"  {'':10} {'count':>7} {'per sec':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for kind in ('accepted', 'rejected', 'failed', 'reader'):
+        latencies = results[kind]
+        if not latencies and kind == 'failed':
+            continue
+        print(f"  {kind:10} {len(latencies):7d} {len(latencies) / elapsed:8.1f} "
+              f"{percentile(latencies, 50) * 1000:8.2f} {percentile(latencies, 95) * 1000:8.2f} "
+              f"{percentile(latencies, 99) * 1000:8.2f}")
+    hashed = stats['hashed'] or 1
+    print(f"  hashing: {stats['hashed']} jobs, {stats['seconds'] / hashed * 1000:.1f} ms each, "
+          f"{stats['rehashed']} stored hashes upgraded")
+    return 1 if results['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
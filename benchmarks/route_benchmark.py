@@ -0,0 +1,248 @@
+"""Route-level latency benchmark over generated datasets.
+
+Drives the Flask app through its test client against a database built by
+generate_dataset.py (cached per preset and seed, then copied to a scratch
+file so the write routes don't accumulate rows in it). Each route is hit
+by logged-in users picked with the same skew as the data, so hot posts and
+popular profiles show up in the tail. Reports p50/p95/p99 latency and SQL
+queries per request, and compares them against a stored baseline.
+
+    python benchmarks/route_benchmark.py --preset small
+    python benchmarks/route_benchmark.py --preset medium --save-baseline
+
+Exits non-zero when a route issues more queries per request than the
+baseline, or its p95 regressed by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from config import Config  # noqa: E402
+import db_pool  # noqa: E402
+import generate_dataset  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'route_baseline.json')
+
+# Statements counted as queries (PRAGMAs and transaction control are not)
+QUERY_VERBS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+# p95 changes smaller than this are noise, whatever the relative change
+NOISE_FLOOR_MS = 1.0
+
+
+class QueryCounter:
+    """sqlite3 trace callback counting the queries run on pooled connections"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        if statement.lstrip()[:7].upper().startswith(QUERY_VERBS):
+            self.count += 1
+
+    def attach(self, conn):
+        conn.set_trace_callback(self)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Targets:
+    """Request targets drawn from the dataset with the same skew as the data"""
+
+    def __init__(self, db_path, rng):
+        conn = sqlite3.connect(db_path)
+        self.rng = rng
+        self.users = [row[0] for row in conn.execute("SELECT id FROM users WHERE is_active = 1")]
+        self.popular_users = [row[0] for row in conn.execute("""
+            SELECT user_id_2 FROM friendships WHERE status = 'accepted'
+            GROUP BY user_id_2 ORDER BY COUNT(*) DESC LIMIT 100
+        """)]
+        self.posts = conn.execute("SELECT MAX(id) FROM posts").fetchone()[0] or 1
+        self.hot_posts = [row[0] for row in conn.execute("""
+            SELECT id FROM posts WHERE visibility = 'public'
+            ORDER BY like_count + comment_count DESC LIMIT 100
+        """)]
+        conn.close()
+
+    def viewer(self):
+        return self.rng.choice(self.users)
+
+    def user(self):
+        if self.popular_users and self.rng.random() < 0.5:
+            return self.rng.choice(self.popular_users)
+        return self.rng.choice(self.users)
+
+    def post(self):
+        if self.hot_posts and self.rng.random() < 0.5:
+            return self.rng.choice(self.hot_posts)
+        return self.rng.randint(1, self.posts)
+
+    def search_term(self):
+        return self.rng.choice(generate_dataset.WORDS)
+
+
+# name -> (method, function(targets) returning (url, form data))
+ROUTES = {
+    'home': ('GET', lambda t: ('/', None)),
+    'post': ('GET', lambda t: (f"/post/{t.post()}", None)),
+    'user': ('GET', lambda t: (f"/user/{t.user()}", None)),
+    'messages': ('GET', lambda t: ('/messages', None)),
+    'search': ('GET', lambda t: (f"/search?q={t.search_term()}", None)),
+    'users': ('GET', lambda t: ('/users', None)),
+    'notifications': ('GET', lambda t: ('/notifications', None)),
+    'like': ('POST', lambda t: (f"/post/{t.post()}/like", {})),
+    'comment': ('POST', lambda t: (f"/post/{t.post()}/comment", {'content': 'Benchmark comment'})),
+    'send_message': ('POST', lambda t: (f"/messages/send/{t.user()}", {'content': 'Benchmark message'})),
+    'login': ('POST', lambda t: ('/login', {'username': f"user{t.viewer()}",
+                                            'password': generate_dataset.PASSWORD})),
+}
+
+
+def run_route(client, counter, targets, method, make_request, requests, warmup):
+    """Time one route; returns its result dict"""
+    latencies = []
+    queries = 0
+    errors = 0
+    first_error = None
+    for i in range(warmup + requests):
+        url, data = make_request(targets)
+        with client.session_transaction(base_url='https://localhost') as session:
+            session['user_id'] = targets.viewer()
+        before = counter.count
+        start = time.perf_counter()
+        try:
+            response = client.open(url, method=method, data=data, base_url='https://localhost')
+            status = response.status_code
+        except Exception as e:
+            # Report what broke the page, not the failing 500 handler
+            cause = e.__context__ or e
+            status = f"{type(cause).__name__}: {cause}"
+        elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        queries += counter.count - before
+        if not isinstance(status, int) or status >= 400:
+            errors += 1
+            first_error = first_error or f"{url} -> {status}"
+    return {
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'queries': queries / requests,
+        'errors': errors,
+        'first_error': first_error,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """'ok', 'new' or a description of the regression"""
+    if baseline is None:
+        return 'new'
+    problems = []
+    if result['queries'] > baseline['queries'] + 0.5:
+        problems.append(f"queries {baseline['queries']:.1f} -> {result['queries']:.1f}")
+    if (result['p95'] > baseline['p95'] * (1 + tolerance)
+            and result['p95'] - baseline['p95'] > NOISE_FLOOR_MS):
+        problems.append(f"p95 {baseline['p95']:.2f} -> {result['p95']:.2f}ms")
+    return 'REGRESSION: ' + ', '.join(problems) if problems else 'ok'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', default='small', choices=sorted(generate_dataset.PRESETS))
+    parser.add_argument('--config', default='production',
+                        choices=['development', 'production'])
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests per route first')
+    parser.add_argument('--routes', default=','.join(ROUTES),
+                        help='comma-separated subset of: ' + ', '.join(ROUTES))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=generate_dataset.DATA_DIR,
+                        help='where generated datasets are cached')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the baseline for the preset')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed relative p95 increase over the baseline')
+    args = parser.parse_args()
+    routes = [name.strip() for name in args.routes.split(',') if name.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    dataset = generate_dataset.cached_dataset(args.preset, args.seed, args.data_dir)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        shutil.copyfile(dataset, db_path)
+
+        # The app reads its configuration on import
+        os.environ['FLASK_ENV'] = args.config
+        Config.DATABASE = db_path
+        counter = QueryCounter()
+        db_pool.on_connect(counter.attach)
+        from app import app
+
+        # Several upstream templates are missing, and so is the 500 page;
+        # count those failures as errors instead of aborting the run
+        app.config['PROPAGATE_EXCEPTIONS'] = False
+        app.logger.disabled = True
+        client = app.test_client()
+        targets = Targets(db_path, random.Random(args.seed))
+
+        print(f"preset={args.preset} users={len(targets.users):,} config={args.config} "
+              f"requests={args.requests}/route")
+        results = {}
+        for name in routes:
+            method, make_request = ROUTES[name]
+            results[name] = run_route(client, counter, targets, method, make_request,
+                                      args.requests, args.warmup)
+        db_pool.close_idle()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baselines = json.load(f)
+    baseline = baselines.get(args.preset, {})
+
+    print(f"  {'route':14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}  baseline")
+    regressions = 0
+    for name, result in results.items():
+        verdict = compare(result, baseline.get(name), args.tolerance)
+        regressions += verdict.startswith('REGRESSION')
+        print(f"  {name:14} {result['p50']:8.2f} {result['p95']:8.2f} {result['p99']:8.2f} "
+              f"{result['queries']:8.1f} {result['errors']:7d}  {verdict}")
+    for name, result in results.items():
+        if result['first_error']:
+            print(f"  {name}: first error {result['first_error']}")
+
+    if args.save_baseline:
+        baselines[args.preset] = {
+            name: {key: round(result[key], 3) for key in ('p50', 'p95', 'p99', 'queries')}
+            for name, result in results.items()
+        }
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline for {args.preset} saved to {args.baseline}")
+        return 0
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
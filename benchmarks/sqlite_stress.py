@@ -0,0 +1,159 @@
+"""Concurrent reader/writer stress test for the SQLite PRAGMA profiles.
+
+Runs writer threads (likes and messages, one small transaction each) against
+reader threads (feed-style aggregate reads) on a scratch database, using the
+same pooled connections and PRAGMA profile as the app.
+
+    python benchmarks/sqlite_stress.py --config production --seconds 10
+
+Exits non-zero if any operation failed with "database is locked".
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from config import config  # noqa: E402
+import db_pool  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE posts (id INTEGER PRIMARY KEY, user_id INTEGER, content TEXT);
+CREATE TABLE likes (id INTEGER PRIMARY KEY, post_id INTEGER, user_id INTEGER,
+                    timestamp TEXT DEFAULT (datetime('now')));
+CREATE TABLE messages (id INTEGER PRIMARY KEY, sender_id INTEGER, receiver_id INTEGER,
+                       content TEXT, is_read INTEGER DEFAULT 0,
+                       timestamp TEXT DEFAULT (datetime('now')));
+"""
+
+
+def setup_database(path, posts, users):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO posts (id, user_id, content) VALUES (?, ?, ?)",
+        [(i, random.randint(1, users), f"post {i}") for i in range(1, posts + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ops = {'read': 0, 'write': 0}
+        self.latencies = {'read': [], 'write': []}
+        self.locked = 0
+        self.other_errors = 0
+
+    def record(self, kind, seconds):
+        with self.lock:
+            self.ops[kind] += 1
+            self.latencies[kind].append(seconds)
+
+
+def writer(db_path, stats, stop, posts, users):
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn = db_pool.get_connection(db_path)
+        try:
+            if random.random() < 0.5:
+                conn.execute("INSERT INTO likes (post_id, user_id) VALUES (?, ?)",
+                             (random.randint(1, posts), random.randint(1, users)))
+            else:
+                conn.execute("INSERT INTO messages (sender_id, receiver_id, content) VALUES (?, ?, ?)",
+                             (random.randint(1, users), random.randint(1, users), 'hi'))
+            conn.commit()
+            stats.record('write', time.perf_counter() - start)
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            with stats.lock:
+                if 'locked' in str(e) or 'busy' in str(e):
+                    stats.locked += 1
+                else:
+                    stats.other_errors += 1
+        finally:
+            conn.close()
+
+
+def reader(db_path, stats, stop, users):
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn = db_pool.get_connection(db_path)
+        try:
+            conn.execute("""
+                SELECT p.id, (SELECT COUNT(*) FROM likes WHERE post_id = p.id) AS like_count
+                FROM posts p ORDER BY p.id DESC LIMIT 20
+            """).fetchall()
+            conn.execute("SELECT COUNT(*) FROM messages WHERE receiver_id = ? AND is_read = 0",
+                         (random.randint(1, users),)).fetchone()
+            stats.record('read', time.perf_counter() - start)
+        except sqlite3.OperationalError as e:
+            with stats.lock:
+                if 'locked' in str(e) or 'busy' in str(e):
+                    stats.locked += 1
+                else:
+                    stats.other_errors += 1
+        finally:
+            conn.close()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='production', choices=sorted(config))
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    args = parser.parse_args()
+
+    cfg = config[args.config]
+    db_pool.configure(pragmas=cfg.SQLITE_PRAGMAS, checkpoint_interval=cfg.SQLITE_CHECKPOINT_INTERVAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stress.db')
+        setup_database(db_path, args.posts, args.users)
+
+        stats = Stats()
+        stop = threading.Event()
+        threads = [threading.Thread(target=writer, args=(db_path, stats, stop, args.posts, args.users))
+                   for _ in range(args.writers)]
+        threads += [threading.Thread(target=reader, args=(db_path, stats, stop, args.users))
+                    for _ in range(args.readers)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        conn = sqlite3.connect(db_path)
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+
+    print(f"config={args.config} journal_mode={journal_mode} "
+          f"readers={args.readers} writers={args.writers} seconds={args.seconds}")
+    for kind in ('read', 'write'):
+        lat = stats.latencies[kind]
+        print(f"  {kind:5}: {stats.ops[kind]:7d} ops  {stats.ops[kind] / args.seconds:9.1f} ops/s  "
+              f"p50={percentile(lat, 50) * 1000:.2f}ms  p99={percentile(lat, 99) * 1000:.2f}ms")
+    print(f"  database is locked: {stats.locked}  other errors: {stats.other_errors}")
+
+    return 1 if stats.locked or stats.other_errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
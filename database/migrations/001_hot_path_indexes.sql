@@ -0,0 +1,16 @@
+-- Secondary indexes for the hot query paths in app/db_utils.py
+-- (like/comment counts, user posts, friendship lookups, inbox and notification badges)
+
+CREATE INDEX IF NOT EXISTS idx_likes_post_user ON likes(post_id, user_id);
+CREATE INDEX IF NOT EXISTS idx_likes_comment_user ON likes(comment_id, user_id);
+CREATE INDEX IF NOT EXISTS idx_comments_post_timestamp ON comments(post_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_posts_user_timestamp ON posts(user_id, timestamp);
+
+-- Friendships are stored once per pair, so both directions need an index
+CREATE INDEX IF NOT EXISTS idx_friendships_user1_status ON friendships(user_id_1, status, user_id_2);
+CREATE INDEX IF NOT EXISTS idx_friendships_user2_status ON friendships(user_id_2, status, user_id_1);
+
+CREATE INDEX IF NOT EXISTS idx_messages_receiver_sender_read ON messages(receiver_id, sender_id, is_read);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_read_created ON notifications(user_id, is_read, created_at);
+
+ANALYZE;
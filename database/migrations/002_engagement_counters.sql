@@ -0,0 +1,13 @@
+-- Denormalized like/comment counters, kept up to date by the write functions
+-- in app/db_utils.py. Repair drift with: python manage.py reconcile-counters
+
+ALTER TABLE posts ADD COLUMN like_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE posts ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE comments ADD COLUMN like_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE posts SET
+    like_count = (SELECT COUNT(*) FROM likes WHERE post_id = posts.id),
+    comment_count = (SELECT COUNT(*) FROM comments WHERE post_id = posts.id);
+
+UPDATE comments SET
+    like_count = (SELECT COUNT(*) FROM likes WHERE comment_id = comments.id);
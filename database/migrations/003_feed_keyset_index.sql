@@ -0,0 +1,4 @@
+-- Feed order index for keyset pagination in get_all_posts / get_feed_page:
+-- ORDER BY is_pinned DESC, timestamp DESC, id DESC and the matching row-value seek
+
+CREATE INDEX IF NOT EXISTS idx_posts_feed ON posts(is_pinned, timestamp, id);
@@ -0,0 +1,35 @@
+-- Materialized home timeline: one row per (reader, post) for the reader's own
+-- posts and their accepted friends' posts. Filled by create_post (fan-out on
+-- write), backfilled/pruned by respond_to_friend_request/remove_friend.
+
+CREATE TABLE IF NOT EXISTS timeline (
+    user_id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (user_id, timestamp, post_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_timeline_post ON timeline(post_id);
+CREATE INDEX IF NOT EXISTS idx_timeline_user_author ON timeline(user_id, author_id);
+
+-- Authors with more friends than TIMELINE_FANOUT_LIMIT are not fanned out;
+-- readers merge their posts in at read time instead
+CREATE TABLE IF NOT EXISTS timeline_pull_authors (
+    user_id INTEGER PRIMARY KEY,
+    marked_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Backfill from existing posts and friendships
+INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, timestamp)
+SELECT p.user_id, p.id, p.user_id, p.timestamp FROM posts p;
+
+INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, timestamp)
+SELECT f.user_id_2, p.id, p.user_id, p.timestamp
+FROM friendships f JOIN posts p ON p.user_id = f.user_id_1
+WHERE f.status = 'accepted' AND p.visibility != 'private';
+
+INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, timestamp)
+SELECT f.user_id_1, p.id, p.user_id, p.timestamp
+FROM friendships f JOIN posts p ON p.user_id = f.user_id_2
+WHERE f.status = 'accepted' AND p.visibility != 'private';
@@ -0,0 +1,14 @@
+-- Per-user unread badge counters, maintained by send_message/mark_messages_read
+-- and the notification functions in app/db_utils.py
+
+CREATE TABLE IF NOT EXISTS user_counters (
+    user_id INTEGER PRIMARY KEY,
+    unread_messages INTEGER NOT NULL DEFAULT 0,
+    unread_notifications INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR REPLACE INTO user_counters (user_id, unread_messages, unread_notifications)
+SELECT u.id,
+       (SELECT COUNT(*) FROM messages WHERE receiver_id = u.id AND is_read = 0),
+       (SELECT COUNT(*) FROM notifications WHERE user_id = u.id AND is_read = 0)
+FROM users u;
@@ -0,0 +1,30 @@
+-- Inbox summary: one row per user pair (user_low < user_high), maintained by
+-- send_message and mark_messages_read in app/db_utils.py
+
+CREATE TABLE IF NOT EXISTS conversations (
+    user_low INTEGER NOT NULL,
+    user_high INTEGER NOT NULL,
+    last_message_id INTEGER NOT NULL,
+    last_message_at TEXT NOT NULL,
+    snippet TEXT NOT NULL DEFAULT '',
+    unread_low INTEGER NOT NULL DEFAULT 0,   -- unread by user_low
+    unread_high INTEGER NOT NULL DEFAULT 0,  -- unread by user_high
+    PRIMARY KEY (user_low, user_high)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_conversations_low_last ON conversations(user_low, last_message_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_high_last ON conversations(user_high, last_message_at);
+
+WITH pairs AS (
+    SELECT MIN(sender_id, receiver_id) AS lo,
+           MAX(sender_id, receiver_id) AS hi,
+           MAX(id) AS last_id,
+           SUM(CASE WHEN is_read = 0 AND receiver_id < sender_id THEN 1 ELSE 0 END) AS unread_lo,
+           SUM(CASE WHEN is_read = 0 AND receiver_id >= sender_id THEN 1 ELSE 0 END) AS unread_hi
+    FROM messages
+    GROUP BY lo, hi
+)
+INSERT OR REPLACE INTO conversations
+    (user_low, user_high, last_message_id, last_message_at, snippet, unread_low, unread_high)
+SELECT p.lo, p.hi, p.last_id, m.timestamp, substr(m.content, 1, 100), p.unread_lo, p.unread_hi
+FROM pairs p JOIN messages m ON m.id = p.last_id;
@@ -0,0 +1,62 @@
+-- FTS5 search over posts, comments and user profiles. External-content
+-- tables, kept in sync with their source tables by the triggers below.
+-- Rebuild from scratch with: python manage.py rebuild-search
+
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    content,
+    content='posts', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+    content,
+    content='comments', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+    username, major, interests, bio,
+    content='users', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF content ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO posts_fts (rowid, content) VALUES (new.id, new.content);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF content ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+    INSERT INTO users_fts (rowid, username, major, interests, bio)
+    VALUES (new.id, new.username, new.major, new.interests, new.bio);
+END;
+CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+    INSERT INTO users_fts (users_fts, rowid, username, major, interests, bio)
+    VALUES ('delete', old.id, old.username, old.major, old.interests, old.bio);
+END;
+CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, major, interests, bio ON users BEGIN
+    INSERT INTO users_fts (users_fts, rowid, username, major, interests, bio)
+    VALUES ('delete', old.id, old.username, old.major, old.interests, old.bio);
+    INSERT INTO users_fts (rowid, username, major, interests, bio)
+    VALUES (new.id, new.username, new.major, new.interests, new.bio);
+END;
+
+INSERT INTO posts_fts (posts_fts) VALUES ('rebuild');
+INSERT INTO comments_fts (comments_fts) VALUES ('rebuild');
+INSERT INTO users_fts (users_fts) VALUES ('rebuild');
@@ -0,0 +1,30 @@
+-- Time-windowed trending hashtags.
+-- hashtag_buckets counts uses per tag per hour (unix time / 3600) and is
+-- written by create_post; trending_hashtags holds the precomputed top-N per
+-- window, refreshed by refresh_trending_hashtags().
+
+CREATE TABLE IF NOT EXISTS hashtag_buckets (
+    bucket_hour INTEGER NOT NULL,
+    hashtag_id INTEGER NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_hour, hashtag_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS trending_hashtags (
+    time_window TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    hashtag_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    uses INTEGER NOT NULL,
+    score REAL NOT NULL,
+    computed_at REAL NOT NULL,
+    PRIMARY KEY (time_window, rank)
+) WITHOUT ROWID;
+
+-- Backfill the last week of buckets from existing posts
+INSERT OR REPLACE INTO hashtag_buckets (bucket_hour, hashtag_id, uses)
+SELECT CAST(strftime('%s', p.timestamp) AS INTEGER) / 3600, ph.hashtag_id, COUNT(*)
+FROM post_hashtags ph
+JOIN posts p ON p.id = ph.post_id
+WHERE p.timestamp >= datetime('now', '-7 days')
+GROUP BY 1, 2;
@@ -0,0 +1,28 @@
+-- Unique keys needed by the set-based hashtag upserts in ingest_hashtags().
+-- Duplicate tags (possible with the old check-then-insert path) are merged
+-- into the lowest id first.
+
+CREATE TEMP TABLE hashtag_merge AS
+SELECT h.id AS old_id, keep.id AS new_id, h.use_count AS use_count
+FROM hashtags h
+JOIN (SELECT tag, MIN(id) AS id FROM hashtags GROUP BY tag) keep ON keep.tag = h.tag
+WHERE h.id != keep.id;
+
+UPDATE hashtags SET use_count = use_count +
+    (SELECT COALESCE(SUM(use_count), 0) FROM hashtag_merge WHERE new_id = hashtags.id)
+WHERE id IN (SELECT new_id FROM hashtag_merge);
+
+UPDATE OR IGNORE post_hashtags
+SET hashtag_id = (SELECT new_id FROM hashtag_merge WHERE old_id = post_hashtags.hashtag_id)
+WHERE hashtag_id IN (SELECT old_id FROM hashtag_merge);
+
+DELETE FROM post_hashtags WHERE hashtag_id IN (SELECT old_id FROM hashtag_merge);
+DELETE FROM hashtag_buckets WHERE hashtag_id IN (SELECT old_id FROM hashtag_merge);
+DELETE FROM hashtags WHERE id IN (SELECT old_id FROM hashtag_merge);
+DROP TABLE hashtag_merge;
+
+DELETE FROM post_hashtags
+WHERE rowid NOT IN (SELECT MIN(rowid) FROM post_hashtags GROUP BY post_id, hashtag_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_hashtags_tag ON hashtags(tag);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_post_hashtags_post_hashtag ON post_hashtags(post_id, hashtag_id);
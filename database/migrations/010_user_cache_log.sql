@@ -0,0 +1,9 @@
+-- Change log for the in-process user cache (app/user_cache.py). Every write
+-- to a user record appends its id; each worker polls for entries after the
+-- last seq it has seen and evicts just those users.
+
+CREATE TABLE IF NOT EXISTS user_cache_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
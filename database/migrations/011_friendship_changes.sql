@@ -0,0 +1,11 @@
+-- Change log for the in-memory friend graph (app/friend_graph.py). Accepting
+-- or removing a friendship appends one row; workers replay rows after the
+-- last seq they applied instead of reloading every friendship.
+
+CREATE TABLE IF NOT EXISTS friendship_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id_1 INTEGER NOT NULL,
+    user_id_2 INTEGER NOT NULL,
+    is_friend INTEGER NOT NULL,
+    changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
@@ -0,0 +1,17 @@
+-- Precomputed "people you may know" lists, rebuilt in batches by
+-- `python manage.py refresh-suggestions`. reasons is a comma-separated list
+-- of the signals that matched (mutual_friends, major, campus, study_level,
+-- interests).
+
+CREATE TABLE IF NOT EXISTS friend_suggestions (
+    user_id INTEGER NOT NULL,
+    suggested_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    mutual_count INTEGER NOT NULL DEFAULT 0,
+    reasons TEXT NOT NULL DEFAULT '',
+    computed_at REAL NOT NULL,
+    PRIMARY KEY (user_id, suggested_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_friend_suggestions_rank
+    ON friend_suggestions(user_id, score DESC);
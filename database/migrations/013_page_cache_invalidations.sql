@@ -0,0 +1,10 @@
+-- Invalidation log for the anonymous page cache (app/page_cache.py). Writes
+-- in db_utils append the cache tags they touch (post:<id>, user:<id>, feed,
+-- hashtag:<tag>); each worker polls for rows after the last seq it has seen
+-- and evicts just the pages carrying those tags.
+
+CREATE TABLE IF NOT EXISTS page_cache_invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tag TEXT NOT NULL,
+    invalidated_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
@@ -0,0 +1,14 @@
+-- Per-user event log behind the Server-Sent Events stream (app/event_bus.py).
+-- create_notification and send_message append a row in their transaction;
+-- each worker polls for new ids and pushes them to its open streams. The id
+-- doubles as the SSE event id, so clients resume with Last-Event-ID.
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id, id);
@@ -0,0 +1,9 @@
+-- Indexes for plans flagged by benchmarks/check_query_plans.py:
+-- hashtag search scanned every post_hashtags row, and the notification
+-- list and saved posts were sorted in a temp B-tree on every page view.
+
+CREATE INDEX IF NOT EXISTS idx_post_hashtags_hashtag_post ON post_hashtags(hashtag_id, post_id);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_saved_posts_user_saved ON saved_posts(user_id, saved_at);
+
+ANALYZE;
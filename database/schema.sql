@@ -1,48 +1,129 @@
+-- Base schema for UIS-Connect. Create a database with `python init_db.py`,
+-- which runs this file and then database/migrations/*.sql (indexes,
+-- counters, timeline, search and cache tables are added there).
 
 -- Users Table
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
     major TEXT,
-    interests TEXT
+    interests TEXT,
+    bio TEXT,
+    study_level TEXT,
+    campus TEXT,
+    student_number TEXT UNIQUE,
+    profile_picture TEXT DEFAULT 'default.png',
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    last_login TEXT
+);
+
+-- User Settings Table
+CREATE TABLE IF NOT EXISTS user_settings (
+    user_id INTEGER PRIMARY KEY,
+    FOREIGN KEY(user_id) REFERENCES users(id)
 );
 
 -- Posts Table
-CREATE TABLE posts (
+CREATE TABLE IF NOT EXISTS posts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     content TEXT NOT NULL,
-    timestamp TEXT NOT NULL,
+    post_type TEXT DEFAULT 'general',
+    visibility TEXT DEFAULT 'public' CHECK (visibility IN ('public', 'friends', 'private')),
+    image_url TEXT,
+    is_pinned INTEGER NOT NULL DEFAULT 0,
+    timestamp TEXT NOT NULL DEFAULT (datetime('now')),
+    edited_at TEXT,
     FOREIGN KEY(user_id) REFERENCES users(id)
 );
 
 -- Comments Table
-CREATE TABLE comments (
+CREATE TABLE IF NOT EXISTS comments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     post_id INTEGER NOT NULL,
     user_id INTEGER NOT NULL,
+    parent_comment_id INTEGER,
     content TEXT NOT NULL,
-    timestamp TEXT NOT NULL,
-    FOREIGN KEY(post_id) REFERENCES posts(id),
-    FOREIGN KEY(user_id) REFERENCES users(id)
+    timestamp TEXT NOT NULL DEFAULT (datetime('now')),
+    edited_at TEXT,
+    FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE,
+    FOREIGN KEY(user_id) REFERENCES users(id),
+    FOREIGN KEY(parent_comment_id) REFERENCES comments(id)
 );
 
--- Likes Table
-CREATE TABLE likes (
+-- Likes Table (a like is on a post or on a comment)
+CREATE TABLE IF NOT EXISTS likes (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    post_id INTEGER NOT NULL,
+    post_id INTEGER,
+    comment_id INTEGER,
     user_id INTEGER NOT NULL,
-    timestamp TEXT NOT NULL,
-    FOREIGN KEY(post_id) REFERENCES posts(id),
+    timestamp TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE,
+    FOREIGN KEY(comment_id) REFERENCES comments(id) ON DELETE CASCADE,
     FOREIGN KEY(user_id) REFERENCES users(id)
 );
 
 -- Friendships Table
-CREATE TABLE friendships (
+CREATE TABLE IF NOT EXISTS friendships (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id_1 INTEGER NOT NULL,
     user_id_2 INTEGER NOT NULL,
-    status TEXT NOT NULL CHECK (status IN ('accepted', 'pending')),
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('accepted', 'pending', 'rejected')),
+    requested_at TEXT NOT NULL DEFAULT (datetime('now')),
+    responded_at TEXT,
     FOREIGN KEY(user_id_1) REFERENCES users(id),
     FOREIGN KEY(user_id_2) REFERENCES users(id)
 );
+
+-- Messages Table
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    is_read INTEGER NOT NULL DEFAULT 0,
+    timestamp TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY(sender_id) REFERENCES users(id),
+    FOREIGN KEY(receiver_id) REFERENCES users(id)
+);
+
+-- Notifications Table
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    notification_type TEXT,
+    related_id INTEGER,
+    is_read INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY(user_id) REFERENCES users(id)
+);
+
+-- Saved Posts Table
+CREATE TABLE IF NOT EXISTS saved_posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    saved_at TEXT NOT NULL DEFAULT (datetime('now')),
+    UNIQUE (user_id, post_id),
+    FOREIGN KEY(user_id) REFERENCES users(id),
+    FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE
+);
+
+-- Hashtags Tables
+CREATE TABLE IF NOT EXISTS hashtags (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tag TEXT NOT NULL UNIQUE,
+    use_count INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS post_hashtags (
+    post_id INTEGER NOT NULL,
+    hashtag_id INTEGER NOT NULL,
+    PRIMARY KEY (post_id, hashtag_id),
+    FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE,
+    FOREIGN KEY(hashtag_id) REFERENCES hashtags(id)
+);
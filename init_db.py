@@ -1,15 +1,22 @@
+import os
 import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from config import Config  # noqa: E402
+import migrations  # noqa: E402
+
+db_path = sys.argv[1] if len(sys.argv) > 1 else Config.DATABASE
 
 with open("database/schema.sql", "r") as schema_file:
     schema_sql = schema_file.read()
 
-with open("database/sample_data.sql", "r") as data_file:
-    data_sql = data_file.read()
-
-conn = sqlite3.connect("app/uis_connect.db")
+conn = sqlite3.connect(db_path)
 conn.executescript(schema_sql)
-conn.executescript(data_sql)
 conn.commit()
 conn.close()
 
-print("Database initialized ✅")
+migrations.apply_migrations(db_path)
+
+print(f"Database initialized at {db_path} ✅")
@@ -1,13 +1,12 @@
-import sqlite3
+import os
+import sys
 
-# Path to your SQLite DB
-conn = sqlite3.connect("app/uis_connect.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
 
-with open("database/sample_data.sql", "r") as f:
-    sql_script = f.read()
+from config import Config  # noqa: E402
+from insert_sample_data import insert_sample_data  # noqa: E402
 
-conn.executescript(sql_script)
-conn.commit()
-conn.close()
+db_path = sys.argv[1] if len(sys.argv) > 1 else Config.DATABASE
+insert_sample_data(db_path)
 
-print("Sample data loaded into uis_connect.db ✅")
+print(f"Sample data loaded into {db_path} ✅")
@@ -0,0 +1,93 @@
+"""Maintenance commands for UIS-Connect.
+
+    python manage.py migrate            # apply pending database migrations
+    python manage.py reconcile-counters # repair like/comment/unread counter drift
+    python manage.py rebuild-search     # rebuild the full-text search indexes
+    python manage.py refresh-trending   # recompute trending hashtags (run from cron)
+    python manage.py reindex-hashtags   # rebuild hashtags from existing post content
+    python manage.py refresh-suggestions # recompute "people you may know" (run from cron)
+    python manage.py generate-thumbnails # build missing image variants for uploads
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from config import Config  # noqa: E402
+import migrations  # noqa: E402
+import db_utils as db  # noqa: E402
+import media  # noqa: E402
+
+
+def cmd_migrate(args):
+    applied = migrations.apply_migrations(args.db)
+    for version, name in applied:
+        print(f"Applied {version:03d}_{name}")
+    if not applied:
+        print("Database is up to date")
+
+
+def cmd_reconcile_counters(args):
+    fixed = db.reconcile_counters(args.db)
+    print(f"Repaired counters on {fixed['posts']} posts, {fixed['comments']} comments "
+          f"and {fixed['users']} users")
+
+
+def cmd_rebuild_search(args):
+    db.rebuild_search_index(args.db)
+    print("Rebuilt full-text search indexes")
+
+
+def cmd_refresh_trending(args):
+    db.refresh_trending_hashtags(args.db)
+    for window in Config.TRENDING_WINDOWS:
+        tags = db.get_trending_hashtags(args.db, limit=5, window=window)
+        print(f"{window:>4}: " + ', '.join(f"#{t['tag']} ({t['score']:.1f})" for t in tags))
+
+
+def cmd_reindex_hashtags(args):
+    posts, links = db.reindex_hashtags(args.db)
+    db.refresh_trending_hashtags(args.db)
+    print(f"Re-indexed {posts} posts, {links} hashtag links")
+
+
+def cmd_refresh_suggestions(args):
+    started = time.perf_counter()
+    users = db.refresh_friend_suggestions(args.db, top_k=args.top_k)
+    print(f"Scored suggestions for {users} users in {time.perf_counter() - started:.1f}s")
+
+
+def cmd_generate_thumbnails(args):
+    written = media.generate_missing_variants(Config.UPLOAD_FOLDER)
+    print(f"Wrote {written} image variants")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UIS-Connect maintenance commands")
+    parser.add_argument('--db', default=Config.DATABASE, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('migrate', help="apply pending database migrations").set_defaults(func=cmd_migrate)
+    commands.add_parser('reconcile-counters', help="recompute like/comment/unread counters") \
+        .set_defaults(func=cmd_reconcile_counters)
+    commands.add_parser('rebuild-search', help="rebuild the full-text search indexes") \
+        .set_defaults(func=cmd_rebuild_search)
+    commands.add_parser('refresh-trending', help="recompute trending hashtags") \
+        .set_defaults(func=cmd_refresh_trending)
+    commands.add_parser('reindex-hashtags', help="rebuild hashtags from post content") \
+        .set_defaults(func=cmd_reindex_hashtags)
+    suggestions = commands.add_parser('refresh-suggestions', help="recompute friend suggestions")
+    suggestions.add_argument('--top-k', type=int, default=Config.SUGGESTIONS_PER_USER,
+                             help="suggestions kept per user")
+    suggestions.set_defaults(func=cmd_refresh_suggestions)
+    commands.add_parser('generate-thumbnails', help="build missing image variants for uploads") \
+        .set_defaults(func=cmd_generate_thumbnails)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()